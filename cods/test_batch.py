@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Prueba de corridas simultáneas de run_batch: tres corridas WRF a la vez (en memoria y paso
+# a paso), cada una en su proceso y todas agregando al mismo archivo de corridas. Los
+# productos de ambos modos deben ser iguales y ninguna corrida debe fallar.
+#   python cods/test_batch.py        (o pytest cods/test_batch.py)
+# Necesita la corrida de ejemplo en data/; las pruebas sin datos reales (grillas regular_ll,
+# escritura solapada, manifiesto) están en test_synthetic.py.
+import os
+import tempfile
+import xarray as xr
+from SMN_tools.batch import run_batch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+r0 = os.path.join(BASE_DIR, "../data")
+os.environ.setdefault("GRIB_INDEX_DIR", os.path.join(BASE_DIR, "../cfgrib_cache"))
+os.environ.setdefault("SMN_CATALOG", "0")
+
+CONFIG = {
+    'WRF_A': {'ruta': f'{r0}/PERU_WRF22', 'nombre': 'PERU_WRF22', 'extractor': 'WRF', 'workers': 1,
+              'horas': ['06'], 'salida': 'A/{fecha}{hh}'},
+    'WRF_B': {'ruta': f'{r0}/PERU_WRF22', 'nombre': 'PERU_WRF22', 'extractor': 'WRF', 'workers': 1,
+              'horas': ['06'], 'salida': 'B/{fecha}{hh}', 'streaming': True},
+    'WRF_C': {'ruta': f'{r0}/PERU_WRF22', 'nombre': 'PERU_WRF22', 'extractor': 'WRF', 'workers': 1,
+              'horas': ['06'], 'salida': 'C/{fecha}{hh}', 'streaming': True},
+}
+
+def test_batch_simultaneo():
+    os.makedirs(os.environ["GRIB_INDEX_DIR"], exist_ok=True)
+    out = tempfile.mkdtemp(prefix="test_batch_")
+    resultados = run_batch(list(CONFIG), "20250101", "20250101", out, config=CONFIG, cpu=3,
+                           mem_mb=None, reprocess=True, archive=os.path.join(out, "archivo"))
+    fallas = {k: v for k, v in resultados.items() if isinstance(v, str)}
+    assert len(resultados) == len(CONFIG) and not fallas, f"corridas con error: {fallas or resultados}"
+    for producto in ("prs", "sfc"):
+        a = xr.open_dataset(resultados[('WRF_A', '2025010106')][producto])
+        for dominio in ('WRF_B', 'WRF_C'):
+            b = xr.open_dataset(resultados[(dominio, '2025010106')][producto])
+            xr.testing.assert_allclose(a, b)
+        print(producto, "WRF en memoria = paso a paso")
+    print("OK", out)
+
+if __name__ == "__main__":   # spawn: los procesos de las corridas importan este módulo
+    test_batch_simultaneo()
@@ -23,6 +23,9 @@ setup(
         "matplotlib>=3.7.0",
         "pillow>=9.0.0",
     ],
+    extras_require={
+        "zarr": ["zarr>=2.16"],
+    },
 
 )
 entry_points={
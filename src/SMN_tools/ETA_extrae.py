@@ -5,21 +5,60 @@ import pandas as pd
 import re
 import netCDF4 as nc
 import numpy as np
-import xarray as xr
 import os
+from .grib_scan import grib_opener
+from .regions import crop
+from .profiling import profiled, stage
+from .stages import Writer, write_netcdf
 
-def extrac_ETA(out_path, gribfile, tipo):
+# filtros GRIB por variable de salida (nombre del archivo NetCDF)
+FILTROS_ETA = {
+    'tp':      {'typeOfLevel': 'surface', 'shortName': 'tp'},
+    'u':       {'typeOfLevel': 'isobaricInhPa', 'shortName': 'u'},
+    'v':       {'typeOfLevel': 'isobaricInhPa', 'shortName': 'v'},
+    'prmsl':   {'typeOfLevel': 'meanSea', 'shortName': 'mslet'},
+    'wind10m': {'typeOfLevel': 'heightAboveGround', 'level': 10, 'stepType': 'instant'},
+    't2m':     {'typeOfLevel': 'heightAboveGround', 'level': 2, 'shortName': '2t'},
+    'r2m':     {'typeOfLevel': 'heightAboveGround', 'level': 2, 'shortName': '2r'},
+    'ssrd':    {'typeOfLevel': 'surface', 'stepType': 'avg','shortName':'avg_sdswrf'},
+}
+# filtros que usa cada tipo
+TIPOS_ETA = {
+    'tp': ['tp'], 'level_vars': ['u', 'v'], 'prmsl': ['prmsl'], 'wind10m': ['wind10m'],
+    't2m': ['t2m'], 'r2m': ['r2m'], 'ssrd': ['ssrd'],
+}
+
+@profiled("extract", archivo="gribfile")
+def extrac_ETA(out_path, gribfile, tipo, single_pass=True, region=None, writer=None):
     """
     Extrae variables atmosféricas de un archivo GRIB generado por ETA.
     Variables: precipitación, T2m, HR2m, vientos 10m, vientos en niveles,
                radiación SWdown, presión reducida al nivel del mar.
     Parámetros:
-    out_path : str   Carpeta de salida
+    out_path : str   Carpeta de salida (None: no escribe y retorna los datasets en memoria)
     gribfile : str   Archivo GRIB (ejemplo: 'latlon_000')
     tipo     : list  Variables a extraer ['pr', 'level_wind', 'mslp', 'wind10m', 't2m', 'r2m', 'ssrd']
+    single_pass : bool  Recorre el GRIB una sola vez para todas las variables (default: True)
+    region   : str | tuple  Recorta a una región (regions.REGIONES) o bbox (lon_min, lat_min, lon_max, lat_max)
+    writer   : stages.Writer  Escritor compartido: las escrituras quedan encoladas y la función retorna
+                              sin esperarlas (estarán hechas tras writer.close(); sus errores, en los
+                              Future de writer.submit: ver run_driver)
     Retorna:
-    Archivos NetCDF guardados en la carpeta de salida
+    list con los NetCDF guardados en la carpeta de salida (escritos a un temporal y renombrados), o
+    dict {variable: xr.Dataset} en memoria cuando out_path es None
     """
+    if out_path is None or writer is not None:
+        return _extrac_ETA(out_path, gribfile, tipo, single_pass, region, writer)
+    # la compresión y escritura de cada variable (hilo escritor) se solapa con la
+    # decodificación de la siguiente; al salir del with están todos los NetCDF escritos
+    with Writer() as escritor, escritor.group() as tareas:
+        salida = _extrac_ETA(out_path, gribfile, tipo, single_pass, region, escritor)
+    for tarea in tareas:   # un NetCDF que no se pudo escribir: error de este paso
+        tarea.result()
+    return salida
+
+def _extrac_ETA(out_path, gribfile, tipo, single_pass=True, region=None, escritor=None):
+    # cuerpo de extrac_ETA: con escritor, guarda() decodifica en este hilo y encola la escritura
     hfp = gribfile[-3:]  # hora file pronóstico
     # --- extraer hora de corrida desde el path ---
     base = os.path.basename(os.path.dirname(gribfile))  # '2025010106'
@@ -31,71 +70,71 @@ def extrac_ETA(out_path, gribfile, tipo):
     lead_hours = int(m.group(1)) if m else 0
     valid_time = init_time + pd.to_timedelta(lead_hours, unit="h")
 
+    # --- una sola lectura del GRIB para todas las variables pedidas ---
+    nombres = [n for t in tipo for n in TIPOS_ETA.get(t, [])]
+    abre_grib = grib_opener(gribfile, {n: FILTROS_ETA[n] for n in nombres}, single_pass)
+    def abre(nombre, **kwargs):
+        # recorte a la región antes de leer los datos (índices en caché por grilla)
+        return crop(abre_grib(nombre, **kwargs), region)
+
+    salida, escritos = {}, []
+    def guarda(ds, var):
+        # NetCDF por variable y paso, o dataset en memoria si out_path es None
+        # los mensajes GRIB se decodifican al cargar (cfgrib es lazy)
+        with stage("decode", variable=var):
+            ds = ds.load()
+        if out_path is None: salida[var] = ds
+        else:
+            path = f"{out_path}/{var}_{hfp}.nc"
+            escritor.submit(write_netcdf, ds, path)   # hilo escritor: comprime y escribe
+            escritos.append(path)
+
     if 'tp' in tipo:   # Precipitación
-        ds = xr.open_dataset(
-            gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'typeOfLevel': 'surface', 'shortName': 'tp'}, 'indexpath': ''},
-            decode_timedelta=False)
+        ds = abre('tp', decode_timedelta=False)
         ds = ds.expand_dims(time=[valid_time])
         ds['tp'].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/tp_{hfp}.nc")
+        guarda(ds, 'tp')
 
     if 'level_vars' in tipo:   # Viento en niveles isobáricos
         niveles_deseados = [925, 850, 500, 200]
-        for var in ['u', 'v']: #agregar aqui nuevas variables en niveles
-            ds = xr.open_dataset(
-                gribfile, engine="cfgrib",
-                backend_kwargs={'filter_by_keys': {'typeOfLevel': 'isobaricInhPa', 'shortName': var}, 'indexpath': ''},
-                decode_timedelta=False            )
+        for var in TIPOS_ETA['level_vars']: #agregar aqui nuevas variables en niveles
+            ds = abre(var, decode_timedelta=False)
             ds = ds.expand_dims(time=[valid_time])
-            ds.sel(isobaricInhPa=niveles_deseados, method='nearest').to_netcdf(f"{out_path}/{var}_{hfp}.nc")
+            guarda(ds.sel(isobaricInhPa=niveles_deseados, method='nearest'), var)
 
     if 'prmsl' in tipo:   # Presión al nivel del mar
-        ds = xr.open_dataset(
-            gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'typeOfLevel': 'meanSea', 'shortName': 'mslet'}, 'indexpath': ''},
-            decode_timedelta=False        )
+        ds = abre('prmsl', decode_timedelta=False)
         ds = ds.expand_dims(time=[valid_time])
         ds['mslet'].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/prmsl_{hfp}.nc")
+        guarda(ds, 'prmsl')
 
     if 'wind10m' in tipo:   # Viento 10m
         for var in ['u', 'v']:
-            ds = xr.open_dataset( gribfile, engine="cfgrib",
-                    backend_kwargs={'filter_by_keys': {'typeOfLevel': 'heightAboveGround', 'level': 10, 'stepType': 'instant' },
-                        'indexpath': ''}, decode_timedelta=False)
+            ds = abre('wind10m', decode_timedelta=False)
             ds = ds[['%s10'%var]].expand_dims(time=[valid_time])
             ds['%s10'%var].attrs['GRIB_typeOfLevel'] = 'surface'
             #print(ds)
-            ds.to_netcdf(f"{out_path}/{var}10_{hfp}.nc")
+            guarda(ds, '%s10'%var)
 
     if 't2m' in tipo:   # Temperatura 2m
-        ds = xr.open_dataset(
-            gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'typeOfLevel': 'heightAboveGround', 'level': 2, 'shortName': '2t'}, 'indexpath': ''},
-            decode_timedelta=False        )
+        ds = abre('t2m', decode_timedelta=False)
         ds = ds.expand_dims(time=[valid_time])
         ds['t2m'].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/t2m_{hfp}.nc")
+        guarda(ds, 't2m')
 
 
     if 'r2m' in tipo:   # Humedad relativa 2m
-        ds = xr.open_dataset(
-            gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'typeOfLevel': 'heightAboveGround', 'level': 2, 'shortName': '2r'}, 'indexpath': ''},
-            decode_timedelta=False        )
+        ds = abre('r2m', decode_timedelta=False)
         ds = ds.expand_dims(time=[valid_time])
         ds['r2'].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/r2m_{hfp}.nc")
+        guarda(ds, 'r2m')
         
     if 'ssrd' in tipo: # Radiación onda corta (downward shortwave) media
-        ds = xr.open_dataset(
-            gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'typeOfLevel': 'surface', 'stepType': 'avg','shortName':'avg_sdswrf'}, 'indexpath': ''},
-            decode_times=False)
+        ds = abre('ssrd', decode_times=False)
         ds = ds.expand_dims(time=[valid_time])
         ds['avg_sdswrf'].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/ssrd_{hfp}.nc")
+        guarda(ds, 'ssrd')
 
     if len(tipo)==0:  print(f"Tipo '{tipo}' no reconocido")
-
+    if out_path is None: return salida
+    return escritos
@@ -6,9 +6,16 @@ import re
 import pandas as pd
 import numpy as np
 import xarray as xr
+from .grib_scan import grib_opener
+from .grid_geometry import grid_keys, get_geometry, as_grid
+from .regions import region_slices
+from .profiling import profiled, stage
+from .stages import Writer, write_netcdf
 
 #
-def make_structured(dataset, var_name, coord_lat='latitude', coord_lon='longitude', coord_z=None):
+@profiled("make_structured")
+def make_structured(dataset, var_name, coord_lat='latitude', coord_lon='longitude', coord_z=None, grid=None,
+                    region=None):
     """
     Reorganiza un dataset para que las coordenadas de latitud y longitud sean únicas. 
     Si la variable contiene una dimensión vertical (e.g., presión), la reorganiza en 3D (z, lat, lon). 
@@ -21,18 +28,35 @@ def make_structured(dataset, var_name, coord_lat='latitude', coord_lon='longitud
     coord_lat : str, opcional        Nombre de la coordenada de latitud (default: 'latitude').
     coord_lon : str, opcional        Nombre de la coordenada de longitud (default: 'longitude').
     coord_z : str, opcional        Nombre de la coordenada vertical (e.g., presión).
+    grid : tuple, opcional        Huella de grilla GRIB (grid_geometry.grid_keys). Si se da, la geometría
+                                  se toma de la caché del dominio y el campo se reorganiza como vista
+                                  (sin np.unique ni copia), validando la orientación según el scan mode.
+                                  Se ignora si latitud y longitud ya son dimensiones 1D (regular_ll).
+    region : str | tuple, opcional    Región (regions.REGIONES) o bbox (lon_min, lat_min, lon_max, lat_max):
+                                  sólo se copia la ventana de la región.
     -------
     Retorna:    
     xr.Dataset        Dataset reorganizado con coordenadas únicas de latitud y longitud. 
                       En 3D si hay un eje z, en 2D si no.
     """
 
+    # regular_ll: cfgrib ya entrega latitud y longitud como dimensiones (1D); no hace falta la
+    # geometría en caché, sólo ordenarlas de forma creciente (de norte a sur -> de sur a norte)
+    if dataset[coord_lat].dims == (coord_lat,) and dataset[coord_lon].dims == (coord_lon,):
+        grid = None
+        dataset = dataset.sortby([coord_lat, coord_lon])
+
     # Coordenadas únicas
-    lat_unicas = np.unique(dataset[coord_lat].values)
-    lon_unicas = np.unique(dataset[coord_lon].values)
+    if grid is None:
+        lat_unicas = np.unique(dataset[coord_lat].values)
+        lon_unicas = np.unique(dataset[coord_lon].values)
+    else:
+        geo = get_geometry(grid, dataset[coord_lat].values, dataset[coord_lon].values)
+        lat_unicas, lon_unicas = geo['lat'], geo['lon']
 
-    # Extraer datos base
-    var = dataset[var_name].values
+    # Extraer datos base (aquí se decodifican los mensajes GRIB)
+    with stage("decode", variable=var_name):
+        var = dataset[var_name].values
     coords = {coord_lat: lat_unicas, coord_lon: lon_unicas}
 
     # Determinar forma esperada y dimensiones
@@ -45,7 +69,13 @@ def make_structured(dataset, var_name, coord_lat='latitude', coord_lon='longitud
         shape = (len(lat_unicas), len(lon_unicas))
 
     # Reorganizar variable
-    var_reshaped = var.reshape(shape)
+    if grid is None: var_reshaped = var.reshape(shape)
+    else: var_reshaped = as_grid(var.reshape(shape[:-2] + (-1,)), geo)  # vista, sin copia
+    # Recortar a la región (índices en caché por grilla); sólo se copia la ventana
+    if region is not None:
+        s_lat, s_lon = region_slices(lat_unicas, lon_unicas, region)
+        var_reshaped = np.ascontiguousarray(var_reshaped[..., s_lat, s_lon])
+        coords[coord_lat], coords[coord_lon] = lat_unicas[s_lat], lon_unicas[s_lon]
     # Construir nuevo dataset
     nuevo_dataset = xr.Dataset({var_name: (dims, var_reshaped)}, coords=coords)
     # Mantener coordenadas de tiempo si existen
@@ -54,8 +84,27 @@ def make_structured(dataset, var_name, coord_lat='latitude', coord_lon='longitud
             nuevo_dataset = nuevo_dataset.assign_coords({t_coord: dataset[t_coord].values})
     return nuevo_dataset
 
+# filtros GRIB por variable de salida (nombre del archivo NetCDF)
+FILTROS_WRF = {
+    'tp':    {'shortName':'tp','typeOfLevel':'surface'},
+    'u':     {'shortName':'u','typeOfLevel':'isobaricInhPa'},
+    'v':     {'shortName':'v','typeOfLevel':'isobaricInhPa'},
+    'prmsl': {'shortName':'mslet','typeOfLevel':'meanSea'},
+    'u10':   {'shortName':'10u','typeOfLevel':'heightAboveGround','level':10},
+    'v10':   {'shortName':'10v','typeOfLevel':'heightAboveGround','level':10},
+    't2m':   {'shortName':'2t','typeOfLevel':'heightAboveGround','level':2},
+    'd2m':   {'shortName':'2d','typeOfLevel':'heightAboveGround','level':2},
+    'r2m':   {'shortName':'2r','typeOfLevel':'heightAboveGround','level':2},
+}
+# variables de salida que genera cada tipo
+TIPOS_WRF = {
+    'tp': ['tp'], 'level_vars': ['u','v'], 'prmsl': ['prmsl'], 'wind10m': ['u10','v10'],
+    't2m': ['t2m'], 'd2m': ['d2m'], 'r2m': ['r2m'],
+}
+
 #
-def extrac_WRF(out_path, gribfile, tipo):
+@profiled("extract", archivo="gribfile")
+def extrac_WRF(out_path, gribfile, tipo, single_pass=True, region=None, writer=None):
     """
     Extrae variables atmosféricas de un archivo GRIB generado por WR.
     Variables disponibles:
@@ -71,10 +120,31 @@ def extrac_WRF(out_path, gribfile, tipo):
       - 'r2m'         : humedad relativa a 2 m
     -----------
     Parámetros:
-    out_path : str        Carpeta de salida
+    out_path : str        Carpeta de salida. Si es None no se escribe nada y se retornan los datasets.
     gribfile : str        Archivo GRIB (ejemplo: 'WRFPRS_d01.00')
     tipo : list        Variables a extraer. Ejemplo: ['pr','wind10m','t2m']
+    single_pass : bool    Recorre el GRIB una sola vez para todas las variables (default: True)
+    region : str | tuple  Recorta a una región (regions.REGIONES) o bbox (lon_min, lat_min, lon_max, lat_max)
+    writer : stages.Writer  Escritor compartido: las escrituras quedan encoladas y la función retorna sin
+                          esperarlas (estarán hechas tras writer.close(); sus errores, en los Future
+                          de writer.submit: ver run_driver).
+    -------
+    Retorna:
+    dict        {variable: xr.Dataset} en memoria cuando out_path es None (ej. {'tp': ds, 'u10': ds}),
+                o list con los NetCDF escritos en out_path (cada uno se escribe a un temporal y se renombra).
     """
+    if out_path is None or writer is not None:
+        return _extrac_WRF(out_path, gribfile, tipo, single_pass, region, writer)
+    # la compresión y escritura de cada variable (hilo escritor) se solapa con la
+    # decodificación de la siguiente; al salir del with están todos los NetCDF escritos
+    with Writer() as escritor, escritor.group() as tareas:
+        salida = _extrac_WRF(out_path, gribfile, tipo, single_pass, region, escritor)
+    for tarea in tareas:   # un NetCDF que no se pudo escribir: error de este paso
+        tarea.result()
+    return salida
+
+def _extrac_WRF(out_path, gribfile, tipo, single_pass=True, region=None, escritor=None):
+    # cuerpo de extrac_WRF: con escritor, guarda() decodifica en este hilo y encola la escritura
 
     hfp0 = gribfile.split('.')[-1]  # último par de dígitos como paso (ej: 00, 06, 12)
     hfp = '%03d'%int(hfp0) 
@@ -86,76 +156,79 @@ def extrac_WRF(out_path, gribfile, tipo):
     lead_hours = int(m.group(1)) if m else 0
     valid_time = init_time + pd.to_timedelta(lead_hours, unit="h") if init_time else None
 
+    # --- una sola lectura del GRIB para todas las variables pedidas ---
+    nombres = [n for t in tipo for n in TIPOS_WRF.get(t, [])]
+    abre = grib_opener(gribfile, {n: FILTROS_WRF[n] for n in nombres}, single_pass)
+    grid = grid_keys(gribfile)  # geometría del dominio (en caché tras el primer campo)
+
+    salida, escritos = {}, []
+    def guarda(ds, var):
+        # NetCDF por variable y paso, o dataset en memoria si out_path es None
+        if out_path is None: salida[var] = ds.load()
+        else:
+            path = f"{out_path}/{var}_{hfp}.nc"
+            # se carga aquí (ecCodes) y el escritor sólo comprime y escribe
+            escritor.submit(write_netcdf, ds.load(), path)
+            escritos.append(path)
+
     # --- Precipitación acumulada ---
     if 'tp' in tipo:
-        ds = xr.open_dataset(gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'shortName':'tp','typeOfLevel':'surface'}, 'indexpath': ''},
-            decode_timedelta=False)
+        ds = abre('tp', decode_timedelta=False)
         if valid_time is not None: ds = ds.expand_dims(time=[valid_time])
-        ds = make_structured(ds, var_name=list(ds.data_vars)[0])
+        ds = make_structured(ds, var_name=list(ds.data_vars)[0], grid=grid, region=region)
         ds['tp'].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/tp_{hfp}.nc")
+        guarda(ds, 'tp')
 
     # --- Variables en niveles ---
     if 'level_vars' in tipo:
         niveles_deseados = [925, 850, 500, 200]
-        for var in ['u','v']: #agregar aqui en caso nuevas variavles de niveles ['u','v','t','r','gh']
-            ds = xr.open_dataset(gribfile, engine="cfgrib",
-                backend_kwargs={'filter_by_keys': {'shortName': var, 'typeOfLevel':'isobaricInhPa'}, 'indexpath': ''},
-                decode_timedelta=False)
+        for var in TIPOS_WRF['level_vars']: #agregar aqui en caso nuevas variavles de niveles ['u','v','t','r','gh']
+            ds = abre(var, decode_timedelta=False)
             if valid_time is not None: ds = ds.expand_dims(time=[valid_time])
-            ds = make_structured(ds, var_name=list(ds.data_vars)[0], coord_z='isobaricInhPa')            
-            ds.sel(isobaricInhPa=niveles_deseados, method='nearest').to_netcdf(f"{out_path}/{var}_{hfp}.nc")
+            ds = make_structured(ds, var_name=list(ds.data_vars)[0], coord_z='isobaricInhPa', grid=grid, region=region)            
+            guarda(ds.sel(isobaricInhPa=niveles_deseados, method='nearest'), var)
 
     # --- MSLP ---
     if 'prmsl' in tipo:
-        ds = xr.open_dataset(gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'shortName':'mslet','typeOfLevel':'meanSea'}, 'indexpath': ''},
-            decode_timedelta=False)
+        ds = abre('prmsl', decode_timedelta=False)
         if valid_time is not None: ds = ds.expand_dims(time=[valid_time])
-        ds = make_structured(ds, var_name=list(ds.data_vars)[0])
+        ds = make_structured(ds, var_name=list(ds.data_vars)[0], grid=grid, region=region)
         ds[list(ds.data_vars)[0]].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/prmsl_{hfp}.nc")
+        guarda(ds, 'prmsl')
 
     # --- Viento 10m ---
     if 'wind10m' in tipo:
         for var in ['u','v']:
-            ds = xr.open_dataset(gribfile, engine="cfgrib",
-                backend_kwargs={'filter_by_keys': {'shortName': '10%s'%var, 'typeOfLevel':'heightAboveGround','level':10}, 'indexpath': ''},
-                decode_timedelta=False)
+            ds = abre('%s10'%var, decode_timedelta=False)
             if valid_time is not None: ds = ds.expand_dims(time=[valid_time])
-            ds = make_structured(ds, var_name=list(ds.data_vars)[0])
+            ds = make_structured(ds, var_name=list(ds.data_vars)[0], grid=grid, region=region)
             ds[list(ds.data_vars)[0]].attrs['GRIB_typeOfLevel'] = 'surface'
-            ds.to_netcdf(f"{out_path}/{var}10_{hfp}.nc")
+            guarda(ds, '%s10'%var)
 
     # --- Temperatura 2m ---
     if 't2m' in tipo:
-        ds = xr.open_dataset(gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'shortName':'2t','typeOfLevel':'heightAboveGround','level':2}, 'indexpath': ''},
-            decode_timedelta=False)
+        ds = abre('t2m', decode_timedelta=False)
         if valid_time is not None: ds = ds.expand_dims(time=[valid_time])
-        ds = make_structured(ds, var_name=list(ds.data_vars)[0])
+        ds = make_structured(ds, var_name=list(ds.data_vars)[0], grid=grid, region=region)
         ds[list(ds.data_vars)[0]].attrs['GRIB_typeOfLevel'] = 'surface'
-        ds.to_netcdf(f"{out_path}/t2m_{hfp}.nc")
+        guarda(ds, 't2m')
 
     # --- Dew Point 2m ---
     if 'd2m' in tipo:
-        ds = xr.open_dataset(gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'shortName':'2d','typeOfLevel':'heightAboveGround','level':2}, 'indexpath': ''},
-            decode_timedelta=False)
+        ds = abre('d2m', decode_timedelta=False)
         if valid_time is not None: ds = ds.expand_dims(time=[valid_time])
-        ds = make_structured(ds, var_name=list(ds.data_vars)[0])
+        ds = make_structured(ds, var_name=list(ds.data_vars)[0], grid=grid, region=region)
         ds[list(ds.data_vars)[0]].attrs['GRIB_typeOfLevel'] = 'surface'     
-        ds.to_netcdf(f"{out_path}/d2m_{hfp}.nc")
+        guarda(ds, 'd2m')
 
     # --- Humedad relativa 2m ---
     if 'r2m' in tipo:
-        ds = xr.open_dataset(gribfile, engine="cfgrib",
-            backend_kwargs={'filter_by_keys': {'shortName':'2r','typeOfLevel':'heightAboveGround','level':2}, 'indexpath': ''},
-            decode_timedelta=False)
+        ds = abre('r2m', decode_timedelta=False)
         if valid_time is not None: ds = ds.expand_dims(time=[valid_time])
-        ds = make_structured(ds, var_name=list(ds.data_vars)[0])
+        ds = make_structured(ds, var_name=list(ds.data_vars)[0], grid=grid, region=region)
         ds[list(ds.data_vars)[0]].attrs['GRIB_typeOfLevel'] = 'surface'     
-        ds.to_netcdf(f"{out_path}/r2m_{hfp}.nc")
+        guarda(ds, 'r2m')
 
     if len(tipo)==0: print(f"Tipo '{tipo}' no reconocido")
+    if out_path is None: return salida
+    return escritos
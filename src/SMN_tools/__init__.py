@@ -1,20 +1,68 @@
-from .ETA_extrae import extrac_ETA
-from .WRF_extrae import extrac_WRF
-from .procesa_netcdf import process_netcdf_files
-from .rename_clean import rename_and_clean
-from .merge_netcdf import merge_files
-from .delete_files import clean_outdir
-from .make_paleta import get_cmap_norm
-from .make_paleta import get_contour
+import importlib
+
+# funciones públicas -> submódulo que las define. Los submódulos se importan recién al
+# usar la función (PEP 562): `import SMN_tools` no carga xarray, cfgrib ni matplotlib,
+# así que el cliente del servidor (ver server.py) y la ayuda de la CLI arrancan rápido.
+_SUBMODULOS = {
+    "extrac_ETA": "ETA_extrae",
+    "extrac_WRF": "WRF_extrae",
+    "scan_grib": "grib_scan",
+    "process_netcdf_files": "procesa_netcdf",
+    "rename_and_clean": "rename_clean",
+    "merge_files": "merge_netcdf",
+    "clean_outdir": "delete_files",
+    "run_extraction": "run_driver",
+    "run_pipeline": "pipeline",
+    "watch_run": "watcher",
+    "extract_stations": "stations",
+    "get_cmap_norm": "make_paleta",
+    "get_contour": "make_paleta",
+    "render_run": "render",
+    "run_batch": "batch",
+    "serve": "server",
+    "submit": "server",
+    "find_products": "catalog",
+    "open_products": "catalog",
+    "product_checksum": "catalog",
+    "append_run": "archive",
+    "open_archive": "archive",
+    "domain_stats": "domain_stats",
+    "regrid": "regrid",
+}
 __all__ = [
     "extrac_ETA",
     "extrac_WRF",
+    "scan_grib",
     "process_netcdf_files",
     "rename_and_clean",
     "merge_files",
     "clean_outdir",
+    "run_extraction",
+    "run_pipeline",
+    "watch_run",
+    "extract_stations",
     "get_cmap_norm",
     "get_contour",
+    "render_run",
+    "run_batch",
+    "serve",
+    "submit",
+    "find_products",
+    "open_products",
+    "product_checksum",
+    "append_run",
+    "open_archive",
+    "domain_stats",
+    "regrid",
     # "reorganizar_dataset",
 ]
 
+def __getattr__(name):
+    if name in _SUBMODULOS:
+        valor = getattr(importlib.import_module(f".{_SUBMODULOS[name]}", __name__), name)
+        globals()[name] = valor
+        return valor
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,24 +1,517 @@
 # __main__.py
 #### EJEMPLO DE EJECCUCION
 # python -m SMN_tools --modelo WRF --gribfile WRFPRS_d01.00 --out ./salida --tipo pr wind10m
- 
+# python -m SMN_tools --modelo WRF --gribfile WRFPRS_d01.00 --out ./salida --tipo t2m --region lima
+# python -m SMN_tools run --modelo PERU_WRF22 --fecha 20250101 --hora 06 --out ./salida --workers 8
+# python -m SMN_tools pipeline --modelo PERU_WRF22 --fecha 20250101 --hora 06 --out ./out/06Z
+# python -m SMN_tools pipeline --modelo PERU_WRF22 --fecha 20250101 --hora 06 --out ./out/06Z --backend zarr
+# python -m SMN_tools pipeline --modelo PERU_WRF22 --fecha 20250101 --hora 06 --out ./out/06Z --derivadas ws10 wd10 tp_int
+# python -m SMN_tools watch --modelo PERU_WRF22 --fecha 20250101 --hora 06 --out ./out/06Z --pasos 25
+# python -m SMN_tools perfiles ./out/06Z/PERU_WRF22_2025010106_sfc.nc
+# python -m SMN_tools estaciones --producto ./out/06Z/PERU_WRF22_2025010106_sfc.nc --estaciones est.csv --out series.csv
+# python -m SMN_tools mapas --producto ./out/06Z/PERU_WRF22_2025010106_sfc.nc --out ./figuras --workers 8
+# python -m SMN_tools batch --dominio WRF22 ETA22 --inicio 20250101 --fin 20250131 --horas 00 12 --out ./out --cpu 32
+# python -m SMN_tools pipeline --modelo PERU_WRF22 --fecha 20250101 --hora 06 --out ./out/06Z --profile perfil.jsonl
+# python -m SMN_tools mediciones perfil.jsonl
+# python -m SMN_tools serve --workers 4 &
+# python -m SMN_tools cliente extract --modelo WRF --gribfile WRFPRS_d01.00 --out ./salida --tipo t2m wind10m
+# python -m SMN_tools catalogo --modelo PERU_WRF22 --variable tp --valido 2025-01-01T12
+# python -m SMN_tools estadisticos ./out/06Z/PERU_WRF22_2025010106_sfc.nc --umbral tp=1,10,50 --csv dominio.csv
+# python -m SMN_tools regrid ./out/06Z/PERU_WRF22_2025010106_sfc.nc --destino ./out/06Z/PERU_ETA22_2025010106_sfc.nc --out wrf_en_eta.nc
+# python -m SMN_tools archivar --archivo ./archivo ./out/*/PERU_WRF22_*_sfc.nc
+# python -m SMN_tools sintetico --modelo WRF --nx 400 --ny 500 --out ./sinteticos
+# python -m SMN_tools bench --resultados bench.jsonl --tamanos chico mediano
+# python -m SMN_tools bench --resultados bench.jsonl --comparar v0.1.0 v0.2.0
+
 ##############################################
+import os
+import sys
 import argparse
-from . import extrac_ETA, extrac_WRF
 
-def main():
+def _agrega_profile(parser):
+    parser.add_argument("--profile", default=None, metavar="ARCHIVO",
+                        help="mediciones por etapa en JSON lines ('-': stderr; ver profiling.py y $SMN_PROFILE)")
+
+def _agrega_incremental(parser):
+    parser.add_argument("--completo", action="store_true",
+                        help="rehace todo aunque el manifiesto de la salida indique que está vigente")
+    parser.add_argument("--hash", action="store_true",
+                        help="compara los GRIB por contenido (sha1) y no por tamaño/mtime ($SMN_MANIFEST_HASH)")
+
+def _agrega_archivo(parser):
+    parser.add_argument("--archivo", default=None, metavar="CARPETA",
+                        help="agrega cada corrida terminada al archivo de corridas {modelo}_{prs|sfc}.nc "
+                             "de la carpeta (init_time x lead_time; ver archive.py)")
+
+def _activa_profile(args):
+    if args.profile:
+        from .profiling import enable
+        enable(args.profile)
+
+def main_run(argv):
+    from .regions import parse_region
+    from .run_driver import run_extraction, DATA_DIR, TIPOS
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools run",
+                                     description="Extrae en paralelo todos los pasos de una corrida ETA/WRF")
+    parser.add_argument("--modelo", required=True, help="ej: PERU_WRF22, PERU_ETA22")
+    parser.add_argument("--fecha", required=True, help="fecha de la corrida YYYYMMDD")
+    parser.add_argument("--hora", required=True, help="hora de la corrida HH")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--datadir", default=DATA_DIR)
+    parser.add_argument("--tipo", nargs="+", default=TIPOS)
+    parser.add_argument("--workers", type=int, default=None, help="procesos (default: núcleos disponibles)")
+    parser.add_argument("--max-mem", type=float, default=None, help="límite de memoria por proceso (MB)")
+    parser.add_argument("--multipass", action="store_true")
+    parser.add_argument("--region", nargs="+", default=None,
+                        help="región (ej: lima) o bbox lon_min lat_min lon_max lat_max")
+    parser.add_argument("--sin-solape", action="store_true",
+                        help="con --workers 1, extrae en un proceso aislado sin solapar decodificación y escritura")
+    _agrega_incremental(parser)
+    _agrega_profile(parser)
+    args = parser.parse_args(argv)
+    _activa_profile(args)
+
+    fallas = run_extraction(args.modelo, args.fecha, args.hora, args.out, args.tipo, r0=args.datadir,
+                            workers=args.workers, max_mem_mb=args.max_mem, single_pass=not args.multipass,
+                            region=parse_region(args.region), incremental=not args.completo,
+                            content_hash=args.hash or None, overlap=not args.sin_solape)
+    return 1 if fallas else 0
+
+def main_pipeline(argv):
+    from .regions import parse_region
+    from .pipeline import run_pipeline
+    from .run_driver import DATA_DIR, TIPOS
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools pipeline",
+                                     description="Extrae, procesa y une una corrida en memoria (sin NetCDF intermedios)")
+    parser.add_argument("--modelo", required=True, help="ej: PERU_WRF22, PERU_ETA22")
+    parser.add_argument("--fecha", required=True, help="fecha de la corrida YYYYMMDD")
+    parser.add_argument("--hora", required=True, help="hora de la corrida HH")
+    parser.add_argument("--out", required=True, help="carpeta de los productos finales (ej: out/06Z)")
+    parser.add_argument("--datadir", default=DATA_DIR)
+    parser.add_argument("--tipo", nargs="+", default=TIPOS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-mem", type=float, default=None, help="límite de memoria por proceso (MB)")
+    parser.add_argument("--multipass", action="store_true")
+    parser.add_argument("--perfil", default=None, help="perfil de escritura NetCDF (ver nc_encoding.PERFILES)")
+    parser.add_argument("--backend", choices=["netcdf", "zarr"], default="netcdf",
+                        help="zarr: cada proceso escribe su paso en su región del almacén")
+    parser.add_argument("--region", nargs="+", default=None,
+                        help="región (ej: lima) o bbox lon_min lat_min lon_max lat_max")
+    parser.add_argument("--derivadas", nargs="+", default=None,
+                        help="variables derivadas (ej: ws10 wd10 tp_int rh2m; 'todas')")
+    parser.add_argument("--streaming", action="store_true",
+                        help="escribe cada paso apenas se extrae (memoria constante en el largo del pronóstico)")
+    _agrega_incremental(parser)
+    _agrega_archivo(parser)
+    _agrega_profile(parser)
+    args = parser.parse_args(argv)
+    _activa_profile(args)
+
+    salidas = run_pipeline(args.modelo, args.fecha, args.hora, args.out, args.tipo, r0=args.datadir,
+                           workers=args.workers, max_mem_mb=args.max_mem, single_pass=not args.multipass,
+                           profile=args.perfil, backend=args.backend,
+                           region=parse_region(args.region), derived=args.derivadas, streaming=args.streaming,
+                           incremental=not args.completo, content_hash=args.hash or None, archive=args.archivo)
+    return 0 if salidas else 1
+
+def main_watch(argv):
+    from .regions import parse_region
+    from .watcher import watch_run
+    from .run_driver import DATA_DIR, TIPOS
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools watch",
+                                     description="Procesa los pasos de una corrida a medida que el modelo los escribe")
+    parser.add_argument("--modelo", required=True, help="ej: PERU_WRF22, PERU_ETA22")
+    parser.add_argument("--fecha", required=True, help="fecha de la corrida YYYYMMDD")
+    parser.add_argument("--hora", required=True, help="hora de la corrida HH")
+    parser.add_argument("--out", required=True, help="carpeta de los productos finales (ej: out/06Z)")
+    parser.add_argument("--datadir", default=DATA_DIR)
+    parser.add_argument("--tipo", nargs="+", default=TIPOS)
+    parser.add_argument("--workers", type=int, default=4, help="pasos extraídos a la vez")
+    parser.add_argument("--max-mem", type=float, default=None, help="límite de memoria por proceso (MB)")
+    parser.add_argument("--poll", type=float, default=10, help="segundos entre revisiones")
+    parser.add_argument("--stable", type=float, default=30, help="segundos de tamaño constante sin '.idx'")
+    parser.add_argument("--pasos", type=int, default=None, help="pasos esperados de la corrida")
+    parser.add_argument("--idle-timeout", type=float, default=3600, help="segundos sin pasos nuevos para terminar")
+    parser.add_argument("--multipass", action="store_true")
+    parser.add_argument("--perfil", default=None, help="perfil de escritura NetCDF (ver nc_encoding.PERFILES)")
+    parser.add_argument("--region", nargs="+", default=None,
+                        help="región (ej: lima) o bbox lon_min lat_min lon_max lat_max")
+    parser.add_argument("--derivadas", nargs="+", default=None,
+                        help="variables derivadas (ej: ws10 wd10 tp_int rh2m; 'todas')")
+    _agrega_archivo(parser)
+    _agrega_profile(parser)
+    args = parser.parse_args(argv)
+    _activa_profile(args)
+
+    fallas = watch_run(args.modelo, args.fecha, args.hora, args.out, args.tipo, r0=args.datadir,
+                       workers=args.workers, max_mem_mb=args.max_mem, poll=args.poll,
+                       stable_secs=args.stable, n_pasos=args.pasos, idle_timeout=args.idle_timeout,
+                       single_pass=not args.multipass, profile=args.perfil,
+                       region=parse_region(args.region), derived=args.derivadas, archive=args.archivo)
+    return 1 if fallas else 0
+
+def main_perfiles(argv):
+    from .nc_encoding import encoding_report, PERFILES
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools perfiles",
+                                     description="Compara tamaño y tiempos de escritura/lectura de los perfiles NetCDF")
+    parser.add_argument("archivo", help="producto NetCDF de referencia (ej: PERU_WRF22_2025010106_sfc.nc)")
+    parser.add_argument("--perfil", nargs="+", default=list(PERFILES), choices=list(PERFILES))
+    parser.add_argument("--out", default=None, help="carpeta donde dejar los archivos de prueba")
+    args = parser.parse_args(argv)
+
+    encoding_report(args.archivo, args.perfil, outdir=args.out)
+    return 0
+
+def main_estaciones(argv):
+    from .stations import extract_stations
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools estaciones",
+                                     description="Series de tiempo de los productos en una lista de estaciones")
+    parser.add_argument("--producto", nargs="+", required=True, help="productos NetCDF (ej: *_sfc.nc *_prs.nc)")
+    parser.add_argument("--estaciones", required=True, help="CSV con columnas codigo, lat, lon")
+    parser.add_argument("--out", required=True, help="salida .csv o .parquet")
+    parser.add_argument("--var", nargs="+", default=None, help="variables (default: todas)")
+    args = parser.parse_args(argv)
+
+    df = extract_stations(args.producto, args.estaciones, args.var, out_file=args.out)
+    return 0 if len(df) else 1
+
+def main_mapas(argv):
+    from .render import render_run
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools mapas",
+                                     description="Genera en paralelo todos los mapas PNG de una corrida")
+    parser.add_argument("--producto", nargs="+", required=True, help="productos NetCDF (ej: *_sfc.nc *_prs.nc)")
+    parser.add_argument("--out", required=True, help="carpeta de las figuras")
+    parser.add_argument("--var", nargs="+", default=None, help="variables (default: todas)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dpi", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    salidas = render_run(args.producto, args.out, args.var, workers=args.workers, dpi=args.dpi)
+    return 0 if salidas else 1
+
+def main_batch(argv):
+    from .regions import parse_region
+    from .batch import run_batch
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools batch",
+                                     description="Procesa un rango de fechas de varios dominios con presupuesto de CPU y memoria")
+    parser.add_argument("--dominio", nargs="+", default=None, help="dominios (ej: WRF22 ETA22; default: todos)")
+    parser.add_argument("--inicio", required=True, help="primera fecha YYYYMMDD")
+    parser.add_argument("--fin", default=None, help="última fecha YYYYMMDD (default: --inicio)")
+    parser.add_argument("--horas", nargs="+", default=None, help="horas de corrida (default: las del dominio)")
+    parser.add_argument("--out", required=True, help="carpeta base de los productos")
+    parser.add_argument("--config", default=None, help="JSON {dominio: opciones} o archivo con formato 'lista'")
+    parser.add_argument("--cpu", type=int, default=None, help="procesos en total (default: núcleos disponibles)")
+    parser.add_argument("--mem", type=float, default=None, help="memoria total en MB (default: 80%% de la RAM)")
+    parser.add_argument("--reprocesar", action="store_true", help="vuelve a procesar corridas con productos")
+    parser.add_argument("--perfil", default=None, help="perfil de escritura NetCDF (ver nc_encoding.PERFILES)")
+    parser.add_argument("--backend", choices=["netcdf", "zarr"], default="netcdf")
+    parser.add_argument("--region", nargs="+", default=None,
+                        help="región (ej: lima) o bbox lon_min lat_min lon_max lat_max")
+    parser.add_argument("--derivadas", nargs="+", default=None, help="variables derivadas (ver derived.DERIVADAS)")
+    parser.add_argument("--streaming", action="store_const", const=True, default=None,
+                        help="escritura paso a paso en todas las corridas (default: según el dominio)")
+    _agrega_archivo(parser)
+    _agrega_profile(parser)
+    args = parser.parse_args(argv)
+    _activa_profile(args)
+
+    resultados = run_batch(args.dominio, args.inicio, args.fin or args.inicio, args.out, horas=args.horas,
+                           config=args.config, cpu=args.cpu, mem_mb=args.mem, reprocess=args.reprocesar,
+                           profile=args.perfil, backend=args.backend, region=parse_region(args.region),
+                           derived=args.derivadas, streaming=args.streaming, archive=args.archivo)
+    return 1 if any(isinstance(v, str) for v in resultados.values()) else 0
+
+def main_serve(argv):
+    from .server import serve, default_address
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools serve",
+                                     description="Servidor persistente de tareas extract/process/merge")
+    parser.add_argument("--servidor", default=None,
+                        help=f"socket Unix o host:puerto (default: $SMN_SERVER o {default_address()})")
+    parser.add_argument("--workers", type=int, default=1, help="tareas ejecutadas a la vez")
+    parser.add_argument("--max-mem", type=float, default=None, help="límite de memoria por proceso (MB)")
+    _agrega_profile(parser)
+    args = parser.parse_args(argv)
+    _activa_profile(args)
+
+    serve(args.servidor, workers=args.workers, max_mem_mb=args.max_mem)
+    return 0
+
+def main_cliente(argv):
+    # cliente liviano: sólo biblioteca estándar (no importa xarray, cfgrib ni matplotlib)
+    from .server import submit, server_status, stop_server
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools cliente",
+                                     description="Envía una tarea al servidor (python -m SMN_tools serve)")
+    parser.add_argument("--servidor", default=None, help="socket Unix o host:puerto (default: $SMN_SERVER)")
+    parser.add_argument("--timeout", type=float, default=None, help="segundos de espera de la respuesta")
+    sub = parser.add_subparsers(dest="tarea", required=True)
+    p = sub.add_parser("extract", help="extrae variables de un GRIB (como python -m SMN_tools --modelo ...)")
+    p.add_argument("--modelo", choices=["ETA", "WRF"], required=True)
+    p.add_argument("--gribfile", required=True)
+    p.add_argument("--out", required=True)
+    p.add_argument("--tipo", nargs="+", required=True)
+    p.add_argument("--multipass", action="store_true")
+    p.add_argument("--region", nargs="+", default=None,
+                   help="región (ej: lima) o bbox lon_min lat_min lon_max lat_max")
+    p = sub.add_parser("process", help="concatena los pasos de una variable (process_netcdf_files)")
+    p.add_argument("--archivos", nargs="+", required=True)
+    p.add_argument("--prefijo", required=True, help="prefijo de salida (sfc o prs)")
+    p.add_argument("--dims", nargs="+", required=True, help="ej: time latitude longitude")
+    p = sub.add_parser("merge", help="une las variables en el producto final (merge_files)")
+    p.add_argument("--archivos", nargs="+", required=True)
+    p.add_argument("--salida", required=True)
+    p.add_argument("--sin-catalogo", action="store_true", help="no registra el producto en el catálogo SQLite")
+    for nombre in ("process", "merge"):
+        p = sub.choices[nombre]
+        p.add_argument("--append", action="store_true")
+        p.add_argument("--perfil", default=None, help="perfil de escritura NetCDF (ver nc_encoding.PERFILES)")
+        p.add_argument("--region", nargs="+", default=None,
+                       help="región (ej: lima) o bbox lon_min lat_min lon_max lat_max")
+        p.add_argument("--derivadas", nargs="+", default=None, help="variables derivadas (ver derived.DERIVADAS)")
+    sub.add_parser("estado", help="estado del servidor")
+    sub.add_parser("detener", help="detiene el servidor")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.tarea == "estado":
+            print(server_status(args.servidor))
+            return 0
+        if args.tarea == "detener":
+            stop_server(args.servidor)
+            return 0
+    except OSError as e:
+        print(f"Sin servidor en {args.servidor or '$SMN_SERVER'}: {e}", file=sys.stderr)
+        return 2
+    region = args.region[0] if args.region and len(args.region) == 1 else args.region
+    if args.tarea == "extract":
+        opciones = dict(modelo=args.modelo, out_path=args.out, gribfile=args.gribfile, tipo=args.tipo,
+                        single_pass=not args.multipass, region=region)
+    elif args.tarea == "process":
+        opciones = dict(list_files=args.archivos, prefix_out=args.prefijo, new_dims=args.dims,
+                        append=args.append, profile=args.perfil, region=region, derived=args.derivadas)
+    else:
+        opciones = dict(list_files=args.archivos, output_file=args.salida, append=args.append,
+                        profile=args.perfil, region=region, derived=args.derivadas, catalog=not args.sin_catalogo)
+    try:
+        resultado = submit(args.tarea, args.servidor, args.timeout, **opciones)
+    except OSError as e:
+        print(f"Sin servidor en {args.servidor or '$SMN_SERVER'}: {e}", file=sys.stderr)
+        return 2
+    if resultado["error"]:
+        print(f"ERROR {resultado['error']}", file=sys.stderr)
+        return 1
+    print(f"{args.tarea} ok ({resultado['seg']:.1f} s)")
+    return 0
+
+def main_mediciones(argv):
+    from .profiling import profile_summary
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools mediciones",
+                                     description="Resumen por corrida y etapa de las mediciones de --profile")
+    parser.add_argument("archivo", nargs="+", help="archivos JSON lines de --profile / $SMN_PROFILE")
+    parser.add_argument("--por", default="corrida", help="columna de agrupación (corrida, archivo, pid)")
+    parser.add_argument("--csv", default=None, help="guarda el resumen en CSV")
+    args = parser.parse_args(argv)
+
+    resumen = profile_summary(args.archivo, por=args.por)
+    if resumen.empty:
+        print("Sin mediciones")
+        return 1
+    print(resumen.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    if args.csv:
+        resumen.to_csv(args.csv, index=False)
+    return 0
+
+def main_catalogo(argv):
+    from .catalog import find_products, index_products, prune_catalog, catalog_path
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools catalogo",
+                                     description="Busca productos en el catálogo SQLite sin abrir los NetCDF")
+    parser.add_argument("--catalogo", default=None, help=f"archivo SQLite (default: $SMN_CATALOG o {catalog_path()})")
+    parser.add_argument("--indexar", nargs="+", default=None, metavar="CARPETA",
+                        help="registra los productos ya existentes bajo estas carpetas")
+    parser.add_argument("--depurar", action="store_true", help="quita los productos que ya no existen")
+    parser.add_argument("--modelo", nargs="+", default=None)
+    parser.add_argument("--producto", choices=["sfc", "prs"], default=None)
+    parser.add_argument("--variable", nargs="+", default=None, help="variables que el producto debe tener")
+    parser.add_argument("--valido", default=None, help="tiempo válido (ej: 2025-01-01T12)")
+    parser.add_argument("--inicio", default=None, help="hora de inicio de la corrida (ej: 2025-01-01T06)")
+    parser.add_argument("--desde", default=None)
+    parser.add_argument("--hasta", default=None)
+    parser.add_argument("--nivel", type=float, default=None, help="nivel de presión (hPa)")
+    parser.add_argument("--rutas", action="store_true", help="sólo las rutas, una por línea")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.indexar:
+            index_products(args.indexar, args.catalogo)
+        if args.depurar:
+            print(f"{len(prune_catalog(args.catalogo))} productos quitados del catálogo")
+        tabla = find_products(args.modelo, args.producto, args.variable, args.valido, args.inicio, args.desde,
+                              args.hasta, args.nivel, catalog=args.catalogo, tabla=True)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if tabla.empty:
+        print("Sin productos")
+        return 1
+    if args.rutas:
+        print("\n".join(tabla["path"]))
+    else:
+        columnas = ["modelo", "producto", "init_time", "lead_min", "lead_max", "n_tiempos", "variables", "path"]
+        print(tabla[columnas].to_string(index=False))
+    return 0
+
+def main_estadisticos(argv):
+    from .domain_stats import domain_stats, UMBRALES, CUANTILES
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools estadisticos",
+                                     description="Estadísticos de dominio por variable, nivel y hora de pronóstico")
+    parser.add_argument("productos", nargs="+", help="productos sfc/prs (NetCDF o Zarr)")
+    parser.add_argument("--variable", nargs="+", default=None)
+    parser.add_argument("--umbral", nargs="+", default=None, metavar="VAR=U1,U2",
+                        help=f"umbrales de excedencia (ej: tp=1,10,50 t2m=308; default: {UMBRALES})")
+    parser.add_argument("--cuantiles", nargs="+", type=float, default=CUANTILES, help="cuantiles en %%")
+    parser.add_argument("--workers", type=int, default=None, help="procesos (default: núcleos disponibles)")
+    parser.add_argument("--csv", default=None, help="guarda la tabla completa en CSV")
+    args = parser.parse_args(argv)
+
+    umbrales = None
+    if args.umbral:
+        umbrales = {var: [float(u) for u in valores.split(",")]
+                    for var, valores in (item.split("=", 1) for item in args.umbral)}
+    tabla = domain_stats(args.productos, args.variable, umbrales, args.cuantiles, args.workers)
+    if tabla.empty:
+        print("Sin variables")
+        return 1
+    if args.csv:
+        tabla.to_csv(args.csv, index=False)
+    columnas = [c for c in tabla.columns if c not in ("producto", "time", "sum") and not c.startswith("frac_")]
+    print(tabla[columnas].to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+    return 0
+
+def main_regrid(argv):
+    from .regrid import regrid, target_grid, METODOS
+    from .regions import parse_region
+    from .nc_encoding import build_encoding
+    from .manifest import atomic_path
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools regrid",
+                                     description="Interpola un producto a otra grilla con pesos precalculados")
+    parser.add_argument("producto", help="producto de origen (NetCDF o Zarr)")
+    parser.add_argument("--destino", default=None, help="producto con la grilla destino (ej: el de otro modelo)")
+    parser.add_argument("--region", nargs="+", default=None,
+                        help="grilla regular sobre una región (ej: peru) o bbox lon_min lat_min lon_max lat_max")
+    parser.add_argument("--resolucion", type=float, default=None, help="paso de la grilla regular (grados)")
+    parser.add_argument("--metodo", choices=METODOS, default="bilinear")
+    parser.add_argument("--variable", nargs="+", default=None)
+    parser.add_argument("--perfil", default=None, help="perfil de escritura NetCDF (ver nc_encoding.PERFILES)")
+    parser.add_argument("--out", required=True, help="NetCDF de salida")
+    args = parser.parse_args(argv)
+
+    if args.destino:
+        destino = args.destino
+    elif args.region and args.resolucion:
+        destino = target_grid(parse_region(args.region), args.resolucion)
+    else:
+        parser.error("se requiere --destino o --region con --resolucion")
+    ds = regrid(args.producto, destino, args.metodo, args.variable)
+    with atomic_path(args.out) as tmp:
+        ds.to_netcdf(tmp, encoding=build_encoding(ds, args.perfil), format="NETCDF4")
+    print(f"Producto interpolado ({args.metodo}): {args.out}")
+    return 0
+
+def main_archivar(argv):
+    from .archive import archive_products, archived_runs
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools archivar",
+                                     description="Agrega productos ya generados al archivo de corridas (init_time x lead_time)")
+    parser.add_argument("productos", nargs="+", help="productos {modelo}_{YYYYMMDDHH}_{prs|sfc}.nc|.zarr")
+    parser.add_argument("--archivo", required=True, metavar="CARPETA", help="carpeta de los archivos de corridas")
+    parser.add_argument("--zarr", action="store_true", help="archivo de corridas en Zarr ({modelo}_{producto}.zarr)")
+    parser.add_argument("--faltantes", action="store_true", help="omite las corridas que ya están archivadas")
+    args = parser.parse_args(argv)
+
+    archive_products(args.productos, args.archivo, zarr=args.zarr, solo_faltantes=args.faltantes)
+    for nombre in sorted(os.listdir(args.archivo)):
+        if nombre.endswith((".nc", ".zarr")):
+            corridas = archived_runs(os.path.join(args.archivo, nombre))
+            if len(corridas):
+                print(f"{nombre}: {len(corridas)} corridas ({corridas.min():%Y-%m-%d %HZ} a {corridas.max():%Y-%m-%d %HZ})")
+    return 0
+
+def main_sintetico(argv):
+    from .synthetic_grib import make_run, NIVELES, PARAMETROS
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools sintetico",
+                                     description="Genera una corrida GRIB2 sintética ETA/WRF (sin datos reales)")
+    parser.add_argument("--modelo", choices=["ETA", "WRF"], required=True)
+    parser.add_argument("--out", required=True, help="carpeta base (se usa como --datadir en run/pipeline)")
+    parser.add_argument("--nombre", default=None, help="dominio (default: SYN_{modelo}{nx}x{ny})")
+    parser.add_argument("--fecha", default="20250101")
+    parser.add_argument("--hora", default="00")
+    parser.add_argument("--nx", type=int, default=93)
+    parser.add_argument("--ny", type=int, default=113)
+    parser.add_argument("--niveles", nargs="+", type=int, default=NIVELES, help="niveles de presión (hPa)")
+    parser.add_argument("--variables", nargs="+", default=None, help=f"shortNames ({' '.join(PARAMETROS)})")
+    parser.add_argument("--pasos", type=int, default=4, help="horas de pronóstico")
+    parser.add_argument("--intervalo", type=int, default=3, help="horas entre pasos")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    make_run(args.out, args.modelo, args.nombre, args.fecha, args.hora, nx=args.nx, ny=args.ny,
+             niveles=args.niveles, variables=args.variables, n_leads=args.pasos,
+             intervalo=args.intervalo, seed=args.semilla)
+    return 0
+
+def main_bench(argv):
+    from .benchmark import run_benchmark, compare_benchmarks, TAMANOS, CASOS
+    parser = argparse.ArgumentParser(prog="python -m SMN_tools bench",
+                                     description="Mide extracción, procesamiento y unión con corridas sintéticas")
+    parser.add_argument("--resultados", required=True, help="archivo JSON lines de resultados (se agregan)")
+    parser.add_argument("--tamanos", nargs="+", default=["chico", "mediano"], choices=list(TAMANOS))
+    parser.add_argument("--casos", nargs="+", default=None, choices=CASOS)
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--datos", default=None, help="carpeta de las corridas sintéticas (se reutilizan)")
+    parser.add_argument("--etiqueta", default=None, help="versión de los resultados (default: git describe)")
+    parser.add_argument("--comparar", nargs=2, default=None, metavar=("BASE", "NUEVA"),
+                        help="compara dos versiones ya medidas en --resultados")
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        tabla = compare_benchmarks(args.resultados, *args.comparar)
+        print(tabla.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+        return 0
+    mediciones = run_benchmark(args.resultados, args.tamanos, args.casos, args.repeticiones,
+                               args.datos, args.etiqueta)
+    return 1 if any(m["error"] for m in mediciones) else 0
+
+COMANDOS = {"run": main_run, "pipeline": main_pipeline, "watch": main_watch, "perfiles": main_perfiles,
+            "estaciones": main_estaciones, "mapas": main_mapas, "batch": main_batch,
+            "serve": main_serve, "cliente": main_cliente,
+            "mediciones": main_mediciones, "catalogo": main_catalogo,
+            "estadisticos": main_estadisticos, "regrid": main_regrid, "archivar": main_archivar, "sintetico": main_sintetico, "bench": main_bench}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMANDOS:
+        return COMANDOS[argv[0]](argv[1:])
+
     parser = argparse.ArgumentParser(description="Extraer variables de ETA o WRF")
     parser.add_argument("--modelo", choices=["ETA","WRF"], required=True)
     parser.add_argument("--gribfile", required=True)
     parser.add_argument("--out", required=True)
     parser.add_argument("--tipo", nargs="+", required=True)
-    args = parser.parse_args()
+    parser.add_argument("--multipass", action="store_true",
+                        help="abre el GRIB una vez por variable (sin lectura en una sola pasada)")
+    parser.add_argument("--region", nargs="+", default=None,
+                        help="región (ej: lima) o bbox lon_min lat_min lon_max lat_max")
+    _agrega_profile(parser)
+    args = parser.parse_args(argv)
+    _activa_profile(args)
 
+    from .regions import parse_region
+    from . import extrac_ETA, extrac_WRF
     if args.modelo == "ETA":
-        extrac_ETA(args.out, args.gribfile, args.tipo)
+        extrac_ETA(args.out, args.gribfile, args.tipo, single_pass=not args.multipass,
+                   region=parse_region(args.region))
     elif args.modelo == "WRF":
-        extrac_WRF(args.out, args.gribfile, args.tipo)
+        extrac_WRF(args.out, args.gribfile, args.tipo, single_pass=not args.multipass,
+                   region=parse_region(args.region))
+    return 0
 
 if __name__ == "__main__":
-    main()
-
+    sys.exit(main())
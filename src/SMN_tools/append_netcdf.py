@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+from .manifest import atomic_path
+
+# opciones de encoding (además de zlib/complevel) que se pasan a createVariable
+CREATE_OPTS = ["shuffle", "chunksizes", "least_significant_digit", "significant_digits", "quantize_mode"]
+
+def _n_validos(tvar):
+    # registros con tiempo escrito; un registro a medias (corte durante la escritura)
+    # queda con tiempo enmascarado al final y se reutiliza al reanudar
+    tiempos = np.ma.masked_invalid(np.ma.asarray(tvar[:]))
+    n = len(tiempos)
+    while n > 0 and np.ma.is_masked(tiempos[n - 1]):
+        n -= 1
+    return n, np.ma.getdata(tiempos[:n]).astype(float)
+
+def _tiene_datos(var, k):
+    # algún valor válido en el registro k: basta el primer chunk; sólo si está vacío
+    # (ej. esquina sin datos) se lee el registro completo
+    chunks = var.chunking()
+    tam = var.shape[1:] if chunks == "contiguous" else chunks[1:]
+    if np.ma.masked_invalid(var[(k,) + tuple(slice(0, c) for c in tam)]).count():
+        return True
+    return bool(np.ma.masked_invalid(var[k]).count())
+
+def append_netcdf(ds, output_file, time_dim="time", encoding=None, overwrite=False):
+    """
+    Agrega pasos de tiempo a un NetCDF con dimensión 'time' ilimitada sin reescribir los
+    pasos anteriores. Si el archivo no existe se crea. El eje de tiempo se mantiene ordenado:
+    un paso posterior al último se agrega al final y uno intermedio se inserta desplazando
+    sólo los pasos siguientes. Un paso que ya existe no se vuelve a escribir (overwrite=False),
+    así que reanudar una corrida es seguro. El tiempo de cada paso se escribe al final, de
+    modo que un corte a medias deja un registro que se reutiliza en la siguiente ejecución;
+    al insertar, los tiempos de los pasos siguientes se invalidan antes de desplazarlos y se
+    reescriben al final: un corte los pierde (se vuelven a escribir al reanudar) pero nunca
+    deja tiempos repetidos ni datos que no correspondan a su tiempo.
+    ----------
+    Parámetros:
+    ds : xr.Dataset         Pasos a agregar (dimensión time_dim, mismas coordenadas espaciales).
+    output_file : str       NetCDF de salida (ej: '{model}_{fecha}_sfc.nc').
+    time_dim : str          Nombre de la dimensión de tiempo (default: 'time').
+    encoding : dict         Encoding por variable (default: zlib, complevel 5; ver nc_encoding).
+    overwrite : bool        Reescribe los pasos que ya existen (default: False).
+    -------
+    Retorna:
+    list        Tiempos (datetime64) efectivamente escritos.
+    """
+    ds = ds.sortby(time_dim)
+    if encoding is None:
+        encoding = {var: {"zlib": True, "complevel": 5} for var in ds.data_vars}
+    if not os.path.exists(output_file):
+        # unidades fijas para que los pasos siguientes no se trunquen (xarray elegiría
+        # 'days since' en enteros con un solo paso)
+        t0 = pd.Timestamp(ds[time_dim].values[0]).isoformat(sep=" ")
+        encoding = dict(encoding)
+        encoding.setdefault(time_dim, {"units": f"hours since {t0}", "dtype": "float64"})
+        with atomic_path(output_file) as tmp:
+            ds.to_netcdf(tmp, encoding=encoding, format="NETCDF4", unlimited_dims=[time_dim])
+        return list(ds[time_dim].values)
+
+    escritos = []
+    with nc.Dataset(output_file, "a") as dst:
+        tvar = dst.variables[time_dim]
+        units, calendar = tvar.units, getattr(tvar, "calendar", "standard")
+        n, tiempos = _n_validos(tvar)
+        for i, t in enumerate(ds[time_dim].values):
+            tnum = float(nc.date2num(pd.Timestamp(t).to_pydatetime(), units, calendar))
+            paso = ds.isel({time_dim: i})
+            existe = np.isclose(tiempos, tnum)
+            cola = tiempos[:0]   # tiempos de los pasos desplazados por una inserción
+            if existe.any():
+                k = int(np.argmax(existe))
+                if not overwrite and all(v in dst.variables and _tiene_datos(dst.variables[v], k)
+                                         for v in paso.data_vars):
+                    continue
+            else:
+                k = int(np.searchsorted(tiempos, tnum))
+                if k < n:  # paso intermedio: desplazar sólo los registros posteriores
+                    cola = tiempos[k:]
+                    tvar[k:n] = np.nan   # primero: los registros desde k quedan incompletos
+                    for var in dst.variables.values():
+                        if var is not tvar and var.dimensions and var.dimensions[0] == time_dim:
+                            for j in range(n - 1, k - 1, -1):
+                                var[j + 1] = var[j]
+                n += 1
+                tiempos = np.insert(tiempos, k, tnum)
+
+            for name, da in paso.data_vars.items():
+                if name not in dst.variables:   # variable nueva en un producto existente
+                    enc = encoding.get(name, {})
+                    opciones = {o: enc[o] for o in CREATE_OPTS if o in enc}
+                    fill = enc.get("_FillValue", np.nan if da.dtype.kind == "f" else None)
+                    var = dst.createVariable(name, enc.get("dtype", da.dtype), (time_dim,) + da.dims,
+                                             zlib=enc.get("zlib", False), complevel=enc.get("complevel", 4),
+                                             fill_value=fill, **opciones)
+                    var.setncatts({a: v for a, v in da.attrs.items() if a != "_FillValue"})
+                    var.setncatts({a: enc[a] for a in ("scale_factor", "add_offset") if a in enc})
+                var = dst.variables[name]
+                valores = da.transpose(*var.dimensions[1:]).values
+                if hasattr(var, "scale_factor"):
+                    # empaquetado int16: NaN -> _FillValue y recorte al rango representable
+                    lim = var.scale_factor * (np.iinfo(var.dtype).max - 1)
+                    nan = np.isnan(valores)
+                    valores = np.clip(np.where(nan, var.add_offset, valores), var.add_offset - lim, var.add_offset + lim)
+                    valores = np.ma.array(valores, mask=nan)
+                var[k] = valores
+            # al final, en una sola escritura: marca el registro (y los desplazados) como completos
+            tvar[k:k + 1 + len(cola)] = np.concatenate([[tnum], cola])
+            escritos.append(t)
+    return escritos
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import fcntl
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import xarray as xr
+import netCDF4 as nc
+from .nc_encoding import SERIE_PUNTOS
+from .zarr_store import is_zarr, _zarr
+from .manifest import atomic_path
+from .catalog import PATRON
+from .profiling import profiled
+
+# archivo de corridas: {model}_{prs|sfc}.nc con dimensiones (init_time, lead_time, [nivel], lat, lon).
+# Un chunk por corrida (agregar una corrida sólo escribe sus chunks) con todas las horas de
+# pronóstico y bloques de SERIE_PUNTOS x SERIE_PUNTOS puntos (series por punto baratas)
+INIT_UNITS = "hours since 1970-01-01 00:00:00"
+CHUNKS = {'init_time': 1, 'isobaricInhPa': 1, 'latitude': SERIE_PUNTOS, 'longitude': SERIE_PUNTOS}
+COMPLEVEL = 4
+
+def archive_path(archive_dir, model, producto, zarr=False):
+    """Ruta del archivo de corridas de un modelo y producto: '{archive_dir}/{model}_{producto}.nc' (o .zarr)."""
+    return os.path.join(archive_dir, f"{model}_{producto}.{'zarr' if zarr else 'nc'}")
+
+@contextmanager
+def _bloqueo(archive):
+    # un escritor a la vez por archivo (corridas de batch y watch en procesos distintos)
+    with open(f"{archive.rstrip('/')}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def run_layout(ds, init_time, leads=None):
+    """
+    Pasa un producto de una corrida (dimensión 'time' = tiempo válido) a las dimensiones del
+    archivo: init_time (1) x lead_time (horas). Con `leads` se reindexa a ese eje de horas de
+    pronóstico (las que falten quedan en NaN).
+    """
+    init_time = pd.Timestamp(init_time)
+    horas = (pd.to_datetime(ds["time"].values) - init_time) / pd.Timedelta(hours=1)
+    run = ds.assign_coords(time=np.asarray(horas, dtype="f8")).rename(time="lead_time")
+    if leads is not None:
+        fuera = sorted(set(run["lead_time"].values) - set(np.asarray(leads, dtype="f8")))
+        if fuera:
+            raise ValueError(f"Horas de pronóstico {fuera} fuera del eje del archivo ({list(leads)})")
+        run = run.reindex(lead_time=np.asarray(leads, dtype="f8"))
+    run = run.expand_dims(init_time=[init_time.to_datetime64()])
+    for da in run.data_vars.values():
+        # los 'stats_*' (field_stats) son de una corrida: no valen para el archivo
+        da.attrs = {a: v for a, v in da.attrs.items() if not a.startswith("stats_")}
+    run["lead_time"].attrs.update(standard_name="forecast_period", long_name="lead time", units="hours")
+    run["init_time"].attrs.update(standard_name="forecast_reference_time", long_name="initialization time")
+    return run
+
+def _chunks(dims, sizes, chunks):
+    return tuple(int(min(chunks.get(d, sizes[d]), sizes[d])) if d != "init_time" else int(chunks.get(d, 1))
+                 for d in dims)
+
+def _crea(archive, run, chunks):
+    # esqueleto NetCDF: init_time ilimitado, coordenadas fijas y variables vacías
+    with atomic_path(archive) as tmp:
+        with nc.Dataset(tmp, "w", format="NETCDF4") as dst:
+            dst.setncatts(dict(run.attrs, history=f"{run.attrs.get('history', '')}; archivo de corridas".strip("; ")))
+            dst.createDimension("init_time", None)
+            tvar = dst.createVariable("init_time", "f8", ("init_time",))
+            tvar.setncatts(dict(run["init_time"].attrs, units=INIT_UNITS, calendar="standard"))
+            for dim in [d for d in run.dims if d != "init_time"]:
+                dst.createDimension(dim, run.sizes[dim])
+                var = dst.createVariable(dim, run[dim].dtype, (dim,))
+                var.setncatts(run[dim].attrs)
+                var[:] = run[dim].values
+    return archive
+
+def _variable(dst, name, da, chunks):
+    if name in dst.variables:
+        return dst.variables[name]
+    sizes = {d: len(dst.dimensions[d]) for d in da.dims if d != "init_time"}
+    sizes["init_time"] = 1
+    var = dst.createVariable(name, da.dtype if da.dtype.kind == "f" else "f4", da.dims, zlib=True,
+                             complevel=COMPLEVEL, shuffle=True, fill_value=np.nan,
+                             chunksizes=_chunks(da.dims, sizes, chunks))
+    var.setncatts({a: v for a, v in da.attrs.items() if a != "_FillValue"})
+    return var
+
+def _agrega_netcdf(archive, run, chunks):
+    if not os.path.exists(archive):
+        _crea(archive, run, chunks)
+    with nc.Dataset(archive, "a") as dst:
+        leads = dst.variables["lead_time"][:]
+        if len(leads) != run.sizes["lead_time"] or not np.allclose(leads, run["lead_time"].values):
+            raise ValueError(f"{archive}: eje de horas de pronóstico distinto al de la corrida")
+        tvar = dst.variables["init_time"]
+        tnum = float(nc.date2num(pd.Timestamp(run["init_time"].values[0]).to_pydatetime(), INIT_UNITS))
+        tiempos = np.ma.filled(np.ma.masked_invalid(np.ma.asarray(tvar[:])).astype("f8"), np.nan)
+        existe = np.flatnonzero(np.isclose(tiempos, tnum))
+        # corrida repetida: se reescribe su lugar; nueva: al final (el orden lo da open_archive)
+        k = int(existe[0]) if existe.size else len(tiempos)
+        for name, da in run.data_vars.items():
+            var = _variable(dst, name, da, chunks)
+            # una escritura por variable: sólo los chunks de esta corrida
+            var[k] = da.transpose(*var.dimensions).values[0]
+        tvar[k] = tnum   # al final: marca la corrida como completa
+    return k
+
+def _agrega_zarr(archive, run, chunks):
+    _zarr()
+    encoding = {v: {"chunks": _chunks(da.dims, dict(da.sizes), chunks)} for v, da in run.data_vars.items()}
+    if not os.path.exists(archive):
+        encoding["init_time"] = {"units": INIT_UNITS, "dtype": "f8"}
+        run.to_zarr(archive, mode="w", encoding=encoding, consolidated=True)
+        return 0
+    with xr.open_zarr(archive) as actual:
+        tiempos = actual["init_time"].values
+        leads = actual["lead_time"].values
+    if len(leads) != run.sizes["lead_time"] or not np.allclose(leads, run["lead_time"].values):
+        raise ValueError(f"{archive}: eje de horas de pronóstico distinto al de la corrida")
+    existe = np.flatnonzero(tiempos == run["init_time"].values[0])
+    if existe.size == 0:
+        run.to_zarr(archive, append_dim="init_time", consolidated=True)
+        return len(tiempos)
+    k = int(existe[0])
+    datos = run.drop_vars([v for v in run.variables if "init_time" not in run[v].dims or v == "init_time"])
+    datos.to_zarr(archive, region={"init_time": slice(k, k + 1)}, consolidated=True)
+    return k
+
+@profiled("archive", archivo="archive")
+def append_run(product, archive, init_time=None, leads=None, chunks=None):
+    """
+    Agrega una corrida terminada al archivo de corridas (init_time x lead_time): sólo se
+    escriben los chunks de esa corrida. Si la corrida ya estaba se reescribe en su lugar.
+    ----------
+    Parámetros:
+    product : str | xr.Dataset  Producto de la corrida ('{model}_{YYYYMMDDHH}_{prs|sfc}.nc' o dataset).
+    archive : str               Archivo de corridas ('.nc' o '.zarr'; ver archive_path).
+    init_time : str             Hora de inicio (default: la del nombre del producto o su primer tiempo).
+    leads : list                Eje de horas de pronóstico al crear el archivo (default: el de la
+                                corrida); las corridas más cortas quedan con NaN al final.
+    chunks : dict               Chunks por dimensión (default: CHUNKS, un chunk por corrida).
+    -------
+    Retorna:
+    int         Posición de la corrida en el eje init_time del archivo.
+    """
+    chunks = dict(CHUNKS, **(chunks or {}))
+    ds = product if isinstance(product, xr.Dataset) else xr.open_dataset(product)
+    try:
+        if init_time is None:
+            m = PATRON.match(os.path.basename(str(product))) if not isinstance(product, xr.Dataset) else None
+            init_time = pd.to_datetime(m.group("inicio"), format="%Y%m%d%H") if m else ds["time"].values.min()
+        os.makedirs(os.path.dirname(os.path.abspath(archive)), exist_ok=True)
+        with _bloqueo(archive):
+            if leads is None and os.path.exists(archive):
+                with xr.open_zarr(archive) if is_zarr(archive) else xr.open_dataset(archive) as actual:
+                    leads = actual["lead_time"].values
+            run = run_layout(ds, init_time, leads).load()
+            k = (_agrega_zarr if is_zarr(archive) else _agrega_netcdf)(archive, run, chunks)
+    finally:
+        if not isinstance(product, xr.Dataset):
+            ds.close()
+    print(f"Corrida {pd.Timestamp(init_time):%Y-%m-%d %HZ} agregada al archivo {archive}")
+    return k
+
+def archive_products(productos, archive_dir, zarr=False, solo_faltantes=False):
+    """
+    Agrega productos terminados ('{model}_{YYYYMMDDHH}_{prs|sfc}.nc|.zarr') a los archivos de
+    corridas de `archive_dir` (uno por modelo y producto, ver archive_path). Con
+    solo_faltantes=True se omiten las corridas que ya están en el archivo.
+    """
+    for path in productos:
+        m = PATRON.match(os.path.basename(str(path).rstrip("/")))
+        if not m:
+            print(f"{path}: nombre de producto no reconocido, no se archiva")
+            continue
+        archive = archive_path(archive_dir, m.group("modelo"), m.group("producto"), zarr)
+        inicio = pd.to_datetime(m.group("inicio"), format="%Y%m%d%H")
+        if solo_faltantes and os.path.exists(archive) and inicio in archived_runs(archive):
+            continue
+        fuente = xr.open_zarr(path) if is_zarr(path) else path
+        append_run(fuente, archive, init_time=inicio)
+
+def archived_runs(archive):
+    """Horas de inicio de las corridas completas del archivo, ordenadas."""
+    with open_archive(archive) as ds:
+        return pd.DatetimeIndex(ds["init_time"].values)
+
+def open_archive(archive, variables=None):
+    """
+    Abre el archivo de corridas ordenado por init_time, sin las corridas a medias, con la
+    coordenada valid_time (init_time + lead_time). Una serie por punto a lo largo de las
+    corridas lee pocos chunks: ds['t2m'].sel(latitude=-12.05, longitude=282.96, method='nearest').
+    """
+    ds = xr.open_zarr(archive) if is_zarr(archive) else xr.open_dataset(archive)
+    if variables is not None:
+        ds = ds[[variables] if isinstance(variables, str) else list(variables)]
+    ds = ds.isel(init_time=np.flatnonzero(~pd.isnull(ds["init_time"].values))).sortby("init_time")
+    valid = ds["init_time"].values[:, None] + (ds["lead_time"].values * 3600e9).astype("timedelta64[ns]")[None, :]
+    return ds.assign_coords(valid_time=(("init_time", "lead_time"), valid))
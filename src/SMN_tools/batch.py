@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import multiprocessing
+from glob import glob as gb
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from .run_driver import TIPOS
+from .pipeline import run_pipeline
+from .manifest import load_manifest
+
+# carpeta de cada corrida dentro de la ruta del modelo y archivos GRIB por extractor
+# (como en run_driver.find_leadtime_files)
+CARPETAS = {'ETA': '{yyyy}/{yyyy}{mm}/{fecha}{hh}', 'WRF': '{yyyy}{mm}/{fecha}{hh}'}
+PATRONES = {'ETA': 'latlon_*', 'WRF': 'WRFPRS_*'}
+
+# dominios que se corren (archivo 'lista' del repositorio). Por dominio:
+#   ruta        carpeta del modelo            nombre      prefijo de los productos (contiene ETA o WRF)
+#   extractor   'ETA' o 'WRF'                 carpeta     carpeta de la corrida (default: CARPETAS)
+#   patron      archivos GRIB (PATRONES)      tipos       variables a extraer (default: TIPOS)
+#   horas       horas de corrida              resolucion  km de grilla (menor = mayor prioridad)
+#   workers     procesos por corrida          mem_mb      memoria por proceso (MB)
+#   salida      carpeta de los productos relativa a --out
+#   streaming   escribe cada paso apenas se extrae (memoria constante; dominios km)
+DOMINIOS = {
+    'ETA22':   {'ruta': '/scratch/Datatemporal/SMN/data/regional/PERU_ETA22', 'nombre': 'PERU_ETA22',
+                'extractor': 'ETA', 'resolucion': 22, 'workers': 4, 'mem_mb': 1500},
+    'ETA32':   {'ruta': '/scratch/Datatemporal/SMN/data/regional/SUDAMERICA_ETA32', 'nombre': 'SUDAMERICA_ETA32',
+                'extractor': 'ETA', 'resolucion': 32, 'workers': 4, 'mem_mb': 1500},
+    'WRF33':   {'ruta': '/scratch/Datatemporal/SMN/data/regional/SUDAMERICA_WRF33', 'nombre': 'SUDAMERICA_WRF33',
+                'extractor': 'WRF', 'resolucion': 33, 'workers': 4, 'mem_mb': 1500},
+    'WRF22':   {'ruta': '/scratch/Datatemporal/SMN/data/regional/PERU_WRF22', 'nombre': 'PERU_WRF22',
+                'extractor': 'WRF', 'resolucion': 22, 'workers': 4, 'mem_mb': 1500},
+    'WRF5':    {'ruta': '/scratch/Datatemporal/SMN/data/regional/NPE5k_WRF/grib2', 'nombre': 'NPE5k_WRF',
+                'extractor': 'WRF', 'resolucion': 5, 'workers': 6, 'mem_mb': 4000, 'streaming': True},
+    'ETA10':   {'ruta': '/scratch/Datatemporal/SMN/data/regional/ETA10km', 'nombre': 'ETA10km',
+                'extractor': 'ETA', 'resolucion': 10, 'workers': 4, 'mem_mb': 3000},
+    'WRFCN1k': {'ruta': '/scratch/Datatemporal/SMN/data/regional/NCN1k_WRF/grib2', 'nombre': 'NCN1k_WRF',
+                'extractor': 'WRF', 'resolucion': 1, 'workers': 8, 'mem_mb': 8000, 'streaming': True},
+}
+DEFAULTS = {'horas': ['00', '06', '12', '18'], 'tipos': TIPOS, 'workers': 4, 'mem_mb': 2000,
+            'resolucion': 99, 'salida': '{nombre}/{fecha}{hh}', 'streaming': False}
+
+def read_lista(path):
+    """Lee un archivo con el formato de 'lista' ('DOMINIO: ruta' por línea) -> {dominio: ruta}."""
+    rutas = {}
+    with open(path) as f:
+        for linea in f:
+            linea = linea.split("#")[0].strip()
+            if ":" in linea:
+                dominio, ruta = linea.split(":", 1)
+                rutas[dominio.strip()] = ruta.strip().rstrip("/")
+    return rutas
+
+def load_config(config=None):
+    """
+    Configuración de los dominios: DOMINIOS, con los cambios de `config` (dict, JSON
+    {dominio: {opción: valor}} o archivo con el formato de 'lista' para cambiar rutas).
+    Un dominio nuevo debe indicar al menos 'ruta', 'nombre' y 'extractor'.
+    -------
+    Retorna:
+    dict        {dominio: configuración completa}
+    """
+    cambios = {}
+    if isinstance(config, dict):
+        cambios = config
+    elif config and str(config).endswith(".json"):
+        with open(config) as f:
+            cambios = json.load(f)
+    elif config:
+        cambios = {d: {'ruta': r} for d, r in read_lista(config).items()}
+
+    dominios = {}
+    for dominio in list(DOMINIOS) + [d for d in cambios if d not in DOMINIOS]:
+        cfg = {**DEFAULTS, **DOMINIOS.get(dominio, {}), **cambios.get(dominio, {})}
+        faltan = [k for k in ('ruta', 'nombre', 'extractor') if k not in cfg]
+        if faltan:
+            raise ValueError(f"Dominio '{dominio}': faltan opciones {faltan}")
+        if cfg['extractor'] not in CARPETAS:
+            raise ValueError(f"Dominio '{dominio}': extractor '{cfg['extractor']}' no existe (ETA o WRF)")
+        # el resto del paquete elige el extractor por el nombre del modelo
+        if cfg['extractor'] not in cfg['nombre']:
+            raise ValueError(f"Dominio '{dominio}': el nombre '{cfg['nombre']}' debe contener '{cfg['extractor']}'")
+        cfg.setdefault('carpeta', CARPETAS[cfg['extractor']])
+        cfg.setdefault('patron', PATRONES[cfg['extractor']])
+        dominios[dominio] = cfg
+    return dominios
+
+def run_files(cfg, fecha, hor):
+    """Archivos GRIB ordenados de una corrida según la configuración de su dominio."""
+    carpeta = cfg['carpeta'].format(yyyy=fecha[:4], mm=fecha[4:6], fecha=fecha, hh=hor)
+    files_pro = gb(os.path.join(cfg['ruta'], carpeta, cfg['patron']))
+    return [e for e in sorted(files_pro) if not any(x in e for x in ['idx', 'ctl'])]
+
+def plan_batch(dominios, fechas, out_dir, horas=None, reprocess=False):
+    """
+    Corridas a procesar (dominio × fecha × hora con archivos GRIB), ordenadas por prioridad:
+    primero los dominios de mayor resolución, luego por fecha. Sin reprocess se omiten
+    las corridas que ya tienen productos en su carpeta de salida y no están en su manifiesto;
+    las del manifiesto las omite run_pipeline si siguen vigentes.
+    """
+    trabajos = []
+    for dominio, cfg in dominios.items():
+        for fecha in fechas:
+            for hor in horas or cfg['horas']:
+                run_dir = os.path.join(out_dir, cfg['salida'].format(nombre=cfg['nombre'], dominio=dominio,
+                                                                     fecha=fecha, hh=hor))
+                # con manifiesto decide run_pipeline (rehace la corrida si cambiaron sus GRIB);
+                # productos sin manifiesto (versiones anteriores) se consideran terminados
+                if not reprocess and gb(os.path.join(run_dir, f"{cfg['nombre']}_{fecha}{hor}_*")) \
+                        and f"{cfg['nombre']}_{fecha}{hor}" not in load_manifest(run_dir):
+                    continue
+                files = run_files(cfg, fecha, hor)
+                if files:
+                    trabajos.append({'dominio': dominio, 'fecha': fecha, 'hor': hor, 'run_dir': run_dir,
+                                     'files': files, 'cfg': cfg})
+    return sorted(trabajos, key=lambda t: (t['cfg']['resolucion'], t['fecha'], t['hor']))
+
+def _corre(t, reprocess, streaming, opciones):
+    # una corrida en su propio proceso: netCDF-C/HDF5 no admiten llamadas simultáneas desde
+    # varios hilos, así que las corridas no pueden compartir un proceso
+    t0 = time.time()
+    salidas = run_pipeline(t['cfg']['nombre'], t['fecha'], t['hor'], t['run_dir'], t['cfg']['tipos'],
+                           workers=t['workers'], max_mem_mb=t['mem'] / t['workers'] if t['mem'] else None,
+                           files=t['files'], streaming=t['cfg']['streaming'] if streaming is None else streaming,
+                           incremental=not reprocess, **opciones)
+    print(f"[{t['dominio']} {t['fecha']}{t['hor']}] {len(salidas)} productos ({time.time() - t0:.1f} s)", flush=True)
+    return salidas
+
+def _memoria_total_mb():
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def run_batch(dominios, fecha_ini, fecha_fin, out_dir, horas=None, config=None, cpu=None, mem_mb=None,
+              reprocess=False, streaming=None, **opciones):
+    """
+    Procesa un rango de fechas de varios dominios a la vez (run_pipeline por corrida)
+    dentro de un presupuesto global de procesos y memoria. Las corridas se lanzan en
+    orden de prioridad (mayor resolución primero) apenas hay recursos para sus procesos;
+    cada corrida se ejecuta en un proceso propio y cada uno de sus procesos trabajadores
+    queda limitado a la memoria reservada para él (max_mem_mb).
+    ----------
+    Parámetros:
+    dominios : list     Dominios de la configuración (ej: ['WRF22', 'ETA22']; None: todos).
+    fecha_ini : str     Primera fecha 'YYYYMMDD'.
+    fecha_fin : str     Última fecha 'YYYYMMDD' (incluida).
+    out_dir : str       Carpeta base de los productos ('{out_dir}/{nombre}/{fecha}{hh}' por defecto).
+    horas : list        Horas de corrida (default: las de cada dominio).
+    config : str|dict   Cambios a la configuración (ver load_config).
+    cpu : int           Procesos en total (default: os.cpu_count()).
+    mem_mb : float      Memoria total en MB (default: 80% de la memoria física).
+    reprocess : bool    Vuelve a procesar corridas que ya tienen productos (default: False).
+    streaming : bool    Escritura paso a paso en todas las corridas (default: la de cada dominio).
+    opciones            Se pasan a run_pipeline (profile, backend, region, derived, single_pass,
+                        archive, catalog).
+    -------
+    Retorna:
+    dict        {(dominio, 'YYYYMMDDHH'): {'prs'|'sfc': ruta} o mensaje de error}
+    """
+    config = load_config(config)
+    faltan = [d for d in dominios or [] if d not in config]
+    if faltan:
+        raise ValueError(f"Dominios {faltan} no configurados; opciones: {list(config)}")
+    config = {d: config[d] for d in (dominios or config)}
+    fechas = [f"{d:%Y%m%d}" for d in pd.date_range(pd.to_datetime(fecha_ini, format="%Y%m%d"),
+                                                     pd.to_datetime(fecha_fin, format="%Y%m%d"), freq="D")]
+    trabajos = plan_batch(config, fechas, out_dir, horas, reprocess)
+    if not trabajos:
+        print("Sin corridas por procesar")
+        return {}
+
+    cpu = cpu or os.cpu_count() or 1
+    if mem_mb is None:
+        total = _memoria_total_mb()
+        mem_mb = 0.8 * total if total else None
+    for t in trabajos:
+        # procesos y memoria de la corrida, dentro del presupuesto global
+        t['workers'] = max(1, min(t['cfg']['workers'], cpu, len(t['files'])))
+        if mem_mb is not None:
+            t['workers'] = max(1, min(t['workers'], int(mem_mb // t['cfg']['mem_mb']) or 1))
+        t['mem'] = 0 if mem_mb is None else min(t['workers'] * t['cfg']['mem_mb'], mem_mb)
+    print(f"{len(trabajos)} corridas de {len(config)} dominios; presupuesto: {cpu} procesos"
+          + (f", {mem_mb:.0f} MB" if mem_mb is not None else ""))
+
+    libres = {'cpu': cpu, 'mem': mem_mb if mem_mb is not None else 0}
+    resultados, en_curso = {}, {}
+    pendientes = list(trabajos)
+    try:
+        while pendientes or en_curso:
+            # se lanza en orden de prioridad; una corrida que no cabe espera a que se liberen recursos
+            while pendientes and pendientes[0]['workers'] <= libres['cpu'] and \
+                    (mem_mb is None or pendientes[0]['mem'] <= libres['mem']):
+                t = pendientes.pop(0)
+                libres['cpu'] -= t['workers']
+                libres['mem'] -= t['mem']
+                # un proceso nuevo (spawn, sin estado HDF5 heredado) por corrida: si se cae sólo
+                # falla esa corrida
+                proceso = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+                en_curso[proceso.submit(_corre, t, reprocess, streaming, opciones)] = (t, proceso)
+            listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for fut in listos:
+                t, proceso = en_curso.pop(fut)
+                proceso.shutdown()
+                libres['cpu'] += t['workers']
+                libres['mem'] += t['mem']
+                clave = (t['dominio'], f"{t['fecha']}{t['hor']}")
+                try:
+                    resultados[clave] = fut.result() or "sin productos"
+                except Exception as e:
+                    resultados[clave] = f"{type(e).__name__}: {e}"
+                    print(f"[{t['dominio']} {t['fecha']}{t['hor']}] ERROR {resultados[clave]}")
+    finally:
+        for _, proceso in en_curso.values():
+            proceso.shutdown(cancel_futures=True)
+
+    fallas = [k for k, v in resultados.items() if isinstance(v, str)]
+    print(f"{len(resultados) - len(fallas)}/{len(resultados)} corridas procesadas")
+    return resultados
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import socket
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# tamaños de dominio (nx, ny): el de PERU_WRF22, uno intermedio y uno kilométrico
+TAMANOS = {
+    'chico': (93, 113),
+    'mediano': (400, 500),
+    'grande': (1000, 1200),
+}
+CASOS = ['extract_WRF', 'extract_ETA', 'make_structured', 'process_netcdf_files', 'merge_files']
+# variables de salida de extrac_WRF que usan process/merge (como el flujo de script/test_extrac.py)
+_DIMS = {
+    'prs': (['u', 'v'], ["time", "isobaricInhPa", "latitude", "longitude"]),
+    'sfc': (['tp', 't2m', 'r2m', 'prmsl', 'u10', 'v10'], ["time", "latitude", "longitude"]),
+}
+
+def version():
+    """Versión del código medido: `git describe` del repositorio, o la del paquete instalado."""
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty", "--tags"], cwd=carpeta,
+                              capture_output=True, text=True, check=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    try:
+        from importlib.metadata import version as version_paquete
+        return version_paquete("SMN_tools")
+    except Exception:
+        return "dev"
+
+def _memoria_mb():
+    # (RSS actual, RSS pico) del proceso; en Linux de /proc (VmHWM se reinicia con exec, ru_maxrss no)
+    try:
+        with open("/proc/self/status") as f:
+            campos = dict(linea.split(":", 1) for linea in f.read().splitlines() if ":" in linea)
+        return int(campos["VmRSS"].split()[0]) / 2**10, int(campos["VmHWM"].split()[0]) / 2**10
+    except (OSError, KeyError, ValueError):
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        pico = pico / 2**20 if sys.platform == "darwin" else pico / 2**10
+        return pico, pico
+
+def _prepara(datos_dir, tamano):
+    # corridas sintéticas WRF y ETA del tamaño y productos intermedios (se reutilizan entre casos)
+    from .synthetic_grib import make_run, run_path
+    nx, ny = TAMANOS[tamano]
+    archivos = {}
+    for modelo in ('WRF', 'ETA'):
+        model_name = f"SYN_{modelo}{nx}x{ny}"
+        carpeta = run_path(datos_dir, modelo, model_name, "20250101", "00")
+        existentes = sorted(f for f in glob.glob(os.path.join(carpeta, "*")) if not f.endswith(".tmp"))
+        archivos[modelo] = existentes or make_run(datos_dir, modelo, model_name, nx=nx, ny=ny)
+
+    intermedios = os.path.join(datos_dir, f"intermedios_{nx}x{ny}")
+    if not os.path.isdir(intermedios):
+        from .WRF_extrae import extrac_WRF
+        from .procesa_netcdf import process_netcdf_files
+        from .run_driver import TIPOS
+        tmp = intermedios + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(os.path.join(tmp, "pasos"))
+        for f in archivos['WRF']:
+            extrac_WRF(os.path.join(tmp, "pasos"), f, TIPOS)
+        os.makedirs(os.path.join(tmp, "series"))
+        for prefijo, (nombres, dims) in _DIMS.items():
+            for var in nombres:
+                pasos = sorted(glob.glob(os.path.join(tmp, "pasos", f"{var}_*.nc")))
+                copias = [shutil.copy(p, os.path.join(tmp, "series")) for p in pasos]
+                process_netcdf_files(copias, prefix_out=prefijo, new_dims=dims)
+                for c in copias:
+                    os.remove(c)
+        os.replace(tmp, intermedios)
+    archivos['pasos'] = sorted(glob.glob(os.path.join(intermedios, "pasos", "*_*.nc")))
+    archivos['series'] = sorted(glob.glob(os.path.join(intermedios, "series", "*_tmp_*.nc")))
+    return archivos
+
+def _ejecuta_caso(caso, archivos, salida):
+    # en un proceso nuevo (spawn): memoria y cachés de grilla/índices sin heredar
+    from .run_driver import TIPOS
+    from .WRF_extrae import extrac_WRF, make_structured
+    from .ETA_extrae import extrac_ETA
+    from .procesa_netcdf import process_netcdf_files
+    from .merge_netcdf import merge_files
+    os.environ["GRIB_INDEX_DIR"] = os.path.join(salida, "indices")   # sin inventarios previos
+    rss_base = _memoria_mb()[0]
+
+    if caso in ('extract_WRF', 'extract_ETA', 'make_structured'):
+        entradas = archivos['WRF' if caso != 'extract_ETA' else 'ETA']
+    elif caso == 'process_netcdf_files':
+        entradas = archivos['pasos']
+    else:
+        entradas = archivos['series']
+    mb_entrada = sum(os.path.getsize(f) for f in entradas) / 2**20
+
+    preparados = []
+    if caso == 'make_structured':
+        # sólo la reorganización (y la decodificación que hace .values); la lectura queda fuera
+        from .grib_scan import grib_opener
+        from .grid_geometry import grid_keys
+        from .WRF_extrae import FILTROS_WRF
+        for f in entradas:
+            abre = grib_opener(f, FILTROS_WRF)
+            for nombre in ('u', 't2m', 'tp'):
+                preparados.append((abre(nombre, decode_timedelta=False), 'isobaricInhPa' if nombre == 'u' else None,
+                                   grid_keys(f)))
+    elif caso == 'process_netcdf_files':
+        # copia de los pasos: process_netcdf_files escribe junto a sus entradas
+        os.makedirs(os.path.join(salida, "pasos"))
+        entradas = [shutil.copy(f, os.path.join(salida, "pasos")) for f in entradas]
+
+    t0, c0 = time.perf_counter(), time.process_time()
+    if caso == 'extract_WRF':
+        for f in entradas:
+            extrac_WRF(salida, f, TIPOS)
+    elif caso == 'extract_ETA':
+        for f in entradas:
+            extrac_ETA(salida, f, TIPOS)
+    elif caso == 'make_structured':
+        for ds, coord_z, grid in preparados:
+            make_structured(ds, list(ds.data_vars)[0], coord_z=coord_z, grid=grid)
+    elif caso == 'process_netcdf_files':
+        for prefijo, (nombres, dims) in _DIMS.items():
+            for var in nombres:
+                pasos = [f for f in entradas if os.path.basename(f).split("_")[0] == var]
+                process_netcdf_files(pasos, prefix_out=prefijo, new_dims=dims)
+    else:
+        for prefijo in _DIMS:
+            merge_files([f for f in entradas if os.path.basename(f).startswith(prefijo)],
+                        os.path.join(salida, f"SYN_{prefijo}.nc"), catalog=False)   # sólo la unión
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    rss = _memoria_mb()[1]
+    return {"wall_s": wall, "cpu_s": cpu, "archivos": len(entradas), "mb_entrada": mb_entrada,
+            "mb_s": mb_entrada / wall if wall > 0 else None,
+            "rss_base_mb": rss_base, "rss_pico_mb": rss, "rss_delta_mb": rss - rss_base}
+
+def run_benchmark(resultados, tamanos=('chico', 'mediano'), casos=None, repeticiones=1, datos_dir=None,
+                  etiqueta=None):
+    """
+    Mide el rendimiento de extrac_WRF, extrac_ETA, make_structured, process_netcdf_files y
+    merge_files sobre corridas sintéticas (synthetic_grib) de varios tamaños de dominio, sin
+    datos reales. Cada caso corre en un proceso nuevo: se mide el tiempo de reloj y de CPU, el
+    caudal (MB de entrada por segundo) y el RSS pico, también respecto al proceso con las
+    bibliotecas ya importadas (rss_delta_mb). Los inventarios GRIB se rehacen en cada caso.
+    ----------
+    Parámetros:
+    resultados : str       Archivo JSON lines al que se agregan las mediciones (una por caso).
+    tamanos : list         Claves de TAMANOS (ej. ['chico', 'grande']).
+    casos : list           Casos de CASOS (default: todos).
+    repeticiones : int     Veces que se mide cada caso.
+    datos_dir : str        Carpeta de las corridas sintéticas y los intermedios (se reutilizan;
+                           default: 'SMN_tools_bench' en el directorio temporal).
+    etiqueta : str         Versión con la que se guardan los resultados (default: version()).
+    -------
+    Retorna:
+    list        Mediciones (dicts) agregadas a `resultados`.
+    """
+    casos = CASOS if casos is None else casos
+    faltan = [c for c in casos if c not in CASOS] + [t for t in tamanos if t not in TAMANOS]
+    if faltan:
+        raise ValueError(f"{faltan} no existen; casos: {CASOS}, tamaños: {list(TAMANOS)}")
+    datos_dir = datos_dir or os.path.join(tempfile.gettempdir(), "SMN_tools_bench")
+    comunes = {"version": etiqueta or version(), "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "host": socket.gethostname(), "python": platform.python_version(),
+               "cpus": os.cpu_count()}
+    resultados = os.path.abspath(resultados)
+    os.makedirs(os.path.dirname(resultados), exist_ok=True)
+    contexto = multiprocessing.get_context("spawn")
+
+    mediciones = []
+    for tamano in tamanos:
+        archivos = _prepara(datos_dir, tamano)
+        nx, ny = TAMANOS[tamano]
+        for caso in casos:
+            for rep in range(repeticiones):
+                salida = tempfile.mkdtemp(prefix=f"{caso}_", dir=datos_dir)
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                        medicion = pool.submit(_ejecuta_caso, caso, archivos, salida).result()
+                    error = None
+                except Exception as e:
+                    medicion, error = {}, f"{type(e).__name__}: {e}"
+                finally:
+                    shutil.rmtree(salida, ignore_errors=True)
+                registro = {**comunes, "caso": caso, "tamano": tamano, "nx": nx, "ny": ny,
+                            "repeticion": rep, **medicion, "error": error}
+                with open(resultados, "a") as f:
+                    f.write(json.dumps(registro) + "\n")
+                mediciones.append(registro)
+                if error:
+                    print(f"{caso} {tamano}: ERROR {error}")
+                else:
+                    print(f"{caso} {tamano} ({nx}x{ny}): {medicion['wall_s']:.2f} s, "
+                          f"{medicion['mb_s']:.1f} MB/s, RSS pico {medicion['rss_pico_mb']:.0f} MB "
+                          f"(+{medicion['rss_delta_mb']:.0f})")
+    return mediciones
+
+def compare_benchmarks(resultados, base, nueva):
+    """
+    Compara dos versiones (columna 'version' o la etiqueta usada) de los resultados de
+    run_benchmark: mediana por caso y tamaño del tiempo de reloj y del RSS pico de cada una
+    y su razón nueva/base (< 1: la versión nueva es más rápida o usa menos memoria).
+    """
+    from .profiling import load_profile
+    df = load_profile(resultados)
+    df = df[df["error"].isna() & df["version"].isin([base, nueva])]
+    faltan = {base, nueva} - set(df["version"])
+    if faltan:
+        raise ValueError(f"Sin resultados de {sorted(faltan)} en {resultados}")
+    tabla = df.pivot_table(index=["caso", "tamano"], columns="version",
+                           values=["wall_s", "rss_pico_mb"], aggfunc="median")
+    comparacion = tabla.reindex(columns=[(m, v) for m in ("wall_s", "rss_pico_mb") for v in (base, nueva)])
+    comparacion.columns = [f"{m}_{'base' if v == base else 'nueva'}" for m, v in comparacion.columns]
+    comparacion["razon_wall"] = comparacion["wall_s_nueva"] / comparacion["wall_s_base"]
+    comparacion["razon_rss"] = comparacion["rss_pico_mb_nueva"] / comparacion["rss_pico_mb_base"]
+    return comparacion.reset_index()
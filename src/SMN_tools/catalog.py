@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+from glob import glob as gb
+import numpy as np
+import pandas as pd
+
+# catálogo de productos: $SMN_CATALOG o ~/.cache/SMN_tools/catalog.sqlite (SMN_CATALOG=0 lo desactiva)
+ENV = "SMN_CATALOG"
+# nombre de los productos: {model}_{YYYYMMDDHH}_{prs|sfc}.nc (o .zarr)
+PATRON = re.compile(r"^(?P<modelo>.+)_(?P<inicio>\d{10})_(?P<producto>[A-Za-z0-9]+)\.(nc|zarr)$")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS productos (
+    path TEXT PRIMARY KEY, modelo TEXT, producto TEXT, init_time TEXT,
+    lead_min REAL, lead_max REAL, valid_start TEXT, valid_end TEXT, n_tiempos INTEGER,
+    niveles TEXT, grilla TEXT, nlat INTEGER, nlon INTEGER,
+    lat_min REAL, lat_max REAL, lon_min REAL, lon_max REAL,
+    tamano INTEGER, mtime_ns INTEGER, checksum TEXT, registrado TEXT);
+CREATE TABLE IF NOT EXISTS variables (path TEXT, variable TEXT, PRIMARY KEY (path, variable));
+CREATE TABLE IF NOT EXISTS tiempos (path TEXT, valid_time TEXT, PRIMARY KEY (path, valid_time));
+CREATE INDEX IF NOT EXISTS productos_modelo ON productos (modelo, init_time);
+CREATE INDEX IF NOT EXISTS variables_variable ON variables (variable);
+CREATE INDEX IF NOT EXISTS tiempos_valid ON tiempos (valid_time);
+"""
+
+def catalog_path():
+    """Ruta del catálogo SQLite: $SMN_CATALOG o ~/.cache/SMN_tools/catalog.sqlite (None si está desactivado)."""
+    path = os.environ.get(ENV)
+    if path in ("0", "false", "no"):
+        return None
+    return path or os.path.join(os.path.expanduser("~"), ".cache", "SMN_tools", "catalog.sqlite")
+
+def _conecta(catalog=None):
+    path = catalog or catalog_path()
+    if path is None:
+        raise RuntimeError(f"Catálogo desactivado ({ENV}=0): indique la ruta del catálogo (catalog=...) "
+                           f"o defina {ENV}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # varios procesos (batch, watch) registran a la vez: WAL y espera por el lock
+    con = sqlite3.connect(path, timeout=60)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_ESQUEMA)
+    return con
+
+def _iso(t):
+    return pd.Timestamp(t).isoformat()
+
+def _tamano(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path) for f in fs)
+    return os.path.getsize(path)
+
+def _checksum(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def grid_fingerprint(lat, lon):
+    """Huella de la grilla de un producto (tamaño y coordenadas redondeadas a 1e-6 grados)."""
+    h = hashlib.sha1()
+    for eje in (lat, lon):
+        eje = np.round(np.asarray(eje, dtype="f8"), 6)
+        h.update(str(eje.shape).encode())
+        h.update(eje.tobytes())
+    return h.hexdigest()[:16]
+
+def describe_product(path):
+    """
+    Metadatos de catálogo de un producto NetCDF/Zarr (sin leer los campos): modelo, hora de
+    inicio, rango de horas de pronóstico, tiempos válidos, variables, niveles y grilla.
+    """
+    import xarray as xr
+    from .zarr_store import is_zarr
+    ds = xr.open_zarr(path) if is_zarr(path) else xr.open_dataset(path)
+    with ds:
+        tiempos = pd.to_datetime(ds["time"].values) if "time" in ds.coords else pd.DatetimeIndex([])
+        m = PATRON.match(os.path.basename(path.rstrip("/")))
+        if m:
+            modelo, producto = m.group("modelo"), m.group("producto")
+            inicio = pd.to_datetime(m.group("inicio"), format="%Y%m%d%H")
+        else:
+            modelo, producto = ds.attrs.get("source"), None
+            inicio = tiempos.min() if len(tiempos) else None
+        leads = (tiempos - inicio) / pd.Timedelta(hours=1) if inicio is not None and len(tiempos) else []
+        lat, lon = ds["latitude"].values, ds["longitude"].values
+        niveles = [float(z) for z in ds["isobaricInhPa"].values] if "isobaricInhPa" in ds.coords else []
+        return {
+            "modelo": modelo, "producto": producto, "init_time": _iso(inicio) if inicio is not None else None,
+            "lead_min": float(min(leads)) if len(leads) else None,
+            "lead_max": float(max(leads)) if len(leads) else None,
+            "valid_start": _iso(tiempos.min()) if len(tiempos) else None,
+            "valid_end": _iso(tiempos.max()) if len(tiempos) else None,
+            "n_tiempos": len(tiempos), "niveles": json.dumps(niveles),
+            "grilla": grid_fingerprint(lat, lon), "nlat": int(lat.size), "nlon": int(lon.size),
+            "lat_min": float(lat.min()), "lat_max": float(lat.max()),
+            "lon_min": float(lon.min()), "lon_max": float(lon.max()),
+            "variables": [v for v, da in ds.data_vars.items() if "time" in da.dims],
+            "tiempos": [_iso(t) for t in tiempos],
+        }
+
+def register_product(path, catalog=None, checksum=False):
+    """
+    Registra (o actualiza) un producto en el catálogo SQLite. Lo llaman run_pipeline y
+    watch_run al terminar una corrida (y merge_files con catalog=...); `catalog` es la ruta
+    del catálogo (None o True: $SMN_CATALOG). El sha1 del producto sólo se calcula con
+    checksum=True; si no, lo calcula product_checksum la primera vez que se pide.
+    Un error del catálogo no interrumpe la corrida.
+    -------
+    Retorna:
+    dict        Registro guardado, o None si el catálogo está desactivado o falló.
+    """
+    catalog = None if catalog is True else catalog
+    if catalog is None and catalog_path() is None:
+        return None
+    path = os.path.abspath(path)
+    try:
+        info = describe_product(path)
+        variables, tiempos = info.pop("variables"), info.pop("tiempos")
+        info.update(path=path, tamano=_tamano(path), mtime_ns=os.stat(path).st_mtime_ns,
+                    checksum=_checksum(path) if checksum and os.path.isfile(path) else None,
+                    registrado=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        con = _conecta(catalog)
+        with con:
+            con.execute(f"INSERT OR REPLACE INTO productos ({', '.join(info)}) VALUES ({', '.join('?' * len(info))})",
+                        list(info.values()))
+            con.execute("DELETE FROM variables WHERE path = ?", (path,))
+            con.execute("DELETE FROM tiempos WHERE path = ?", (path,))
+            con.executemany("INSERT INTO variables VALUES (?, ?)", [(path, v) for v in variables])
+            con.executemany("INSERT INTO tiempos VALUES (?, ?)", [(path, t) for t in tiempos])
+        con.close()
+        return dict(info, variables=variables)
+    except (sqlite3.Error, OSError, KeyError, ValueError) as e:
+        print(f"No se pudo registrar {path} en el catálogo: {e}")
+        return None
+
+def product_checksum(path, catalog=None):
+    """
+    sha1 de un producto registrado: el guardado en el catálogo si el archivo no cambió
+    desde entonces (mismo mtime); si no, se calcula y se guarda. None si no es un archivo.
+    """
+    path = os.path.abspath(path)
+    if not os.path.isfile(path):
+        return None
+    if catalog is None and catalog_path() is None:
+        return _checksum(path)
+    mtime = os.stat(path).st_mtime_ns
+    con = _conecta(catalog)
+    try:
+        fila = con.execute("SELECT checksum, mtime_ns FROM productos WHERE path = ?", (path,)).fetchone()
+        if fila and fila[0] and fila[1] == mtime:
+            return fila[0]
+        sha1 = _checksum(path)
+        if fila and fila[1] == mtime:
+            with con:
+                con.execute("UPDATE productos SET checksum = ? WHERE path = ?", (sha1, path))
+        return sha1
+    finally:
+        con.close()
+
+def index_products(carpetas, catalog=None, checksum=False):
+    """Registra los productos {model}_{YYYYMMDDHH}_{prs|sfc}.nc/.zarr ya existentes bajo `carpetas`."""
+    carpetas = [carpetas] if isinstance(carpetas, str) else carpetas
+    _conecta(catalog).close()   # catálogo desactivado: error claro antes de recorrer las carpetas
+    paths = sorted({p for c in carpetas for ext in ("nc", "zarr")
+                    for p in gb(os.path.join(c, "**", f"*_??????????_*.{ext}"), recursive=True)
+                    if PATRON.match(os.path.basename(p))})
+    n = sum(register_product(p, catalog, checksum) is not None for p in paths)
+    print(f"{n}/{len(paths)} productos registrados en {catalog or catalog_path()}")
+    return n
+
+def find_products(modelo=None, producto=None, variables=None, valid_time=None, init_time=None,
+                  desde=None, hasta=None, nivel=None, grilla=None, catalog=None, tabla=False):
+    """
+    Busca productos en el catálogo sin abrir ningún NetCDF.
+    ----------
+    Parámetros:
+    modelo : str | list     Modelo/dominio (ej: 'PERU_WRF22').
+    producto : str          'sfc' o 'prs'.
+    variables : str | list  Variables que el producto debe tener todas (ej: 'tp').
+    valid_time : str        Tiempo válido que el producto debe tener (ej: '2025-01-01T12').
+    init_time : str         Hora de inicio de la corrida.
+    desde, hasta : str      Rango de horas de inicio (inclusive).
+    nivel : float           Nivel de presión que el producto debe tener (hPa).
+    grilla : str            Huella de grilla (grid_fingerprint).
+    tabla : bool            Retorna un pandas.DataFrame con los metadatos en lugar de las rutas.
+    -------
+    Retorna:
+    list        Rutas de los productos, ordenadas por modelo y hora de inicio (o DataFrame).
+    """
+    condiciones, valores = [], []
+    def agrega(sql, *vals):
+        condiciones.append(sql)
+        valores.extend(vals)
+    if modelo is not None:
+        modelos = [modelo] if isinstance(modelo, str) else list(modelo)
+        agrega(f"p.modelo IN ({', '.join('?' * len(modelos))})", *modelos)
+    if producto is not None:
+        agrega("p.producto = ?", producto)
+    for v in [variables] if isinstance(variables, str) else variables or []:
+        agrega("EXISTS (SELECT 1 FROM variables v WHERE v.path = p.path AND v.variable = ?)", v)
+    if valid_time is not None:
+        agrega("EXISTS (SELECT 1 FROM tiempos t WHERE t.path = p.path AND t.valid_time = ?)", _iso(valid_time))
+    if init_time is not None:
+        agrega("p.init_time = ?", _iso(init_time))
+    if desde is not None:
+        agrega("p.init_time >= ?", _iso(desde))
+    if hasta is not None:
+        agrega("p.init_time <= ?", _iso(hasta))
+    if grilla is not None:
+        agrega("p.grilla = ?", grilla)
+    sql = "SELECT p.* FROM productos p" + (" WHERE " + " AND ".join(condiciones) if condiciones else "")
+    con = _conecta(catalog)
+    try:
+        df = pd.read_sql_query(sql + " ORDER BY p.modelo, p.init_time, p.producto", con, params=valores)
+        if tabla:
+            variables_por = pd.read_sql_query("SELECT path, variable FROM variables", con)
+    finally:
+        con.close()
+    if nivel is not None:
+        df = df[[float(nivel) in json.loads(n or "[]") for n in df["niveles"]]]
+    if not tabla:
+        return df["path"].tolist()
+    df["variables"] = df["path"].map(variables_por.groupby("path")["variable"].apply(list))
+    return df.reset_index(drop=True)
+
+def open_products(variables=None, valid_time=None, catalog=None, **filtros):
+    """
+    Abre como un solo xr.Dataset los productos que cumplen los filtros de find_products:
+    sólo las `variables` pedidas y, con `valid_time`, sólo ese tiempo de cada corrida. Las
+    corridas se apilan en la dimensión 'init_time' (tiempos válidos unidos con NaN).
+    """
+    import xarray as xr
+    from .zarr_store import is_zarr
+    paths = find_products(variables=variables, valid_time=valid_time, catalog=catalog, **filtros)
+    if not paths:
+        raise FileNotFoundError(f"Sin productos en el catálogo para {dict(filtros, variables=variables, valid_time=valid_time)}")
+    info = find_products(variables=variables, valid_time=valid_time, catalog=catalog, tabla=True, **filtros)
+    datasets = []
+    for path in paths:
+        ds = xr.open_zarr(path) if is_zarr(path) else xr.open_dataset(path)
+        if variables is not None:
+            ds = ds[[variables] if isinstance(variables, str) else list(variables)]
+        if valid_time is not None:
+            ds = ds.sel(time=[pd.Timestamp(valid_time)])
+        datasets.append(ds)
+    inicios = pd.to_datetime(info.set_index("path").loc[paths, "init_time"].values)
+    if len(datasets) == 1:
+        return datasets[0].expand_dims(init_time=inicios)
+    return xr.concat(datasets, dim=pd.Index(inicios, name="init_time"), join="outer",
+                     coords="minimal", compat="override")
+
+def prune_catalog(catalog=None):
+    """
+    Quita del catálogo los productos que ya no existen y vuelve a registrar los que
+    cambiaron desde que se registraron. Retorna las rutas quitadas.
+    """
+    con = _conecta(catalog)
+    try:
+        filas = con.execute("SELECT path, mtime_ns FROM productos").fetchall()
+        borrados = [p for p, _ in filas if not os.path.exists(p)]
+        with con:
+            for tabla in ("productos", "variables", "tiempos"):
+                con.executemany(f"DELETE FROM {tabla} WHERE path = ?", [(p,) for p in borrados])
+    finally:
+        con.close()
+    for p, mtime in filas:
+        if p not in borrados and os.stat(p).st_mtime_ns != mtime:
+            register_product(p, catalog)
+    return borrados
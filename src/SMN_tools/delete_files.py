@@ -5,7 +5,8 @@ import os
 
 def clean_outdir(outdir: str):
     """
-    Elimina todos los archivos .nc dentro de un directorio de salida.
+    Elimina todos los archivos .nc dentro de un directorio de salida (y su manifiesto, ver
+    manifest.py). Con run_extraction/run_pipeline no hace falta: rehacen sólo lo desactualizado.
     Parámetros
     ----------
     outdir : str        Ruta de la carpeta donde se eliminarán los NetCDF.
@@ -13,7 +14,7 @@ def clean_outdir(outdir: str):
     if not os.path.exists(outdir):
         return
     for f in os.listdir(outdir):
-        if f.endswith(".nc"):
+        if f.endswith(".nc") or f == ".SMN_tools_manifest.json":
             file_path = os.path.join(outdir, f)
             try:
                 os.remove(file_path)
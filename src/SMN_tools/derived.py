@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import netCDF4 as nc
+from .append_netcdf import _n_validos
+from .profiling import profiled
+
+# constantes de Magnus (Alduchov y Eskridge 1996) para la humedad relativa
+MAGNUS_A = 17.625
+MAGNUS_B = 243.04
+
+# cada función calcula un paso: escribe en `out` con ufuncs in situ y usa a lo más el
+# arreglo auxiliar `tmp` (mismo tamaño que un paso, reservado una vez por variable)
+def _velocidad(out, tmp, u, v):
+    np.hypot(u, v, out=out)
+
+def _direccion(out, tmp, u, v):
+    # dirección de procedencia (convención meteorológica): 0 = norte, 90 = este
+    np.arctan2(u, v, out=out)
+    np.degrees(out, out=out)
+    out += 180.0
+    np.mod(out, 360.0, out=out)
+
+def _humedad(out, tmp, t, td):
+    # HR = 100 exp(a·td/(b+td) - a·t/(b+t)), t y td en °C; como a·x/(b+x) = a - a·b/(b+x),
+    # el exponente es a·b/(b+t) - a·b/(b+td) y sólo hace falta un auxiliar
+    ab = MAGNUS_A * MAGNUS_B
+    np.add(td, MAGNUS_B - 273.15, out=out)
+    np.divide(ab, out, out=out)
+    np.add(t, MAGNUS_B - 273.15, out=tmp)
+    np.divide(ab, tmp, out=tmp)
+    np.subtract(tmp, out, out=out)
+    np.exp(out, out=out)
+    out *= 100.0
+    np.minimum(out, 100.0, out=out)
+
+def _kelvin(out, tmp, t):
+    np.subtract(t, 273.15, out=out)
+
+def _hectopascal(out, tmp, p):
+    np.divide(p, 100.0, out=out)
+
+def _intervalo(out, tmp, acumulado, anterior):
+    # precipitación del intervalo; sin paso anterior, la acumulada desde el inicio
+    if anterior is None:
+        np.copyto(out, acumulado)
+    else:
+        np.subtract(acumulado, anterior, out=out)
+    np.maximum(out, 0.0, out=out)   # ruido de redondeo en las acumuladas
+
+# variables derivadas: nombre -> (variables de entrada, función por paso, atributos CF)
+DERIVADAS = {
+    'ws10':      (('u10', 'v10'), _velocidad, {'long_name': '10 metre wind speed', 'units': 'm s-1',
+                                               'standard_name': 'wind_speed'}),
+    'wd10':      (('u10', 'v10'), _direccion, {'long_name': '10 metre wind direction', 'units': 'degree',
+                                               'standard_name': 'wind_from_direction'}),
+    'ws':        (('u', 'v'), _velocidad, {'long_name': 'wind speed', 'units': 'm s-1',
+                                           'standard_name': 'wind_speed'}),
+    'wd':        (('u', 'v'), _direccion, {'long_name': 'wind direction', 'units': 'degree',
+                                           'standard_name': 'wind_from_direction'}),
+    'rh2m':      (('t2m', 'd2m'), _humedad, {'long_name': '2 metre relative humidity (Magnus)', 'units': '%',
+                                             'standard_name': 'relative_humidity'}),
+    't2m_c':     (('t2m',), _kelvin, {'long_name': '2 metre temperature', 'units': 'degC',
+                                      'standard_name': 'air_temperature'}),
+    'd2m_c':     (('d2m',), _kelvin, {'long_name': '2 metre dewpoint temperature', 'units': 'degC',
+                                      'standard_name': 'dew_point_temperature'}),
+    'prmsl_hpa': (('prmsl',), _hectopascal, {'long_name': 'pressure reduced to MSL', 'units': 'hPa',
+                                             'standard_name': 'air_pressure_at_mean_sea_level'}),
+    'tp_int':    (('tp',), _intervalo, {'long_name': 'precipitation since the previous step', 'units': 'mm',
+                                        'standard_name': 'precipitation_amount'}),
+}
+# derivadas que además reciben el paso anterior de su entrada
+DE_INTERVALO = {'tp_int'}
+
+def get_derived(derived):
+    """Nombres de variables derivadas: lista de DERIVADAS, 'todas'/True (todas) o None (ninguna)."""
+    if derived is None or derived is False:
+        return []
+    if derived is True or derived == 'todas' or list(derived) == ['todas']:
+        return list(DERIVADAS)
+    faltan = [d for d in derived if d not in DERIVADAS]
+    if faltan:
+        raise ValueError(f"Variables derivadas {faltan} no existen; opciones: {list(DERIVADAS)}")
+    return list(derived)
+
+def _calcula(nombre, campos, anterior=None):
+    # recorre los pasos (eje 0) y escribe cada uno en su lugar del arreglo de salida
+    entradas, funcion, attrs = DERIVADAS[nombre]
+    out = np.empty(campos[0].shape, dtype="f4")
+    tmp = np.empty(campos[0].shape[1:], dtype="f4")
+    for i in range(out.shape[0]):
+        paso = [c[i] for c in campos]
+        if nombre in DE_INTERVALO:
+            paso.append(campos[0][i - 1] if i > 0 else anterior)
+        funcion(out[i], tmp, *paso)
+    return out
+
+@profiled("derived")
+def add_derived(ds, derived, time_dim="time"):
+    """
+    Agrega al dataset las variables derivadas pedidas cuyas entradas están presentes
+    (las demás se omiten), calculadas paso a paso sin arreglos temporales intermedios.
+    El primer paso de 'tp_int' es la acumulada desde el inicio (ver fix_intervals).
+    ----------
+    Parámetros:
+    ds : xr.Dataset         Producto o variable en memoria (dimensión time_dim primero).
+    derived : list | str    Variables de DERIVADAS (ver get_derived).
+    -------
+    Retorna:
+    xr.Dataset      El mismo dataset con las variables derivadas agregadas.
+    """
+    for nombre in get_derived(derived):
+        entradas, funcion, attrs = DERIVADAS[nombre]
+        if nombre in ds.data_vars or not all(e in ds.data_vars for e in entradas):
+            continue
+        dims = ds[entradas[0]].transpose(time_dim, ...).dims
+        campos = [ds[e].transpose(*dims).values for e in entradas]
+        ds[nombre] = xr.Variable(dims, _calcula(nombre, campos), attrs)
+    return ds
+
+def fix_intervals(output_file, tiempos, time_dim="time"):
+    """
+    Recalcula en un producto ya escrito (NetCDF o Zarr) las variables de intervalo
+    ('tp_int') de los pasos recién escritos y de los que les siguen, con el paso
+    anterior que realmente tiene el producto: publicar pasos fuera de orden o en
+    paralelo deja el producto igual que si se hubiera escrito completo.
+    -------
+    Retorna:
+    xr.Dataset | None       Pasos recalculados (para actualizar sus estadísticos).
+    """
+    from .zarr_store import is_zarr
+    tiempos = pd.DatetimeIndex(tiempos)
+    if len(tiempos) == 0:
+        return None
+    if is_zarr(output_file):
+        return _fix_intervals_zarr(output_file, tiempos, time_dim)
+    corregidos = {}
+    with nc.Dataset(output_file, "a") as dst:
+        tvar = dst.variables[time_dim]
+        _, numeros = _n_validos(tvar)
+        eje = pd.DatetimeIndex(nc.num2date(numeros, tvar.units, getattr(tvar, "calendar", "standard"),
+                                           only_use_cftime_datetimes=False, only_use_python_datetimes=True))
+        ks = sorted({k + d for k in eje.get_indexer(tiempos) if k >= 0 for d in (0, 1) if k + d < len(eje)})
+        for nombre in DE_INTERVALO:
+            entrada = DERIVADAS[nombre][0][0]
+            if nombre not in dst.variables or entrada not in dst.variables:
+                continue
+            acc, var = dst.variables[entrada], dst.variables[nombre]
+            lee = lambda k: np.ma.filled(acc[k].astype("f4"), np.nan)
+            campos = []
+            for k in ks:
+                out = _calcula(nombre, [lee(k)[None]], lee(k - 1) if k > 0 else None)[0]
+                var[k] = np.ma.masked_invalid(out)
+                campos.append(out)
+            dims = (time_dim,) + var.dimensions[1:]
+            corregidos[nombre] = xr.Variable(dims, np.stack(campos), DERIVADAS[nombre][2])
+        if not corregidos:
+            return None
+        return xr.Dataset(corregidos, coords={time_dim: eje[ks].values})
+
+def _fix_intervals_zarr(store, tiempos, time_dim):
+    with xr.open_zarr(store, consolidated=False) as ds:
+        eje = pd.DatetimeIndex(ds[time_dim].values)
+        ks = sorted({k + d for k in eje.get_indexer(tiempos) if k >= 0 for d in (0, 1) if k + d < len(eje)})
+        nombres = [n for n in DE_INTERVALO if n in ds.data_vars and DERIVADAS[n][0][0] in ds.data_vars]
+        if not nombres:
+            return None
+        corregidos = {}
+        for nombre in nombres:
+            acc = ds[DERIVADAS[nombre][0][0]]
+            campos = [_calcula(nombre, [acc.isel({time_dim: [k]}).values],
+                               acc.isel({time_dim: k - 1}).values if k > 0 else None)[0] for k in ks]
+            corregidos[nombre] = xr.Variable(acc.dims, np.stack(campos), DERIVADAS[nombre][2])
+    salida = xr.Dataset(corregidos, coords={time_dim: eje[ks].values})
+    for i, k in enumerate(ks):
+        salida.drop_vars(time_dim).isel({time_dim: [i]}).to_zarr(store, region={time_dim: slice(k, k + 1)},
+                                                                   consolidated=False)
+    return salida
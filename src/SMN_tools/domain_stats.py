@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import xarray as xr
+from .zarr_store import is_zarr
+from .catalog import PATRON
+from .profiling import profiled
+
+# umbrales de excedencia por variable (valor > umbral); se cambian con `thresholds`
+UMBRALES = {'tp': [1, 10, 50], 'tp_int': [1, 10, 50], 'ws10': [10, 15, 20]}
+# cuantiles (%) estimados con el histograma de cada paso
+CUANTILES = [5, 50, 95, 99]
+# valores máximos leídos a la vez por tarea (bloques de filas): memoria acotada en dominios de 1 km
+BLOQUE = 1 << 20
+# clases del histograma (se duplica su ancho cuando aparecen valores fuera del rango)
+CLASES = 2048
+
+class Acumulador:
+    """
+    Estadísticos de un campo en una sola pasada por bloques: n, min, max, suma, media y
+    varianza (Welford, combinando bloques con la fórmula de Chan), conteos sobre umbrales e
+    histograma de rango adaptable para los cuantiles.
+    """
+    def __init__(self, umbrales=(), clases=CLASES):
+        self.n, self.media, self.m2, self.suma = 0, 0.0, 0.0, 0.0
+        self.min, self.max = np.inf, -np.inf
+        self.en_min = 0   # valores iguales al mínimo (ej. precipitación 0): cuantiles exactos ahí
+        self.umbrales = list(umbrales)
+        self.sobre = [0] * len(self.umbrales)
+        self.clases, self.inicio, self.ancho, self.cuentas = clases, None, None, None
+
+    def add(self, valores):
+        v = np.asarray(valores, dtype="f8").ravel()
+        v = v[np.isfinite(v)]
+        if v.size == 0:
+            return self
+        nb, mb = v.size, float(v.mean())
+        m2b = float(np.square(v - mb).sum())
+        n = self.n + nb
+        delta = mb - self.media
+        self.media += delta * nb / n
+        self.m2 += m2b + delta * delta * self.n * nb / n
+        self.n = n
+        self.suma += float(v.sum())
+        vmin, vmax = float(v.min()), float(v.max())
+        if vmin <= self.min:
+            self.en_min = (self.en_min if vmin == self.min else 0) + int(np.count_nonzero(v == vmin))
+        self.min, self.max = min(self.min, vmin), max(self.max, vmax)
+        for i, u in enumerate(self.umbrales):
+            self.sobre[i] += int(np.count_nonzero(v > u))
+        self._histograma(v, vmin, vmax)
+        return self
+
+    def _histograma(self, v, vmin, vmax):
+        if self.cuentas is None:
+            self.inicio = vmin
+            self.ancho = (vmax - vmin) / self.clases or max(abs(vmin) * 1e-6, 1e-12)
+            self.cuentas = np.zeros(self.clases, dtype="i8")
+        mitad = self.clases // 2
+        # se duplica el ancho de las clases (sumándolas de a pares) hasta cubrir el bloque
+        while vmin < self.inicio or vmax >= self.inicio + self.clases * self.ancho:
+            pares = self.cuentas.reshape(mitad, 2).sum(axis=1)
+            if vmin < self.inicio:
+                self.inicio -= self.clases * self.ancho
+                self.cuentas = np.concatenate([np.zeros(mitad, dtype="i8"), pares])
+            else:
+                self.cuentas = np.concatenate([pares, np.zeros(mitad, dtype="i8")])
+            self.ancho *= 2
+        idx = np.minimum(((v - self.inicio) / self.ancho).astype("i8"), self.clases - 1)
+        self.cuentas += np.bincount(idx, minlength=self.clases)
+
+    def quantile(self, q):
+        """Cuantil q (0-100) interpolado dentro de la clase del histograma."""
+        if not self.n:
+            return np.nan
+        objetivo = q / 100 * self.n
+        if objetivo <= self.en_min:
+            return self.min
+        acumulado = np.cumsum(self.cuentas)
+        k = int(np.searchsorted(acumulado, objetivo))
+        k = min(k, self.clases - 1)
+        previo = acumulado[k - 1] if k else 0
+        fraccion = (objetivo - previo) / self.cuentas[k] if self.cuentas[k] else 0.0
+        return float(np.clip(self.inicio + (k + fraccion) * self.ancho, self.min, self.max))
+
+    def result(self, cuantiles=CUANTILES):
+        """Diccionario de la fila del resumen."""
+        if not self.n:
+            return {"n": 0}
+        res = {"n": self.n, "min": self.min, "max": self.max, "mean": self.media,
+               "std": float(np.sqrt(self.m2 / self.n)), "sum": self.suma}
+        for q in cuantiles:
+            res[f"p{q:02d}"] = self.quantile(q)
+        for u, c in zip(self.umbrales, self.sobre):
+            res[f"gt_{u:g}"] = c
+            res[f"frac_gt_{u:g}"] = c / self.n
+        return res
+
+def _abre(product):
+    return xr.open_zarr(product) if is_zarr(product) else xr.open_dataset(product)
+
+def _inicio(product, ds):
+    m = PATRON.match(os.path.basename(str(product).rstrip("/")))
+    if m:
+        return pd.to_datetime(m.group("inicio"), format="%Y%m%d%H")
+    return pd.Timestamp(ds["time"].values.min())
+
+@profiled("domain_stats", archivo="product")
+def _estadisticos_tarea(product, var, nivel, umbrales, cuantiles, bloque):
+    # una variable (y nivel) de un producto, paso por paso y bloque de filas por bloque de filas
+    filas = []
+    with _abre(product) as ds:
+        da = ds[var]
+        if nivel is not None:
+            da = da.sel({da.dims[1]: nivel})
+        inicio = _inicio(product, ds)
+        ny, nx = da.shape[-2:]
+        paso_filas = max(1, bloque // max(nx, 1))
+        for i, t in enumerate(da["time"].values):
+            acc = Acumulador(umbrales)
+            campo = da.isel(time=i)
+            for j in range(0, ny, paso_filas):
+                acc.add(campo.isel({campo.dims[-2]: slice(j, j + paso_filas)}).values)
+            filas.append({"producto": os.path.basename(str(product).rstrip("/")), "variable": var,
+                          "nivel": nivel, "time": pd.Timestamp(t),
+                          "lead": (pd.Timestamp(t) - inicio) / pd.Timedelta(hours=1),
+                          **acc.result(cuantiles)})
+    return filas
+
+def domain_stats(products, variables=None, thresholds=None, quantiles=None, workers=None, block=BLOQUE):
+    """
+    Estadísticos de dominio por variable, nivel y hora de pronóstico de los productos
+    'sfc'/'prs' (merge_files, process_netcdf_files): n, min, max, media, desviación estándar,
+    suma (ej. precipitación acumulada en el dominio), cuantiles y conteos sobre umbrales.
+    Una sola pasada por bloques de a lo más `block` valores (memoria acotada aun en dominios
+    de 1 km); las variables y niveles se reparten en un pool de procesos.
+    ----------
+    Parámetros:
+    products : str | list   Productos (NetCDF o Zarr).
+    variables : list        Variables (default: todas las que tienen dimensión 'time').
+    thresholds : dict       {variable: [umbrales]} para los conteos 'gt_*' (default: UMBRALES).
+    quantiles : list        Cuantiles en % (default: CUANTILES), estimados con un histograma.
+    workers : int           Procesos (default: os.cpu_count()).
+    block : int             Valores leídos a la vez por proceso (default: BLOQUE).
+    -------
+    Retorna:
+    pandas.DataFrame        Una fila por producto, variable, nivel y paso.
+    """
+    if isinstance(products, (str, os.PathLike)):
+        products = [products]
+    thresholds = UMBRALES if thresholds is None else thresholds
+    quantiles = CUANTILES if quantiles is None else quantiles
+    tareas = []
+    for product in products:
+        with _abre(product) as ds:
+            for var, da in ds.data_vars.items():
+                if (variables is not None and var not in variables) or "time" not in da.dims:
+                    continue
+                niveles = [None] if da.ndim == 3 else [float(z) for z in da[da.dims[1]].values]
+                for nivel in niveles:
+                    tareas.append((product, var, nivel, thresholds.get(var, []), quantiles, block))
+    if not tareas:
+        return pd.DataFrame()
+
+    workers = min(workers or os.cpu_count() or 1, len(tareas))
+    print(f"{len(tareas)} variables/niveles en {len(products)} productos, {workers} procesos")
+    filas = []
+    if workers == 1:
+        for t in tareas:
+            filas.extend(_estadisticos_tarea(*t))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for resultado in pool.map(_estadisticos_tarea, *zip(*tareas)):
+                filas.extend(resultado)
+    return pd.DataFrame(filas)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+from .profiling import profiled
+from .domain_stats import Acumulador
+
+# percentiles guardados por paso (nodos del resumen de cuantiles; se combinan entre pasos)
+NODOS = [0, 1, 2, 5, 10, 25, 50, 75, 90, 95, 98, 99, 100]
+# percentiles de la corrida guardados como atributos de cada variable
+PERCENTILES = [2, 50, 98]
+
+def step_stats(valores):
+    """
+    Estadísticos de un campo (un paso): n, min, max, media y percentiles (NODOS) del
+    histograma de todos los puntos (domain_stats.Acumulador): error a lo más de un ancho
+    de clase, (max - min) / CLASES, sin importar el tamaño del dominio.
+    """
+    acc = Acumulador().add(valores)
+    if not acc.n:
+        return {"n": 0}
+    return {"n": acc.n, "min": acc.min, "max": acc.max, "mean": acc.media,
+            "q": [acc.quantile(p) for p in NODOS]}
+
+def _claves(da):
+    # (clave, selector) por variable y, si tiene niveles, por nivel ('u' y 'u_850', como en stations)
+    yield da.name, {}
+    if da.ndim == 4:
+        nivel = da.dims[1]
+        for z in da[nivel].values:
+            yield f"{da.name}_{int(z) if float(z).is_integer() else z}", {nivel: z}
+
+@profiled("stats")
+def compute_stats(ds, time_dim="time"):
+    """
+    Estadísticos por variable (y por nivel) y por paso de un dataset ya cargado.
+    -------
+    Retorna:
+    dict        {clave: {'YYYY-MM-DDTHH:MM:SS': step_stats}}
+    """
+    tabla = {}
+    tiempos = [pd.Timestamp(t).isoformat() for t in ds[time_dim].values]
+    for var, da in ds.data_vars.items():
+        if time_dim not in da.dims:
+            continue
+        da = da.transpose(time_dim, ...)
+        for clave, sel in _claves(da):
+            valores = (da.sel(sel) if sel else da).values
+            tabla[clave] = {t: step_stats(valores[i]) for i, t in enumerate(tiempos)}
+    return tabla
+
+def summarize(pasos):
+    """
+    Combina los estadísticos de varios pasos: min, max, media ponderada y percentiles
+    (PERCENTILES) de la mezcla de las distribuciones por paso (interpolando sus NODOS).
+    """
+    pasos = [p for p in pasos if p.get("n")]
+    if not pasos:
+        return {}
+    n = np.array([p["n"] for p in pasos], dtype="f8")
+    res = {"n": int(n.sum()), "min": min(p["min"] for p in pasos), "max": max(p["max"] for p in pasos),
+           "mean": float(np.dot(n, [p["mean"] for p in pasos]) / n.sum())}
+    x = np.unique(np.concatenate([p["q"] for p in pasos]))
+    cdf = sum(w * np.interp(x, p["q"], NODOS, left=0, right=100) for w, p in zip(n, pasos)) / n.sum()
+    for pc in PERCENTILES:
+        res[f"p{pc:02d}"] = float(np.interp(pc, cdf, x))
+    return res
+
+def stats_path(output_file):
+    """Tabla de estadísticos de un producto: '{output_file}.stats.json'."""
+    return f"{str(output_file).rstrip('/')}.stats.json"
+
+def load_stats(product):
+    """
+    Lee la tabla de estadísticos de un producto.
+    -------
+    Retorna:
+    dict        {'pasos': {clave: {tiempo: step_stats}}, 'resumen': {clave: summarize}} o {} si no existe.
+    """
+    try:
+        with open(stats_path(product)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_stats(output_file, tabla, append=False):
+    """
+    Guarda la tabla de estadísticos por paso de un producto (escritura atómica). Con
+    append=True se combina con los pasos ya guardados (un paso repetido se reemplaza).
+    -------
+    Retorna:
+    dict        Resumen de la corrida por clave (ver summarize).
+    """
+    pasos = load_stats(output_file).get("pasos", {}) if append else {}
+    for clave, por_paso in tabla.items():
+        # pasos ordenados por tiempo: el resumen no depende del orden de publicación
+        pasos[clave] = dict(sorted({**pasos.get(clave, {}), **por_paso}.items()))
+    resumen = {clave: summarize(por_paso.values()) for clave, por_paso in pasos.items()}
+
+    path = stats_path(output_file)
+    tmp = None
+    try:   # escritura atómica, como el inventario GRIB
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp_", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"pasos": pasos, "resumen": resumen}, f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"No se pudo guardar la tabla de estadísticos de {output_file}: {e}")
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+    return resumen
+
+def stats_attrs(resumen, dims=None, shape=None, units=None):
+    """
+    Atributos 'stats_*' de una variable a partir de su resumen (min, max, mean, pNN). Con
+    dims/shape/units se guarda además la forma del arreglo al que corresponden (stats_dims,
+    stats_shape, stats_units): un recorte o una conversión de unidades ya no coincide con ellos.
+    """
+    attrs = {f"stats_{k}": v for k, v in resumen.items() if k != "n"}
+    if dims is not None:
+        attrs.update(stats_dims=" ".join(dims), stats_shape=[int(x) for x in shape], stats_units=str(units or ""))
+    return attrs
+
+def drop_stats(da):
+    """Quita los atributos 'stats_*' (arreglos derivados o convertidos: ya no describen sus datos)."""
+    da.attrs = {a: v for a, v in da.attrs.items() if not a.startswith("stats_")}
+    return da
+
+def annotate(ds, resumen):
+    """Copia el resumen de cada variable a sus atributos 'stats_*' (en memoria, antes de escribir)."""
+    for var, da in ds.data_vars.items():
+        if resumen.get(var):
+            da.attrs.update(stats_attrs(resumen[var], da.dims, da.shape, da.attrs.get("units")))
+    return ds
+
+def store_attrs(output_file, resumen):
+    """
+    Actualiza los atributos 'stats_*' de las variables de un producto ya escrito
+    (NetCDF en modo 'a' o almacén Zarr), sin tocar los datos.
+    """
+    from .zarr_store import is_zarr, _zarr
+    if is_zarr(output_file):
+        zarr = _zarr()
+        grupo = zarr.open_group(output_file, mode="a")
+        for var, res in resumen.items():
+            if res and var in grupo:
+                z = grupo[var]
+                z.attrs.update(stats_attrs(res, z.attrs.get("_ARRAY_DIMENSIONS", []), z.shape, z.attrs.get("units")))
+        zarr.consolidate_metadata(output_file)
+        return
+    with nc.Dataset(output_file, "a") as dst:
+        for var, res in resumen.items():
+            if res and var in dst.variables:
+                v = dst.variables[var]
+                v.setncatts(stats_attrs(res, v.dimensions, v.shape, getattr(v, "units", None)))
+
+def add_stats(ds, output_file=None, time_dim="time", append=False):
+    """
+    Calcula los estadísticos por paso de un dataset en memoria (el que se va a escribir)
+    y los deja en los atributos 'stats_*' de cada variable. Con output_file además se
+    guarda la tabla por paso y nivel '{output_file}.stats.json' (ver save_stats).
+    -------
+    Retorna:
+    dict        Resumen por clave (variable y '{variable}_{nivel}').
+    """
+    tabla = compute_stats(ds, time_dim)
+    if output_file is None:
+        resumen = {clave: summarize(por_paso.values()) for clave, por_paso in tabla.items()}
+    else:
+        resumen = save_stats(output_file, tabla, append)
+    annotate(ds, resumen)
+    return resumen
+
+def _vigentes(da):
+    # los 'stats_*' describen este arreglo: mismas dimensiones, forma y unidades que al guardarlos
+    # (los atributos sobreviven a .isel/.sel y a algunas conversiones)
+    if "stats_shape" not in da.attrs:
+        return False
+    return (str(da.attrs.get("stats_dims")) == " ".join(da.dims)
+            and [int(x) for x in np.atleast_1d(da.attrs["stats_shape"])] == list(da.shape)
+            and str(da.attrs.get("stats_units")) == str(da.attrs.get("units", "")))
+
+def stats_range(da, clave=None, percentiles=False):
+    """
+    Rango (vmin, vmax) de una variable desde sus atributos 'stats_*' (sólo si el arreglo
+    conserva las dimensiones, forma y unidades con que se guardaron) o, si se pasa `clave`
+    (ej. 'u_850'), desde la tabla del producto de origen aunque sea un recorte (ej. un paso,
+    para usar el rango de toda la corrida). Con percentiles=True usa (p02, p98). Retorna
+    None si no hay estadísticos válidos: hay que calcular el rango con los datos.
+    """
+    lo, hi = ("p02", "p98") if percentiles else ("min", "max")
+    if clave is not None:
+        origen = da.encoding.get("source")
+        res = load_stats(origen).get("resumen", {}).get(clave) if origen else None
+        if res:
+            return res[lo], res[hi]
+    if f"stats_{lo}" in da.attrs and f"stats_{hi}" in da.attrs and _vigentes(da):
+        return float(da.attrs[f"stats_{lo}"]), float(da.attrs[f"stats_{hi}"])
+    return None
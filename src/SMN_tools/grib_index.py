@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import tempfile
+
+# claves GRIB que se guardan siempre en el inventario (además de las de los filtros)
+INVENTORY_KEYS = ['shortName', 'typeOfLevel', 'level', 'stepType', 'paramId']
+# límite por defecto del caché en MB (variable de entorno SMN_GRIB_INDEX_MAX_MB)
+MAX_MB = 512
+
+def index_dir():
+    """
+    Carpeta del caché de índices: $GRIB_INDEX_DIR o ~/.cache/SMN_tools/grib_index.
+    """
+    cache_dir = os.environ.get("GRIB_INDEX_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "SMN_tools", "grib_index")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def index_enabled():
+    """El caché se desactiva con SMN_GRIB_INDEX=0."""
+    return os.environ.get("SMN_GRIB_INDEX", "1") not in ("0", "false", "no")
+
+def file_key(gribfile, content_hash=None):
+    """
+    Identidad de un archivo GRIB: hash de (ruta absoluta, tamaño, mtime) o, con
+    content_hash=True, del contenido completo del archivo.
+    ----------
+    Parámetros:
+    gribfile : str          Archivo GRIB
+    content_hash : bool     Usa el contenido en lugar de ruta/tamaño/mtime (más lento, robusto a copias).
+                            Por defecto se activa con SMN_GRIB_INDEX_HASH=1.
+    """
+    if content_hash is None:
+        content_hash = os.environ.get("SMN_GRIB_INDEX_HASH", "0") in ("1", "true", "yes")
+    st = os.stat(gribfile)
+    h = hashlib.sha1()
+    if content_hash:
+        with open(gribfile, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+        h.update(str(st.st_size).encode())
+    else:
+        h.update(f"{os.path.abspath(gribfile)}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+def cfgrib_indexpath(gribfile):
+    """
+    Ruta del índice propio de cfgrib dentro del caché (para aperturas con xr.open_dataset).
+    """
+    return os.path.join(index_dir(), f"{file_key(gribfile)}.{{short_hash}}.idx")
+
+def load_inventory(gribfile, keys=(), content_hash=None):
+    """
+    Lee el inventario de mensajes guardado para un GRIB.
+    ----------
+    Parámetros:
+    gribfile : str      Archivo GRIB
+    keys : list         Claves que debe contener el inventario (ej. las de los filtros)
+    -------
+    Retorna:
+    list | None        [{'offset': ..., clave: valor, ...}] por mensaje, o None si no existe,
+                       está corrupto o no tiene todas las claves pedidas.
+    """
+    path = os.path.join(index_dir(), file_key(gribfile, content_hash) + ".json")
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(path)  # marca de uso reciente (LRU)
+    except OSError:
+        pass            # entrada de otro usuario en el caché compartido: se usa igual
+    if not set(keys) <= set(data.get("keys", [])):
+        return None
+    inventario = data["messages"]
+    for m in inventario:
+        if isinstance(m["offset"], list):   # mensajes multi-campo: (offset, n)
+            m["offset"] = tuple(m["offset"])
+    return inventario
+
+def save_inventory(gribfile, inventario, keys, content_hash=None):
+    """
+    Guarda el inventario de mensajes de un GRIB de forma atómica (archivo temporal + rename),
+    de modo que escritores concurrentes nunca dejan un índice a medias, y aplica el límite del caché.
+    ----------
+    Parámetros:
+    gribfile : str      Archivo GRIB
+    inventario : list   [{'offset': ..., clave: valor, ...}] por mensaje
+    keys : list         Claves guardadas por mensaje
+    """
+    cache_dir = index_dir()
+    path = os.path.join(cache_dir, file_key(gribfile, content_hash) + ".json")
+    data = {"path": os.path.abspath(gribfile), "keys": sorted(keys), "messages": inventario}
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix=".tmp_", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.chmod(tmp, 0o644)  # caché compartido entre usuarios
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"No se pudo guardar el índice de {gribfile}: {e}")
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    evict_cache()
+
+def evict_cache(max_mb=None):
+    """
+    Elimina los índices usados hace más tiempo (LRU por mtime) hasta que el caché
+    quede por debajo de max_mb (default: $SMN_GRIB_INDEX_MAX_MB o MAX_MB).
+    """
+    if max_mb is None:
+        max_mb = float(os.environ.get("SMN_GRIB_INDEX_MAX_MB", MAX_MB))
+    cache_dir = index_dir()
+    entradas = []
+    for f in os.listdir(cache_dir):
+        if f.startswith(".tmp_") or not f.endswith((".json", ".idx")):
+            continue
+        try:
+            st = os.stat(os.path.join(cache_dir, f))
+        except OSError:   # borrado por otro proceso
+            continue
+        entradas.append((st.st_mtime, st.st_size, f))
+    total = sum(e[1] for e in entradas)
+    for _, size, f in sorted(entradas):
+        if total <= max_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, f))
+        except OSError:
+            pass
+        total -= size
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import xarray as xr
+from cfgrib import messages
+from .profiling import profiled, note, stage
+from .grib_index import INVENTORY_KEYS, index_enabled, load_inventory, save_inventory, cfgrib_indexpath
+
+def _coincide(cabecera, filtro):
+    return all(cabecera.get(k) == v for k, v in filtro.items())
+
+@profiled("scan", archivo="gribfile")
+def scan_grib(gribfile, filtros, use_index=None):
+    """
+    Recorre UNA sola vez los mensajes de un archivo GRIB y reparte cada mensaje
+    en la(s) variable(s) de salida cuyos filtros coinciden.
+    Si existe un inventario del archivo en el caché de índices (grib_index) no se
+    recorre el archivo: se leen directamente los mensajes necesarios por su offset.
+    ----------
+    Parámetros:
+    gribfile : str     Archivo GRIB (ejemplo: 'WRFPRS_d01.00', 'latlon_000')
+    filtros : dict     {nombre: filter_by_keys}, ej: {'tp': {'shortName':'tp','typeOfLevel':'surface'}}
+    use_index : bool   Usa/guarda el inventario en caché (default: SMN_GRIB_INDEX, activado)
+    -------
+    Retorna:
+    dict        {nombre: [mensajes cfgrib]} con los mensajes (en memoria) de cada filtro.
+    """
+    if use_index is None:
+        use_index = index_enabled()
+    claves = sorted({k for filtro in filtros.values() for k in filtro})
+    pool = {nombre: [] for nombre in filtros}
+
+    inventario = load_inventory(gribfile, claves) if use_index else None
+    if inventario is not None:
+        with open(gribfile, "rb") as f:
+            for cabecera in inventario:
+                nombres = [n for n, filtro in filtros.items() if _coincide(cabecera, filtro)]
+                if not nombres:
+                    continue
+                msg = messages.Message.from_file(f, offset=cabecera["offset"])
+                for nombre in nombres:
+                    pool[nombre].append(msg)
+        note(mensajes=sum(map(len, pool.values())), inventario=True)
+        return pool
+
+    claves_inv = sorted(set(claves) | set(INVENTORY_KEYS))
+    inventario = []
+    for offset, msg in messages.FileStream(gribfile).items():
+        # leer cada clave una sola vez por mensaje
+        cabecera = {k: msg.message_get(k, default=None) for k in claves_inv}
+        inventario.append(dict(cabecera, offset=offset))
+        for nombre, filtro in filtros.items():
+            if _coincide(cabecera, filtro):
+                pool[nombre].append(msg)
+    if use_index:
+        save_inventory(gribfile, inventario, claves_inv)
+    note(mensajes=len(inventario), inventario=False)
+    return pool
+
+def grib_opener(gribfile, filtros, single_pass=True, use_index=None):
+    """
+    Devuelve una función abre(nombre, **kwargs) -> xr.Dataset para las variables de `filtros`.
+    Con single_pass=True el archivo se recorre una vez (scan_grib) y cada variable se
+    construye desde los mensajes ya leídos; con single_pass=False se abre el GRIB con
+    cfgrib una vez por variable (comportamiento anterior).
+    En ambos modos el índice se guarda en el caché de grib_index y se reutiliza entre
+    variables y entre corridas.
+    ----------
+    Parámetros:
+    gribfile : str       Archivo GRIB
+    filtros : dict       {nombre: filter_by_keys}
+    single_pass : bool   Lectura en una sola pasada (default: True)
+    use_index : bool     Usa el caché de índices (default: SMN_GRIB_INDEX, activado)
+    """
+    if use_index is None:
+        use_index = index_enabled()
+    pool = scan_grib(gribfile, filtros, use_index) if single_pass else {}
+    indexpath = cfgrib_indexpath(gribfile) if use_index else ''
+
+    def abre(nombre, **kwargs):
+        filtro = filtros[nombre]
+        if pool.get(nombre):
+            with stage("decode", archivo=gribfile, variable=nombre, mensajes=len(pool[nombre])):
+                return xr.open_dataset(pool[nombre], engine="cfgrib",
+                    backend_kwargs={'filter_by_keys': filtro}, **kwargs)
+        # sin mensajes en memoria: apertura clásica (mismo comportamiento y errores de antes)
+        with stage("decode", archivo=gribfile, variable=nombre):
+            return xr.open_dataset(gribfile, engine="cfgrib",
+                backend_kwargs={'filter_by_keys': filtro, 'indexpath': indexpath}, **kwargs)
+    return abre
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from cfgrib import messages
+
+# claves GRIB que definen la grilla de un dominio
+GRID_KEYS = ['gridType', 'Ni', 'Nj',
+             'latitudeOfFirstGridPointInDegrees', 'longitudeOfFirstGridPointInDegrees',
+             'latitudeOfLastGridPointInDegrees', 'longitudeOfLastGridPointInDegrees',
+             'iScansNegatively', 'jScansPositively', 'jPointsAreConsecutive']
+
+# geometrías ya calculadas en este proceso, por huella de grilla (una por modelo/dominio)
+_GEOMETRIAS = {}
+
+def grid_keys(source):
+    """
+    Lee las claves de grilla (GRID_KEYS) de un mensaje cfgrib o del primer mensaje de un archivo GRIB.
+    ----------
+    Parámetros:
+    source : str | cfgrib Message     Archivo GRIB o mensaje ya leído.
+    -------
+    Retorna:
+    tuple       Huella de la grilla: valores de GRID_KEYS en orden.
+    """
+    msg = messages.FileStream(source)[None] if isinstance(source, str) else source
+    return tuple(msg.message_get(k, default=None) for k in GRID_KEYS)
+
+def _orienta(arr, grid):
+    # (..., N) -> (..., lat, lon) en orden creciente, sólo con vistas (sin copia)
+    g = dict(zip(GRID_KEYS, grid))
+    ni, nj = g['Ni'], g['Nj']
+    if g['jPointsAreConsecutive']:
+        arr = arr.reshape(arr.shape[:-1] + (ni, nj)).swapaxes(-1, -2)
+    else:
+        arr = arr.reshape(arr.shape[:-1] + (nj, ni))
+    if not g['jScansPositively']:
+        arr = arr[..., ::-1, :]
+    if g['iScansNegatively']:
+        arr = arr[..., :, ::-1]
+    return arr
+
+def get_geometry(grid, lat, lon):
+    """
+    Geometría (latitudes y longitudes 1D crecientes) de una grilla regular en lat/lon
+    (regular_ll, mercator), calculada una vez por dominio y guardada en caché.
+    La primera vez se valida toda la grilla; luego sólo se comprueban las esquinas.
+    ----------
+    Parámetros:
+    grid : tuple        Huella de grilla (grid_keys)
+    lat, lon : array    Latitudes y longitudes 1D (dimensión 'values') del campo
+    -------
+    Retorna:
+    dict        {'grid': huella, 'lat': array 1D, 'lon': array 1D}
+    """
+    geo = _GEOMETRIAS.get(grid)
+    if geo is not None:
+        lat2d, lon2d = _orienta(lat, grid), _orienta(lon, grid)
+        esquinas = np.ix_([0, -1], [0, -1])
+        if (np.array_equal(lat2d[esquinas], np.tile(geo['lat'][[0, -1]][:, None], 2))
+                and np.array_equal(lon2d[esquinas], np.tile(geo['lon'][[0, -1]], (2, 1)))):
+            return geo
+        raise ValueError(f"Las coordenadas del campo no coinciden con la grilla en caché {grid}")
+
+    g = dict(zip(GRID_KEYS, grid))
+    if lat.size != g['Ni'] * g['Nj']:
+        raise ValueError(f"Grilla {grid}: {lat.size} puntos, se esperaban Ni*Nj={g['Ni'] * g['Nj']}")
+    lat2d, lon2d = _orienta(lat, grid), _orienta(lon, grid)
+    lat1d, lon1d = lat2d[:, 0].copy(), lon2d[0, :].copy()
+    if not (np.all(lat2d == lat1d[:, None]) and np.all(lon2d == lon1d[None, :])
+            and np.all(np.diff(lat1d) > 0) and np.all(np.diff(lon1d) > 0)):
+        raise ValueError(f"La grilla {g['gridType']} no es regular en lat/lon; no se puede estructurar")
+    geo = {'grid': grid, 'lat': lat1d, 'lon': lon1d}
+    _GEOMETRIAS[grid] = geo
+    return geo
+
+def as_grid(values, geo):
+    """
+    Vista (sin copia) de un campo (..., N) como (..., lat, lon) según la geometría.
+    """
+    return _orienta(values, geo['grid'])
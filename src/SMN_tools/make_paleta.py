@@ -4,6 +4,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.colors as mcolors
+from .field_stats import stats_range
 ####################################################################################
 def get_cmap_norm(variable_name, data_range=None, dataset=None):
     """
@@ -14,7 +15,8 @@ def get_cmap_norm(variable_name, data_range=None, dataset=None):
         Nombre de la variable ('prmsl', 'mslet', 't2m', 'u10m', etc.)
     data_range : tuple, opcional
         Rango (min, max) de los datos para escalas genéricas
-    dataset : netcdf file abierto co xarray, opcional caso no definida la variable aqui        
+    dataset : netcdf file abierto co xarray, opcional caso no definida la variable aqui
+        (si tiene atributos 'stats_min'/'stats_max' de ese mismo arreglo se usan sin leer los datos)
     """
     # Configuración para presión al nivel del mar (común a todos los modelos)
     if variable_name in ['prmsl', 'mslet']:
@@ -59,7 +61,12 @@ def get_cmap_norm(variable_name, data_range=None, dataset=None):
             vmin, vmax = data_range
             clevs = np.linspace(vmin, vmax, 20)
         else:
-            clevs = np.linspace(np.min(dataset).values, np.max(dataset).values, 11)
+            # rango precalculado al escribir el producto (atributos 'stats_*', ver field_stats);
+            # sólo si no existe se recorren los datos
+            rango = stats_range(dataset)
+            if rango is None:
+                rango = (np.min(dataset).values, np.max(dataset).values)
+            clevs = np.linspace(rango[0], rango[1], 11)
             clevs = [int(e) for e in clevs]
         
         cmap = plt.cm.terrain_r
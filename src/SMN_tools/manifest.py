@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+
+# manifiesto de una carpeta de salida: qué GRIB, con qué opciones y con qué versión
+# del paquete se generó cada archivo (permite rehacer sólo lo que cambió)
+MANIFIESTO = ".SMN_tools_manifest.json"
+FORMATO = 1
+
+@contextmanager
+def atomic_path(path):
+    """
+    Ruta temporal (oculta, en la misma carpeta) donde escribir `path`; al salir del bloque
+    sin error se renombra sobre `path`, así un corte nunca deja un archivo a medias:
+        with atomic_path(out) as tmp: ds.to_netcdf(tmp)
+    """
+    carpeta, nombre = os.path.split(os.path.abspath(path))
+    tmp = os.path.join(carpeta, f".{nombre}.{os.getpid()}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def package_version():
+    """Versión instalada de SMN_tools ('dev' si el paquete no está instalado)."""
+    try:
+        from importlib.metadata import version
+        return version("SMN_tools")
+    except Exception:
+        return "dev"
+
+def content_hash_enabled():
+    """Con SMN_MANIFEST_HASH=1 la identidad de los GRIB incluye el hash del contenido."""
+    return os.environ.get("SMN_MANIFEST_HASH", "0") in ("1", "true", "yes")
+
+def grib_identity(gribfile, content_hash=None):
+    """
+    Identidad de un GRIB de entrada: ruta absoluta, tamaño, mtime y, con content_hash=True
+    (default: $SMN_MANIFEST_HASH), el sha1 del contenido (robusto a copias y a `touch`).
+    """
+    if content_hash is None:
+        content_hash = content_hash_enabled()
+    st = os.stat(gribfile)
+    identidad = {"ruta": os.path.abspath(gribfile), "tamano": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if content_hash:
+        h = hashlib.sha1()
+        with open(gribfile, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+        identidad["sha1"] = h.hexdigest()
+    return identidad
+
+def _misma_entrada(anterior, actual):
+    # con hash se compara el contenido; sin él, tamaño y mtime
+    if "sha1" in actual:
+        return anterior.get("sha1") == actual["sha1"]
+    return (anterior.get("tamano"), anterior.get("mtime_ns")) == (actual["tamano"], actual["mtime_ns"])
+
+def _tamano(path):
+    # NetCDF: tamaño del archivo; Zarr (carpeta): sólo se exige que exista
+    if os.path.isdir(path):
+        return -1
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+def load_manifest(outdir):
+    """Manifiesto de `outdir` ({clave: registro}); vacío si no existe o no se puede leer."""
+    path = os.path.join(outdir, MANIFIESTO)
+    try:
+        with open(path) as f:
+            datos = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return datos.get("registros", {}) if datos.get("formato") == FORMATO else {}
+
+def save_manifest(outdir, registros):
+    """Guarda el manifiesto de `outdir` (escritura atómica)."""
+    os.makedirs(outdir, exist_ok=True)
+    path = os.path.join(outdir, MANIFIESTO)
+    with atomic_path(path) as tmp:
+        with open(tmp, "w") as f:
+            json.dump({"formato": FORMATO, "registros": registros}, f, indent=1, default=str)
+
+def record(registros, clave, gribs, spec, salidas, content_hash=None):
+    """
+    Registra en `registros` (de load_manifest) que `salidas` se generaron a partir de los
+    archivos `gribs` con las opciones `spec` (variables, región, ...) y esta versión del paquete.
+    """
+    outdir = None
+    tamanos = {}
+    for path in salidas:
+        outdir = outdir or os.path.dirname(os.path.abspath(path))
+        tamanos[os.path.abspath(path)] = _tamano(path)
+    registros[clave] = {
+        "entradas": [grib_identity(g, content_hash) for g in gribs],
+        "spec": spec, "version": package_version(), "salidas": tamanos,
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return registros[clave]
+
+def is_valid(registros, clave, gribs, spec, content_hash=None):
+    """
+    Indica si las salidas registradas en `clave` siguen vigentes: mismos GRIB de entrada
+    (tamaño y mtime, o contenido), mismas opciones, misma versión del paquete y todas las
+    salidas presentes con el tamaño con que se escribieron.
+    """
+    registro = registros.get(clave)
+    if not registro or registro.get("version") != package_version():
+        return False
+    if json.loads(json.dumps(spec, default=str)) != registro.get("spec"):
+        return False
+    anteriores = registro.get("entradas", [])
+    if [e.get("ruta") for e in anteriores] != [os.path.abspath(g) for g in gribs]:
+        return False
+    try:
+        actuales = [grib_identity(g, content_hash) for g in gribs]
+    except OSError:
+        return False
+    if not all(_misma_entrada(a, b) for a, b in zip(anteriores, actuales)):
+        return False
+    salidas = registro.get("salidas", {})
+    return bool(salidas) and all(_tamano(p) == t for p, t in salidas.items())
+
+def outputs(registros, clave):
+    """Rutas de las salidas registradas en `clave`."""
+    return list(registros.get(clave, {}).get("salidas", {}))
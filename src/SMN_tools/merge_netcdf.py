@@ -3,19 +3,27 @@
 
 import os
 import xarray as xr
+from .append_netcdf import append_netcdf
+from .nc_encoding import build_encoding
+from .zarr_store import is_zarr, to_zarr_store
+from .regions import crop
+from .field_stats import add_stats, store_attrs, save_stats, compute_stats
+from .derived import add_derived, fix_intervals
+from .streaming import use_streaming, iter_steps, reset_output
+from .profiling import profiled
+from .manifest import atomic_path
+from .catalog import register_product
+from .archive import archive_products
 
-def merge_files(list_files, output_file, institution="SENAMHI", source=None):
+def merge_datasets(list_files, output_file, institution="SENAMHI", source=None, region=None):
     """
-    Une en un solo NetCDF todas las variables de superficie procesadas previamente.
-    Parámetros
-    ----------
-    list_files : list
-        Lista de rutas a NetCDFs de superficie (ya uniformizados con process_netcdf_files).
-        Ejemplo: ["sfc_tmp_tp.nc", "sfc_tmp_t2m.nc", "sfc_tmp_sp.nc", ...]
-    output_file : str    Nombre del archivo NetCDF de salida con todas las variables unidas.
+    Une las variables (rutas o xr.Dataset) en un solo dataset con los atributos globales
+    CF-1.8 del producto, sin escribirlo (ver merge_files).
     """
     # Abrir todos los datasets sin decodificar para consistencia
-    datasets = [xr.open_dataset(f, decode_times=True) for f in list_files]
+    datasets = [f if isinstance(f, xr.Dataset) else xr.open_zarr(f) if is_zarr(f)
+                else xr.open_dataset(f, decode_times=True) for f in list_files]
+    datasets = [crop(ds, region) for ds in datasets]
 
     # Fusionar en un solo dataset
     #combined = xr.merge(datasets)
@@ -34,10 +42,95 @@ def merge_files(list_files, output_file, institution="SENAMHI", source=None):
     combined.attrs["history"] = "Generado con SMN_tools"
     combined.attrs["references"] = "https://www.senamhi.gob.pe/"
     combined.attrs["Conventions"] = "CF-1.8"
-    #
+    return combined
+
+def _corrige_intervalos(output_file, nuevos, resumen):
+    # en modo append la precipitación del intervalo usa el paso anterior del producto
+    # (y el paso siguiente se corrige si se insertó uno intermedio)
+    corregidos = fix_intervals(output_file, nuevos)
+    if corregidos is None:
+        return resumen
+    return save_stats(output_file, compute_stats(corregidos), append=True)
+
+@profiled("write", archivo="output_file")
+def _escribe(combined, output_file, append, profile, derived):
+    # derivadas, estadísticos y escritura de un dataset ya cargado; retorna los pasos escritos
+    add_derived(combined, derived)
+    resumen = add_stats(combined, output_file, append=append)
+    if is_zarr(output_file):
+        nuevos = to_zarr_store(combined, output_file, profile, append=append)
+        if append:
+            store_attrs(output_file, _corrige_intervalos(output_file, nuevos, resumen))
+        return nuevos
+
     # Guardar comprimido
-    encoding = {var: {"zlib": True, "complevel": 5} for var in combined.data_vars}
-    combined.to_netcdf(output_file, encoding=encoding, format="NETCDF4")
-    combined.close()
-    print(f"Archivo de superficie generado: {output_file}")
+    encoding = build_encoding(combined, profile, unlimited_dims=["time"] if append else ())
+    if append:
+        nuevos = append_netcdf(combined, output_file, encoding=encoding)
+        store_attrs(output_file, _corrige_intervalos(output_file, nuevos, resumen))
+        return nuevos
+    with atomic_path(output_file) as tmp:
+        combined.to_netcdf(tmp, encoding=encoding, format="NETCDF4")
+    return list(combined["time"].values)
 
+@profiled("merge", archivo="output_file")
+def merge_files(list_files, output_file, institution="SENAMHI", source=None, append=False, profile=None,
+                region=None, derived=None, streaming=False, max_mem_mb=None, archive=None, catalog=True):
+    """
+    Une en un solo NetCDF todas las variables de superficie procesadas previamente.
+    Parámetros
+    ----------
+    list_files : list
+        Lista de rutas a NetCDFs de superficie (ya uniformizados con process_netcdf_files),
+        o de xr.Dataset en memoria (ver combine_datasets).
+        Ejemplo: ["sfc_tmp_tp.nc", "sfc_tmp_t2m.nc", "sfc_tmp_sp.nc", ...]
+    output_file : str    Nombre del archivo NetCDF de salida con todas las variables unidas.
+                         Si termina en '.zarr' se escribe un almacén Zarr (ver zarr_store).
+    append : bool        Agrega sólo los pasos nuevos al producto existente (tiempo ilimitado),
+                         sin reescribir los anteriores; permite publicar la corrida paso a paso.
+    profile : str | dict Perfil de compresión/cuantización/chunks (ver nc_encoding.PERFILES;
+                         default: $SMN_NC_PROFILE o 'default', zlib nivel 5).
+    region : str | tuple Recorta a una región (regions.REGIONES) o bbox; sólo se lee la ventana.
+    derived : list | str Variables derivadas a agregar junto a las originales (ver derived.DERIVADAS;
+                         'todas' para todas las que se puedan calcular con las variables presentes).
+    streaming : bool     Lee y escribe un paso a la vez (memoria constante en el largo del pronóstico).
+    max_mem_mb : float   Techo de memoria: si el producto completo no cabe, se escribe paso a paso
+                         (default: $SMN_MAX_MEM_MB; ver streaming.py).
+    archive : str        Carpeta de los archivos de corridas (ver archive.py): el producto terminado
+                         se agrega a '{archive}/{model}_{prs|sfc}.nc' (init_time x lead_time). En
+                         modo append no se archiva: la corrida aún no terminó.
+    catalog : bool | str Registra el producto en el catálogo SQLite (catalog.register_product, sin
+                         sha1: ver product_checksum); una ruta usa ese catálogo en vez de $SMN_CATALOG.
+                         False no lo registra (publish_step: run_pipeline y watch_run registran los
+                         productos una sola vez, al terminar la corrida).
+    Los estadísticos por paso (min, max, media, percentiles) se calculan sobre los mismos
+    datos que se escriben y quedan en los atributos 'stats_*' y en '{output_file}.stats.json'
+    (ver field_stats), para que las paletas no tengan que recorrer los datos.
+    """
+    combined = merge_datasets(list_files, output_file, institution, source, region)
+    if use_streaming(combined.nbytes, streaming, max_mem_mb):
+        # los archivos de entrada se abren sin leer los datos: se carga un paso a la vez
+        if not append:
+            reset_output(output_file)
+        nuevos = [t for paso in iter_steps(combined)
+                  for t in _escribe(paso, output_file, True, profile, derived)]
+        combined.close()
+        if catalog:
+            register_product(output_file, catalog)
+        if archive and not append:
+            archive_products([output_file], archive)
+        print(f"Archivo {'actualizado' if append else 'generado'} paso a paso: {output_file} ({len(nuevos)} pasos)")
+        return
+
+    nuevos = _escribe(combined.load(), output_file, append, profile, derived)
+    combined.close()
+    if catalog:   # catálogo SQLite de productos (catalog.py)
+        register_product(output_file, catalog)
+    if archive and not append:
+        archive_products([output_file], archive)
+    if is_zarr(output_file):
+        print(f"Almacén Zarr {'actualizado' if append else 'generado'}: {output_file} ({len(nuevos)} pasos)")
+    elif append:
+        print(f"Archivo actualizado: {output_file} ({len(nuevos)} pasos nuevos)")
+    else:
+        print(f"Archivo de superficie generado: {output_file}")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tempfile
+import numpy as np
+import xarray as xr
+
+# perfiles de escritura de los NetCDF (ver build_encoding). 'default' es el encoding histórico.
+#   complevel : nivel zlib (0 = sin compresión)      shuffle : filtro shuffle de HDF5
+#   lsd       : least_significant_digit (True = tabla DECIMALES por variable)
+#   bitround  : bits de mantisa que se conservan (quantize_mode 'BitRound')
+#   pack      : empaqueta a int16 con scale_factor/add_offset (rango de RANGOS o de los datos)
+#   chunks    : 'mapas' (un mapa por chunk), 'series' (bloques de puntos a lo largo del tiempo)
+#               o dict {dim: tamaño}
+#   vars      : opciones por variable que reemplazan a las del perfil
+PERFILES = {
+    'default': {'complevel': 5},
+    'rapido':  {'complevel': 1, 'shuffle': True, 'chunks': 'mapas'},
+    'mapas':   {'complevel': 4, 'shuffle': True, 'lsd': True, 'chunks': 'mapas'},
+    'series':  {'complevel': 4, 'shuffle': True, 'lsd': True, 'chunks': 'series'},
+    'bitround': {'complevel': 4, 'shuffle': True, 'bitround': 10, 'chunks': 'mapas'},
+    'archivo': {'complevel': 6, 'shuffle': True, 'pack': True, 'chunks': 'mapas'},
+}
+
+# decimales significativos por variable (precisión útil de los productos)
+DECIMALES = {'t2m': 2, 'd2m': 2, 'r2m': 1, 'u': 2, 'v': 2, 'u10': 2, 'v10': 2,
+             'tp': 2, 'prmsl': 0, 'ssrd': 0,
+             'ws10': 2, 'wd10': 1, 'ws': 2, 'wd': 1, 'rh2m': 1, 't2m_c': 2, 'd2m_c': 2,
+             'prmsl_hpa': 2, 'tp_int': 2}
+
+# rangos físicos fijos para el empaquetado int16 (el producto se puede ampliar en modo append)
+RANGOS = {'t2m': (150., 350.), 'd2m': (150., 350.), 'r2m': (0., 110.),
+          'u': (-150., 150.), 'v': (-150., 150.), 'u10': (-100., 100.), 'v10': (-100., 100.),
+          'tp': (0., 1500.), 'prmsl': (85000., 110000.),
+          'ws10': (0., 100.), 'wd10': (0., 360.), 'ws': (0., 150.), 'wd': (0., 360.), 'rh2m': (0., 110.),
+          't2m_c': (-123., 77.), 'd2m_c': (-123., 77.), 'prmsl_hpa': (850., 1100.), 'tp_int': (0., 500.)}
+
+# bloque de puntos y pasos de tiempo de los chunks 'series'
+SERIE_PUNTOS = 32
+SERIE_PASOS = 48
+FILL_INT16 = -32767
+
+def get_profile(profile=None):
+    """
+    Perfil de escritura: nombre de PERFILES, dict con las mismas opciones, o None para
+    usar $SMN_NC_PROFILE (default: 'default').
+    """
+    if isinstance(profile, dict):
+        return profile
+    nombre = profile or os.environ.get("SMN_NC_PROFILE", "default")
+    if nombre not in PERFILES:
+        raise ValueError(f"Perfil de escritura '{nombre}' no existe; opciones: {list(PERFILES)}")
+    return PERFILES[nombre]
+
+def _chunks(da, modo, unlimited_dims):
+    if isinstance(modo, dict):
+        tam = [modo.get(d, da.sizes[d]) for d in da.dims]
+    else:
+        tam = []
+        for d in da.dims:
+            if d in ("latitude", "longitude", "lat", "lon"):
+                tam.append(da.sizes[d] if modo == 'mapas' else SERIE_PUNTOS)
+            elif d == "time":
+                tam.append(1 if modo == 'mapas' else SERIE_PASOS)
+            else:
+                tam.append(1)
+    # una dimensión fija no admite chunks más grandes que ella
+    return tuple(int(t) if d in unlimited_dims else int(max(1, min(t, da.sizes[d])))
+                 for d, t in zip(da.dims, tam))
+
+def _empaqueta(da, rango=None):
+    if rango is None:
+        vmin, vmax = float(da.min(skipna=True)), float(da.max(skipna=True))
+    else:
+        vmin, vmax = rango
+    if not np.isfinite(vmin) or vmax <= vmin:
+        vmax = vmin + 1.0 if np.isfinite(vmin) else 1.0
+        vmin = 0.0 if not np.isfinite(vmin) else vmin
+    # -32767 queda libre para _FillValue
+    scale = (vmax - vmin) / (2 ** 16 - 4)
+    return {'dtype': 'int16', 'scale_factor': scale, 'add_offset': (vmax + vmin) / 2,
+            '_FillValue': FILL_INT16}
+
+def build_encoding(ds, profile=None, unlimited_dims=()):
+    """
+    Encoding por variable (to_netcdf / append_netcdf) según un perfil de compresión,
+    cuantización y chunks.
+    ----------
+    Parámetros:
+    ds : xr.Dataset         Dataset a escribir.
+    profile : str | dict    Perfil (ver PERFILES y get_profile).
+    unlimited_dims : list   Dimensiones ilimitadas del archivo (sus chunks no se recortan).
+    -------
+    Retorna:
+    dict        {variable: encoding}
+    """
+    perfil = get_profile(profile)
+    encoding = {}
+    for var, da in ds.data_vars.items():
+        opc = dict(perfil)
+        opc.update(perfil.get('vars', {}).get(var, {}))
+        enc = {}
+        if opc.get('complevel'):
+            enc.update(zlib=True, complevel=opc['complevel'])
+        if 'shuffle' in opc:
+            enc['shuffle'] = bool(opc['shuffle'])
+        if da.dtype.kind == 'f':
+            lsd = opc.get('lsd')
+            if lsd is True:
+                lsd = DECIMALES.get(var)
+            if lsd is not None and lsd is not False:
+                enc['least_significant_digit'] = int(lsd)
+            if opc.get('bitround'):
+                enc.update(quantize_mode='BitRound', significant_digits=int(opc['bitround']))
+            if opc.get('pack'):
+                enc.update(_empaqueta(da, RANGOS.get(var)))
+        if opc.get('chunks') and da.ndim:
+            enc['chunksizes'] = _chunks(da, opc['chunks'], unlimited_dims)
+        encoding[var] = enc
+    return encoding
+
+def encoding_report(source, profiles=None, outdir=None):
+    """
+    Compara perfiles de escritura sobre un producto: tamaño del archivo, tiempo de escritura
+    y tiempos de lectura (archivo completo, un mapa y una serie de tiempo en un punto).
+    ----------
+    Parámetros:
+    source : str | xr.Dataset   Producto de referencia (ej: '{model}_{fecha}_sfc.nc').
+    profiles : list             Perfiles a comparar (default: todos los de PERFILES).
+    outdir : str                Carpeta de los archivos de prueba (default: temporal, se borra).
+    -------
+    Retorna:
+    list        [{'perfil', 'MB', 'escritura_s', 'lectura_s', 'mapa_s', 'serie_s'}, ...]
+    """
+    ds = source if isinstance(source, xr.Dataset) else xr.open_dataset(source)
+    ds = ds.load()
+    profiles = list(PERFILES) if profiles is None else profiles
+    tmp = tempfile.TemporaryDirectory() if outdir is None else None
+    carpeta = tmp.name if tmp is not None else outdir
+    os.makedirs(carpeta, exist_ok=True)
+
+    filas = []
+    try:
+        for nombre in profiles:
+            out_file = os.path.join(carpeta, f"perfil_{nombre}.nc")
+            t0 = time.perf_counter()
+            ds.to_netcdf(out_file, encoding=build_encoding(ds, nombre), format="NETCDF4")
+            t_esc = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            with xr.open_dataset(out_file) as d:
+                d.load()
+            t_lec = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            with xr.open_dataset(out_file) as d:
+                d.isel(time=-1).load()
+            t_mapa = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            with xr.open_dataset(out_file) as d:
+                centro = {dim: d.sizes[dim] // 2 for dim in d.dims if dim != "time"}
+                d.isel(centro).load()
+            t_serie = time.perf_counter() - t0
+
+            filas.append({'perfil': nombre, 'MB': os.path.getsize(out_file) / 2 ** 20,
+                          'escritura_s': t_esc, 'lectura_s': t_lec, 'mapa_s': t_mapa, 'serie_s': t_serie})
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    print(f"{'perfil':<10} {'MB':>8} {'escritura_s':>12} {'lectura_s':>10} {'mapa_s':>8} {'serie_s':>8}")
+    for f in filas:
+        print(f"{f['perfil']:<10} {f['MB']:8.2f} {f['escritura_s']:12.3f} {f['lectura_s']:10.3f} "
+              f"{f['mapa_s']:8.3f} {f['serie_s']:8.3f}")
+    return filas
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from .rename_clean import rename_and_clean
+from .procesa_netcdf import combine_datasets
+from .merge_netcdf import merge_files, merge_datasets
+from .zarr_store import init_store, write_region, finalize_store, _zarr
+from .derived import add_derived, fix_intervals
+from .field_stats import compute_stats, save_stats, store_attrs
+from .streaming import reset_output
+from .run_driver import (DATA_DIR, TIPOS, find_leadtime_files, lead_hour, _extrae_paso, _extrae_corrida,
+                         _inicia_trabajador)
+from .profiling import profiled, set_run, current_run
+from .manifest import load_manifest, save_manifest, record, is_valid, outputs
+from .catalog import register_product
+from .archive import archive_products
+
+# variables en niveles de presión (producto 'prs'); el resto va al producto 'sfc'
+PRS_VARS = ['u', 'v']
+DIMS = {
+    'prs': ["time", "isobaricInhPa", "latitude", "longitude"],
+    'sfc': ["time", "latitude", "longitude"],
+}
+
+def build_products(pasos, prs_vars=PRS_VARS):
+    """
+    Arma en memoria las variables de los productos 'prs' y 'sfc' a partir de los
+    datasets extraídos por paso (extrac_ETA/extrac_WRF con out_path=None), sin
+    escribir archivos intermedios.
+    ----------
+    Parámetros:
+    pasos : list        Lista de dict {variable: xr.Dataset}, uno por hora de pronóstico.
+    prs_vars : list     Variables que van al producto de niveles (default: ['u','v']).
+    -------
+    Retorna:
+    dict        {'prs': [xr.Dataset por variable], 'sfc': [...]}, listos para merge_files.
+    """
+    por_var = {}
+    for salida in pasos:
+        for var, ds in salida.items():
+            por_var.setdefault(var, []).append(ds)
+
+    productos = {}
+    for var_in, new_dims in DIMS.items():
+        nombres = [v for v in por_var if (v in prs_vars) == (var_in == 'prs')]
+        variables = []
+        for var in nombres:
+            datasets = [rename_and_clean(ds, None, var, new_dims) for ds in por_var[var]]
+            variables.append(combine_datasets(datasets, new_dims))
+        if variables:
+            productos[var_in] = variables
+    return productos
+
+@profiled("publish")
+def publish_step(salida, run_dir, model, fecha_hor, profile=None, derived=None):
+    """
+    Agrega un paso recién extraído a los productos de la corrida (modo append): sólo se
+    escribe ese paso, a costo constante, y el producto parcial queda publicable.
+    ----------
+    Parámetros:
+    salida : dict       {variable: xr.Dataset} de un paso (extrac_ETA/extrac_WRF con out_path=None).
+    run_dir : str       Carpeta de los productos finales.
+    model : str         Modelo/dominio (ej: 'PERU_WRF22')
+    fecha_hor : str     Fecha y hora de la corrida 'YYYYMMDDHH'
+    profile : str|dict  Perfil de escritura (ver nc_encoding.PERFILES), usado al crear el producto.
+    derived : list|str  Variables derivadas (ver derived.DERIVADAS).
+    -------
+    Retorna:
+    dict        {'prs': ruta, 'sfc': ruta} de los productos actualizados.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    salidas = {}
+    for var_in, variables in build_products([salida]).items():
+        out_file = os.path.join(run_dir, f"{model}_{fecha_hor}_{var_in}.nc")
+        # se registran en el catálogo al terminar la corrida, no en cada paso
+        merge_files(variables, out_file, append=True, profile=profile, derived=derived, catalog=False)
+        salidas[var_in] = out_file
+    return salidas
+
+@profiled("pipeline")
+def run_pipeline(model, fecha, hor, run_dir, tipos=None, r0=DATA_DIR, workers=None,
+                 max_mem_mb=None, single_pass=True, profile=None, backend="netcdf", region=None, derived=None,
+                 files=None, streaming=False, incremental=True, content_hash=None, archive=None, catalog=True):
+    """
+    Extrae, procesa y une una corrida completa en memoria: GRIB -> {model}_{fecha}{hor}_{prs|sfc}.nc.
+    Equivale a extrac_* + process_netcdf_files + merge_files (mismos metadatos CF) pero sin
+    los NetCDF intermedios por variable/paso ni los '{prs|sfc}_tmp_*'.
+    Con backend='zarr' cada proceso escribe su paso directamente en su región de los
+    productos '{model}_{fecha}{hor}_{prs|sfc}.zarr' (ver zarr_store).
+    Con streaming=True cada paso se agrega a los productos (publish_step) apenas termina su
+    extracción y se libera, así que la memoria no crece con el largo del pronóstico.
+    ----------
+    Parámetros:
+    model : str         Modelo/dominio (ej: 'PERU_WRF22')
+    fecha : str         Fecha de la corrida 'YYYYMMDD'
+    hor : str           Hora de la corrida 'HH'
+    run_dir : str       Carpeta de los productos finales (ej: '.../out/06Z')
+    tipos : list        Variables a extraer (default: TIPOS)
+    r0 : str            Ruta base de datos (default: DATA_DIR)
+    workers : int       Procesos para la extracción (default: os.cpu_count())
+    max_mem_mb : float  Límite de memoria por proceso en MB
+    single_pass : bool  Lectura del GRIB en una sola pasada
+    profile : str|dict  Perfil de compresión/cuantización/chunks (ver nc_encoding.PERFILES)
+    backend : str       'netcdf' o 'zarr'
+    region : str|tuple  Región (regions.REGIONES) o bbox (lon_min, lat_min, lon_max, lat_max)
+    derived : list|str  Variables derivadas que se escriben junto a las originales (ver derived.DERIVADAS)
+    files : list        Archivos GRIB de la corrida (default: find_leadtime_files en r0; ver batch.py)
+    streaming : bool    Escribe paso a paso con a lo más `workers` pasos en memoria (dominios km)
+    incremental : bool  Si el manifiesto de run_dir (manifest.py) indica que los productos siguen
+                        vigentes (mismos GRIB, opciones y versión del paquete) no se rehacen
+    content_hash : bool Compara los GRIB por contenido y no por tamaño/mtime (default: $SMN_MANIFEST_HASH)
+    archive : str       Carpeta de los archivos de corridas (archive.py): los productos terminados se
+                        agregan a '{archive}/{model}_{prs|sfc}.nc' (init_time x lead_time)
+    catalog : bool|str  Registra los productos terminados en el catálogo SQLite (catalog.py; una ruta
+                        usa ese catálogo en vez de $SMN_CATALOG; False no los registra)
+    -------
+    Retorna:
+    dict        {'prs': ruta, 'sfc': ruta} de los archivos generados.
+    """
+    tipos = TIPOS if tipos is None else tipos
+    set_run(f"{model}_{fecha}{hor}")
+    files = find_leadtime_files(r0, model, fecha, hor) if files is None else files
+    if len(files) == 0:
+        print(f"Sin archivos GRIB para {model} {fecha}{hor} en {r0}")
+        return {}
+    # el modo de escritura (streaming) no cambia los productos, así que no forma parte de la spec
+    clave = f"{model}_{fecha}{hor}"
+    spec = {"tipos": list(tipos), "region": region, "derived": derived, "profile": profile, "backend": backend}
+    registros = load_manifest(run_dir)
+    if incremental and is_valid(registros, clave, files, spec, content_hash):
+        print(f"{clave}: productos vigentes según el manifiesto, no se rehacen")
+        salidas = {os.path.splitext(p)[0].rsplit("_", 1)[-1]: p for p in outputs(registros, clave)}
+        if archive:
+            archive_products(salidas.values(), archive, solo_faltantes=True)
+        return salidas
+    registros.pop(clave, None)
+
+    # n_ok: pasos escritos sin error (el eje de tiempo de un Zarr se crea completo de antemano,
+    # así que no dice cuántos pasos tienen datos)
+    if backend == "zarr":
+        salidas, n_ok = _run_pipeline_zarr(model, fecha, hor, run_dir, files, tipos, workers,
+                                     max_mem_mb, single_pass, profile, region, derived)
+    elif streaming:
+        salidas, n_ok = _run_pipeline_streaming(model, fecha, hor, run_dir, files, tipos, workers,
+                                          max_mem_mb, single_pass, profile, region, derived)
+    else:
+        resultados = _extrae_corrida(model, files, None, tipos, workers, max_mem_mb, single_pass, region=region)
+        pasos = [resultados[f][2] for f in files if resultados[f][0] is None]
+        n_ok = len(pasos)
+
+        os.makedirs(run_dir, exist_ok=True)
+        salidas = {}
+        for var_in, variables in build_products(pasos).items():
+            out_file = os.path.join(run_dir, f"{model}_{fecha}{hor}_{var_in}.nc")
+            print(f"Generando archivo final: {out_file}")
+            merge_files(variables, out_file, profile=profile, derived=derived, archive=archive, catalog=False)
+            salidas[var_in] = out_file
+    if catalog:   # una vez por producto, con la corrida terminada (sin sha1: ver product_checksum)
+        for out_file in salidas.values():
+            register_product(out_file, catalog)
+    if archive and (backend == "zarr" or streaming):
+        # publicados paso a paso: se archivan recién con la corrida completa
+        archive_products(salidas.values(), archive)
+    # sólo una corrida con todos sus pasos queda registrada como vigente
+    if salidas and n_ok == len(files):
+        record(registros, clave, files, spec, salidas.values(), content_hash)
+        save_manifest(run_dir, registros)
+    return salidas
+
+def _run_pipeline_streaming(model, fecha, hor, run_dir, files, tipos, workers, max_mem_mb, single_pass,
+                            profile, region=None, derived=None):
+    # cada paso se publica en modo append apenas termina y se libera: en el proceso
+    # principal nunca hay más de `workers` pasos extraídos a la vez
+    fecha_hor = f"{fecha}{hor}"
+    os.makedirs(run_dir, exist_ok=True)
+    for var_in in DIMS:
+        reset_output(os.path.join(run_dir, f"{model}_{fecha_hor}_{var_in}.nc"))
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    print(f"{model}: {len(files)} pasos, {workers} procesos (paso a paso)")
+
+    nuevo_pool = lambda: ProcessPoolExecutor(max_workers=workers, initializer=_inicia_trabajador,
+                                             initargs=(max_mem_mb, current_run()))
+    pendientes, en_curso, salidas, n, n_ok = list(files), {}, {}, 0, 0
+    pool, roto = nuevo_pool(), False
+    try:
+        while pendientes or en_curso:
+            # un proceso muerto rompe el pool: se rehace cuando se vacía (como en watcher.py)
+            if roto and not en_curso:
+                pool.shutdown()
+                pool, roto = nuevo_pool(), False
+            while pendientes and not roto and len(en_curso) < workers:
+                f = pendientes.pop(0)
+                en_curso[pool.submit(_extrae_paso, model, f, None, tipos, single_pass, None, region)] = f
+            listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for fut in listos:
+                f = en_curso.pop(fut)
+                n += 1
+                try:
+                    error, seg, salida = fut.result()
+                except BrokenProcessPool:
+                    error, seg, salida = "el proceso trabajador terminó abruptamente", 0.0, None
+                    roto = True
+                if error is None:
+                    salidas.update(publish_step(salida, run_dir, model, fecha_hor, profile=profile, derived=derived))
+                    n_ok += 1
+                    print(f"[{n}/{len(files)}] {os.path.basename(f)} ok ({seg:.1f} s)", flush=True)
+                else:
+                    print(f"[{n}/{len(files)}] {os.path.basename(f)} ERROR {error}", flush=True)
+                del salida
+    finally:
+        pool.shutdown()
+    return salidas, n_ok
+
+def _run_pipeline_zarr(model, fecha, hor, run_dir, files, tipos, workers, max_mem_mb, single_pass, profile,
+                       region=None, derived=None):
+    # el primer paso define variables y grilla del esqueleto; el eje de tiempo completo
+    # sale de las horas de pronóstico de los archivos. El resto de los pasos los escriben
+    # los procesos trabajadores, cada uno en su región, y al final se consolidan los metadatos.
+    _zarr()
+    inicio = pd.to_datetime(f"{fecha}{hor}", format="%Y%m%d%H")
+    times = [inicio + pd.Timedelta(hours=lead_hour(f)) for f in files]
+    for k, f in enumerate(files):
+        error, seg, salida = _extrae_paso(model, f, None, tipos, single_pass, region=region)
+        if error is None:
+            break
+        print(f"{os.path.basename(f)} ERROR {error}")
+    else:
+        return {}, 0
+
+    os.makedirs(run_dir, exist_ok=True)
+    stores, tablas = {}, {}
+    for var_in, variables in build_products([salida]).items():
+        store = os.path.join(run_dir, f"{model}_{fecha}{hor}_{var_in}.zarr")
+        print(f"Generando almacén Zarr: {store}")
+        template = add_derived(merge_datasets(variables, store), derived)
+        init_store(template, store, times, profile)
+        write_region(template, store)
+        stores[var_in] = store
+        tablas[var_in] = [compute_stats(template)]
+    n_ok = 1
+    if files[k + 1:]:
+        resultados = _extrae_corrida(model, files[k + 1:], None, tipos, workers, max_mem_mb, single_pass,
+                                     stores, region)
+        for error, seg, paso in resultados.values():
+            if error is None:
+                n_ok += 1
+                for var_in, tabla in paso.items():
+                    tablas[var_in].append(tabla)
+    for var_in, store in stores.items():
+        # tabla y atributos 'stats_*' con los estadísticos que calcularon los trabajadores
+        combinada = {}
+        for tabla in tablas[var_in]:
+            for clave, por_paso in tabla.items():
+                combinada.setdefault(clave, {}).update(por_paso)
+        # precipitación del intervalo: cada trabajador sólo conocía su propio paso
+        corregidos = fix_intervals(store, times)
+        if corregidos is not None:
+            for clave, por_paso in compute_stats(corregidos).items():
+                combinada[clave].update(por_paso)
+        store_attrs(store, save_stats(store, combinada))
+        finalize_store(store)
+    return stores, n_ok
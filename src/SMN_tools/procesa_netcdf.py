@@ -3,7 +3,64 @@
 import os
 import xarray as xr
 from .rename_clean import rename_and_clean
-def process_netcdf_files(list_files, prefix_out, new_dims):
+from .append_netcdf import append_netcdf
+from .nc_encoding import build_encoding
+from .zarr_store import to_zarr_store, is_zarr
+from .regions import crop
+from .field_stats import add_stats, compute_stats, summarize, store_attrs
+from .derived import add_derived, fix_intervals
+from .streaming import use_streaming, reset_output
+from .profiling import profiled
+from .manifest import atomic_path
+from .stages import overlapped, NETCDF_LOCK
+@profiled("combine")
+def combine_datasets(datasets, new_dims):
+    """
+    Concatena en el tiempo los datasets (ya uniformizados con rename_and_clean) de una
+    variable, ordena por tiempo y añade metadatos CF mínimos.
+    Parámetros
+    ----------
+    datasets : list        Lista de xr.Dataset, uno por paso de tiempo.
+    new_dims : list        Lista con los nombres de dimensiones de salida.
+    Retorna
+    -------
+    xr.Dataset        Dataset combinado.
+    """
+    # concatenar en la dimensión de tiempo
+    time_dim = new_dims[0]
+    #combined = xr.concat(datasets, dim=time_dim)
+    #combined = xr.concat(datasets, dim=time_dim, coords="minimal")
+    combined = xr.concat(datasets, dim=time_dim, coords="minimal", compat="override")  
+    combined = combined.sortby("time", ascending=True)
+    # añadir metadatos CF mínimos
+    combined[time_dim].attrs.update({"standard_name": "time", "long_name": "time"})
+    if "latitude" in new_dims:
+        combined["latitude"].attrs.update({"standard_name": "latitude", "units": "degrees_north"})
+    if "longitude" in new_dims:
+        combined["longitude"].attrs.update({"standard_name": "longitude", "units": "degrees_east"})
+    if "isobaricInhPa" in new_dims:
+        combined["isobaricInhPa"].attrs.update({"standard_name": "air_pressure", "units": "hPa"})
+    return combined
+
+@profiled("write", archivo="out_file")
+def _escribe(combined, out_file, append, profile, time_dim):
+    # guarda comprimido según el perfil (default: zlib nivel 5); retorna los pasos escritos
+    if is_zarr(out_file):
+        nuevos = to_zarr_store(combined, out_file, profile, append=append, time_dim=time_dim)
+    elif append:
+        encoding = build_encoding(combined, profile, unlimited_dims=[time_dim])
+        nuevos = append_netcdf(combined, out_file, time_dim=time_dim, encoding=encoding)
+    else:
+        with atomic_path(out_file) as tmp:
+            combined.to_netcdf(tmp, encoding=build_encoding(combined, profile), format="NETCDF4")
+        return list(combined[time_dim].values)
+    if append:
+        fix_intervals(out_file, nuevos, time_dim)
+    return nuevos
+
+@profiled("process")
+def process_netcdf_files(list_files, prefix_out, new_dims, append=False, profile=None, backend="netcdf",
+                         region=None, derived=None, streaming=False, max_mem_mb=None):
     """
     Une varios archivos NetCDF, renombra dimensiones/variables con ayuda de rename_and_clean,
     elimina coords extra, añade metadatos CF y guarda comprimido.
@@ -12,42 +69,65 @@ def process_netcdf_files(list_files, prefix_out, new_dims):
     list_files : list        Lista de rutas a archivos NetCDF, ej: ["10u_006.nc", "10u_009.nc", ...]
     prefix_out : str        Prefijo para el archivo de salida (ej. "sfc", "prs").
     new_dims : list        Lista con los nuevos nombres de dimensiones.        
+    append : bool        Agrega sólo los pasos nuevos al archivo existente (tiempo ilimitado),
+                         sin reescribir los anteriores (default: False, reescribe todo).
+    profile : str | dict        Perfil de compresión/cuantización/chunks (ver nc_encoding.PERFILES).
+    backend : str        'netcdf' ({prefix}_tmp_{var}.nc) o 'zarr' ({prefix}_tmp_{var}.zarr).
+    region : str | tuple        Recorta a una región (regions.REGIONES) o bbox; sólo se lee la ventana.
+    derived : list | str        Variables derivadas de esta variable que se escriben junto a ella
+                                (ej. ['tp_int', 't2m_c']; las de varias entradas las agrega merge_files).
+    streaming : bool        Lee y escribe un archivo (paso) a la vez, sin concatenar la serie en memoria.
+    max_mem_mb : float        Techo de memoria: si la serie completa no cabe, se escribe paso a paso
+                              (default: $SMN_MAX_MEM_MB; ver streaming.py).
     """
+    time_dim = new_dims[0]
     datasets = []
     for file in list_files:
         # nombre de la variable a partir del archivo
         var_name = os.path.basename(file).split("_")[0]
         # archivo temporal de salida intermedio (no se usará en disco, pero requerido por la interfaz)
         tmp_out = os.path.join(os.path.dirname(file), f"tmp_{var_name}.nc")
-        # usar rename_and_clean
+        # usar rename_and_clean (abre el archivo sin leer los datos)
         ds = rename_and_clean(file, tmp_out, var_name, new_dims)
+        ds = crop(ds, region, new_dims[-2], new_dims[-1])
         print("#" * 10)
         datasets.append(ds)
         #print(ds)
-        
-
-    # concatenar en la dimensión de tiempo
-    time_dim = new_dims[0]
-    #combined = xr.concat(datasets, dim=time_dim)
-    #combined = xr.concat(datasets, dim=time_dim, coords="minimal")
-    combined = xr.concat(datasets, dim=time_dim, coords="minimal", compat="override")  
-    combined = combined.sortby("time", ascending=True)
-    # añadir metadatos CF mínimos
-    combined[time_dim].attrs.update({"standard_name": "time", "long_name": "time"})
-    if "latitude" in new_dims:
-        combined["latitude"].attrs.update({"standard_name": "latitude", "units": "degrees_north"})
-    if "longitude" in new_dims:
-        combined["longitude"].attrs.update({"standard_name": "longitude", "units": "degrees_east"})
-    if "isobaricInhPa" in new_dims:
-        combined["isobaricInhPa"].attrs.update({"standard_name": "air_pressure", "units": "hPa"})
 
     # nombre de salida dinámico
-    var_name_out = list(combined.data_vars.keys())[0]
+    var_name_out = list(datasets[0].data_vars.keys())[0]
     out_dir = os.path.dirname(list_files[0])
-    out_file = os.path.join(out_dir, f"{prefix_out}_tmp_{var_name_out}.nc")
+    out_file = os.path.join(out_dir, f"{prefix_out}_tmp_{var_name_out}.{'zarr' if backend == 'zarr' else 'nc'}")
+
+    if use_streaming(sum(ds.nbytes for ds in datasets), streaming, max_mem_mb):
+        # un paso a la vez en orden de tiempo; los estadísticos se acumulan por paso
+        if not append:
+            reset_output(out_file)
+        def prepara(ds):
+            # hilo productor: lectura, derivadas y estadísticos del paso N+1 mientras se escribe el N
+            with NETCDF_LOCK:
+                paso = combine_datasets([ds], new_dims).load()
+            add_derived(paso, derived, time_dim)
+            return paso, compute_stats(paso, time_dim)
 
-    # guardar comprimido con zlib
-    encoding = {var: {"zlib": True, "complevel": 5} for var in combined.data_vars}
-    combined.to_netcdf(out_file, encoding=encoding, format="NETCDF4")
-    print(f"Archivo generado: {out_file}")
+        tabla, n = {}, 0
+        for _, (paso, stats) in overlapped(sorted(datasets, key=lambda d: d[time_dim].values.min()), prepara):
+            for clave, por_paso in stats.items():
+                tabla.setdefault(clave, {}).update(por_paso)
+            with NETCDF_LOCK:
+                n += len(_escribe(paso, out_file, True, profile, time_dim))
+        store_attrs(out_file, {clave: summarize(por_paso.values()) for clave, por_paso in tabla.items()})
+        print(f"Archivo generado paso a paso: {out_file} ({n} pasos)")
+        return
 
+    combined = combine_datasets(datasets, new_dims).load()
+    add_derived(combined, derived, time_dim)
+    # resumen de estadísticos en los atributos 'stats_*' (la tabla por paso la guarda merge_files)
+    add_stats(combined, time_dim=time_dim)
+    nuevos = _escribe(combined, out_file, append, profile, time_dim)
+    if backend == "zarr":
+        print(f"Almacén Zarr generado: {out_file} ({len(nuevos)} pasos)")
+    elif append:
+        print(f"Archivo actualizado: {out_file} ({len(nuevos)} pasos nuevos)")
+    else:
+        print(f"Archivo generado: {out_file}")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+# destino de las mediciones: ruta de un archivo JSON lines, '-' (stderr) o 'logger'
+# (logging 'SMN_tools.profiling'); sin valor la instrumentación no hace nada
+ENV = "SMN_PROFILE"
+
+_CORRIDA = contextvars.ContextVar("corrida", default=None)
+_PILA = threading.local()     # etapas abiertas del hilo (para los tiempos propios)
+_NULO = nullcontext()
+_lock = threading.Lock()
+
+def enabled():
+    """Indica si la instrumentación está activa ($SMN_PROFILE)."""
+    return bool(os.environ.get(ENV))
+
+def enable(destino):
+    """
+    Activa la instrumentación en este proceso y en los procesos trabajadores que cree
+    después (heredan $SMN_PROFILE). `destino`: archivo JSON lines, '-' o 'logger'.
+    """
+    if destino not in (None, "-", "logger"):
+        destino = os.path.abspath(destino)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+    if destino:
+        os.environ[ENV] = destino
+
+def set_run(corrida):
+    """
+    Corrida a la que se atribuyen las etapas de este hilo (ej. 'PERU_WRF22_2025010106'),
+    incluidas las ya abiertas sin corrida (la de run_pipeline que la fija).
+    """
+    _CORRIDA.set(corrida)
+    for abierta in getattr(_PILA, "etapas", None) or []:
+        if abierta["registro"]["corrida"] is None:
+            abierta["registro"]["corrida"] = corrida
+
+def current_run():
+    """Corrida actual (para pasarla a los procesos trabajadores, ver run_driver._inicia_trabajador)."""
+    return _CORRIDA.get()
+
+def _io():
+    # bytes leídos/escritos por el proceso (rchar/wchar: incluye caché de páginas); None fuera de Linux
+    try:
+        with open("/proc/self/io") as f:
+            campos = dict(linea.split(":") for linea in f.read().splitlines())
+        return int(campos["rchar"]), int(campos["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _rss_pico_mb():
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / 2**20 if sys.platform == "darwin" else pico / 2**10   # bytes en macOS, KB en Linux
+    except (ImportError, OSError):
+        return None
+
+def _emite(registro):
+    destino = os.environ.get(ENV)
+    linea = json.dumps(registro, default=str)
+    if destino == "logger":
+        logging.getLogger("SMN_tools.profiling").info(linea)
+    elif destino == "-":
+        print(linea, file=sys.stderr, flush=True)
+    elif destino:
+        try:
+            # una línea por write en modo append: varios procesos pueden compartir el archivo
+            with _lock, open(destino, "a") as f:
+                f.write(linea + "\n")
+        except OSError as e:
+            print(f"No se pudo escribir la medición en {destino}: {e}")
+
+@contextmanager
+def _mide(etapa, campos):
+    pila = getattr(_PILA, "etapas", None)
+    if pila is None:
+        pila = _PILA.etapas = []
+    registro = {"etapa": etapa, "corrida": _CORRIDA.get(), "pid": os.getpid(),
+                "padre": pila[-1]["registro"]["etapa"] if pila else None, **campos}
+    hijos = {"wall": 0.0, "cpu": 0.0, "leidos": 0, "escritos": 0}
+    pila.append({"registro": registro, "hijos": hijos})
+    io0, t0, c0 = _io(), time.perf_counter(), time.process_time()
+    registro["inicio"] = time.time()
+    try:
+        yield registro
+    except BaseException as e:
+        registro["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        wall, cpu, io1 = time.perf_counter() - t0, time.process_time() - c0, _io()
+        pila.pop()
+        leidos, escritos = (io1[0] - io0[0], io1[1] - io0[1]) if io0 and io1 else (None, None)
+        # tiempos y bytes propios: sin los de las etapas anidadas (suman el total sin repetir)
+        registro.update(wall_s=wall, cpu_s=cpu, wall_propio_s=wall - hijos["wall"],
+                        cpu_propio_s=cpu - hijos["cpu"], rss_pico_mb=_rss_pico_mb())
+        if leidos is not None:
+            registro.update(bytes_leidos=leidos - hijos["leidos"], bytes_escritos=escritos - hijos["escritos"])
+        if pila:
+            padre = pila[-1]["hijos"]
+            padre["wall"] += wall
+            padre["cpu"] += cpu
+            padre["leidos"] += leidos or 0
+            padre["escritos"] += escritos or 0
+        _emite(registro)
+
+def stage(etapa, **campos):
+    """
+    Mide un bloque como etapa `etapa` (with stage('decode', archivo=f): ...): tiempo de reloj
+    y de CPU, bytes leídos y escritos, RSS pico y los `campos` dados. Con la instrumentación
+    desactivada retorna un contexto nulo (costo de una consulta a os.environ).
+    """
+    if not enabled():
+        return _NULO
+    return _mide(etapa, campos)
+
+def note(**campos):
+    """Agrega campos (ej. mensajes=n) a la etapa abierta más interna del hilo."""
+    pila = getattr(_PILA, "etapas", None)
+    if pila:
+        pila[-1]["registro"].update(campos)
+
+def profiled(etapa, archivo=None):
+    """
+    Decorador: mide cada llamada como etapa `etapa`; `archivo` es el nombre del
+    argumento (ej. 'gribfile') cuyo valor se registra como archivo de la etapa.
+    """
+    def decorador(funcion):
+        posicion = funcion.__code__.co_varnames.index(archivo) if archivo else None
+        @functools.wraps(funcion)
+        def medida(*args, **kwargs):
+            if not enabled():
+                return funcion(*args, **kwargs)
+            campos = {}
+            if archivo:
+                valor = kwargs.get(archivo, args[posicion] if posicion < len(args) else None)
+                campos["archivo"] = valor if isinstance(valor, (str, type(None))) else str(valor)
+            with _mide(etapa, campos):
+                return funcion(*args, **kwargs)
+        return medida
+    return decorador
+
+def load_profile(archivos):
+    """Lee las mediciones (JSON lines) de uno o varios archivos en un pandas.DataFrame."""
+    import pandas as pd
+    archivos = [archivos] if isinstance(archivos, str) else archivos
+    registros = []
+    for path in archivos:
+        with open(path) as f:
+            registros.extend(json.loads(linea) for linea in f if linea.strip())
+    return pd.DataFrame(registros)
+
+def profile_summary(archivos, por="corrida"):
+    """
+    Resumen de las mediciones por corrida (o `por` otra columna, ej. 'archivo') y etapa:
+    llamadas, tiempos propios de reloj y CPU (s), MB leídos y escritos, mensajes GRIB,
+    RSS pico (MB) y errores. Los tiempos propios no incluyen las etapas anidadas, así que
+    la suma de las etapas de una corrida es su tiempo total.
+    """
+    df = load_profile(archivos)
+    if df.empty:
+        return df
+    for columna in ("corrida", "archivo", "mensajes", "bytes_leidos", "bytes_escritos", "error"):
+        if columna not in df:
+            df[columna] = None
+    df[por] = df[por].fillna("-")
+    df["mb_leidos"] = df["bytes_leidos"].astype("f8") / 2**20
+    df["mb_escritos"] = df["bytes_escritos"].astype("f8") / 2**20
+    resumen = df.groupby([por, "etapa"]).agg(
+        llamadas=("etapa", "size"), wall_s=("wall_propio_s", "sum"), cpu_s=("cpu_propio_s", "sum"),
+        mb_leidos=("mb_leidos", "sum"), mb_escritos=("mb_escritos", "sum"),
+        mensajes=("mensajes", lambda s: s.astype("f8").sum()), rss_pico_mb=("rss_pico_mb", "max"),
+        errores=("error", "count"))
+    resumen["pct_wall"] = 100 * resumen["wall_s"] / resumen.groupby(level=0)["wall_s"].transform("sum")
+    return resumen.sort_values([por, "wall_s"], ascending=[True, False]).reset_index()
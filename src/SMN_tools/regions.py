@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# regiones con nombre: (lon_min, lat_min, lon_max, lat_max) en grados, longitudes -180..180
+REGIONES = {
+    'peru':        (-81.5, -18.5, -68.5, 0.5),
+    'lima':        (-77.9, -13.0, -76.0, -10.8),
+    'costa_norte': (-81.5, -8.5, -78.0, -3.3),
+    'costa_sur':   (-76.5, -18.5, -70.0, -13.0),
+    'sierra_sur':  (-74.5, -17.5, -68.5, -12.5),
+    'amazonia':    (-78.0, -11.5, -69.5, -0.5),
+}
+
+# recortes ya calculados en este proceso, por huella de grilla y bbox
+_RECORTES = {}
+
+def get_region(region):
+    """
+    Bbox (lon_min, lat_min, lon_max, lat_max) de una región: nombre de REGIONES,
+    tupla de 4 valores, o None (dominio completo).
+    """
+    if region is None:
+        return None
+    if isinstance(region, str):
+        if region not in REGIONES:
+            raise ValueError(f"Región '{region}' no existe; opciones: {list(REGIONES)}")
+        return REGIONES[region]
+    bbox = tuple(float(x) for x in region)
+    if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        raise ValueError(f"bbox inválido {region}: se espera (lon_min, lat_min, lon_max, lat_max)")
+    return bbox
+
+def parse_region(valores):
+    """Región desde la línea de comandos: ['lima'] o ['-78', '-13', '-76', '-11']."""
+    if not valores:
+        return None
+    return get_region(valores[0] if len(valores) == 1 else valores)
+
+def _indices(coord, vmin, vmax):
+    idx = np.flatnonzero((coord >= vmin) & (coord <= vmax))
+    return slice(int(idx[0]), int(idx[-1]) + 1) if idx.size else None
+
+def region_slices(lat, lon, region):
+    """
+    Slices de índices (lat, lon) de una región sobre coordenadas 1D monótonas (crecientes
+    o decrecientes, longitudes -180..180 o 0..360), calculados una vez por grilla.
+    ----------
+    Parámetros:
+    lat, lon : array    Latitudes y longitudes 1D del dominio.
+    region : str | tuple    Nombre de REGIONES o bbox (lon_min, lat_min, lon_max, lat_max).
+    -------
+    Retorna:
+    tuple       (slice_lat, slice_lon)
+    """
+    bbox = get_region(region)
+    lat, lon = np.asarray(lat), np.asarray(lon)
+    clave = (lat.size, float(lat[0]), float(lat[-1]), lon.size, float(lon[0]), float(lon[-1]), bbox)
+    recorte = _RECORTES.get(clave)
+    if recorte is not None:
+        return recorte
+
+    lon_min, lat_min, lon_max, lat_max = bbox
+    if lon.max() > 180 and lon_min < 0:   # grilla en 0..360
+        lon_min, lon_max = lon_min % 360, lon_max % 360
+    s_lat, s_lon = _indices(lat, lat_min, lat_max), _indices(lon, lon_min, lon_max)
+    if s_lat is None or s_lon is None:
+        raise ValueError(f"La región {bbox} no intersecta el dominio "
+                         f"(lat {lat.min():.2f}..{lat.max():.2f}, lon {lon.min():.2f}..{lon.max():.2f})")
+    _RECORTES[clave] = (s_lat, s_lon)
+    return s_lat, s_lon
+
+def crop(ds, region, coord_lat='latitude', coord_lon='longitude'):
+    """
+    Recorta un dataset estructurado (lat, lon) a una región. Sobre datasets abiertos de
+    disco (lazy) sólo se lee la ventana. Con region=None retorna el dataset sin cambios.
+    """
+    if region is None:
+        return ds
+    s_lat, s_lon = region_slices(ds[coord_lat].values, ds[coord_lon].values, region)
+    return ds.isel({coord_lat: s_lat, coord_lon: s_lon})
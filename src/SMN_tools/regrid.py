@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import numpy as np
+import xarray as xr
+from .catalog import grid_fingerprint
+from .regions import get_region
+from .manifest import atomic_path
+from .zarr_store import is_zarr
+from .field_stats import drop_stats
+from .profiling import profiled
+
+# interpolación entre grillas lat/lon rectilíneas (productos de extrac_ETA / make_structured).
+# Los pesos de cada par (grilla origen, grilla destino, método) se calculan una sola vez y se
+# guardan como matriz dispersa en $SMN_REGRID_CACHE (default ~/.cache/SMN_tools/regrid)
+ENV = "SMN_REGRID_CACHE"
+METODOS = ("bilinear", "conservative")
+FORMATO = 1
+# fracción mínima del punto destino cubierta por datos válidos (conservative)
+MIN_COBERTURA = 0.5
+# valores (pasos x niveles x pesos) por bloque al aplicar los pesos sin scipy
+LIMITE = 1 << 24
+
+# pesos ya usados en este proceso, por clave (como _RECORTES en regions.py)
+_PESOS = {}
+
+def _sparse():
+    # scipy es opcional: con él los pesos se aplican como producto de matriz dispersa CSR
+    try:
+        import scipy.sparse as sp
+        return sp
+    except ImportError:
+        return None
+
+def cache_dir():
+    """Carpeta de los pesos: $SMN_REGRID_CACHE o ~/.cache/SMN_tools/regrid."""
+    return os.environ.get(ENV) or os.path.join(os.path.expanduser("~"), ".cache", "SMN_tools", "regrid")
+
+def target_grid(region, res):
+    """
+    Grilla regular (lat, lon) de paso `res` grados sobre una región (regions.REGIONES)
+    o bbox (lon_min, lat_min, lon_max, lat_max).
+    """
+    lon_min, lat_min, lon_max, lat_max = get_region(region)
+    lat = np.arange(lat_min, lat_max + res / 2, res)
+    lon = np.arange(lon_min, lon_max + res / 2, res)
+    return np.round(lat, 6), np.round(lon, 6)
+
+def _bordes(x, lat=False):
+    # bordes de las celdas de un eje ordenado de forma creciente
+    medio = (x[1:] + x[:-1]) / 2
+    bordes = np.concatenate([[x[0] - (x[1] - x[0]) / 2], medio, [x[-1] + (x[-1] - x[-2]) / 2]])
+    # en latitud la superficie de la celda es proporcional a sin(lat)
+    return np.sin(np.deg2rad(np.clip(bordes, -90, 90))) if lat else bordes
+
+def _eje_bilinear(xs, xt):
+    # pesos 1D (n_destino, 2) de interpolación lineal; fuera del eje los pesos son 0
+    orden = np.argsort(xs)
+    xs = xs[orden]
+    i = np.clip(np.searchsorted(xs, xt, side="right") - 1, 0, len(xs) - 2)
+    f = (xt - xs[i]) / (xs[i + 1] - xs[i])
+    dentro = (xt >= xs[0]) & (xt <= xs[-1])
+    pesos = np.where(dentro[:, None], np.stack([1 - f, f], axis=1), 0.0)
+    return orden[np.stack([i, i + 1], axis=1)], pesos
+
+def _eje_conservative(xs, xt, lat=False):
+    # pesos 1D por superposición de celdas, normalizados por el tamaño de la celda destino
+    orden_s, orden_t = np.argsort(xs), np.argsort(xt)
+    bs, bt = _bordes(xs[orden_s], lat), _bordes(xt[orden_t], lat)
+    filas = []
+    for j in range(len(xt)):
+        a, b = bt[j], bt[j + 1]
+        i0 = np.searchsorted(bs[1:], a, side="right")
+        i1 = np.searchsorted(bs[:-1], b, side="left")
+        i = np.arange(i0, max(i0, i1))
+        solape = np.clip(np.minimum(bs[i + 1], b) - np.maximum(bs[i], a), 0, None) / (b - a)
+        filas.append((orden_s[i], solape))
+    k = max(1, max(len(i) for i, _ in filas))
+    idx, pesos = np.zeros((len(xt), k), dtype="i8"), np.zeros((len(xt), k))
+    for j, (i, w) in zip(orden_t, filas):
+        idx[j, :len(i)], pesos[j, :len(i)] = i, w
+    return idx, pesos
+
+class Pesos:
+    """
+    Matriz dispersa de interpolación (n_destino x n_origen) en formato ELL: `indices` y
+    `pesos` de forma (n_destino, k), con pesos 0 de relleno.
+    """
+    def __init__(self, indices, pesos, forma_origen, forma_destino, metodo):
+        self.indices, self.pesos = indices, pesos
+        self.forma_origen, self.forma_destino = tuple(forma_origen), tuple(forma_destino)
+        self.metodo = metodo
+        self._csr = None
+        self.cobertura = self._producto(np.ones((1, int(np.prod(self.forma_origen))), dtype="f8"))[0]
+
+    def _producto(self, valores):
+        # (N, n_origen) -> (N, n_destino): un solo producto matricial para todos los pasos y niveles
+        sp = _sparse()
+        if sp is not None:
+            if self._csr is None:
+                nt, k = self.pesos.shape
+                self._csr = sp.csr_matrix((self.pesos.ravel(), (np.repeat(np.arange(nt), k), self.indices.ravel())),
+                                          shape=(nt, int(np.prod(self.forma_origen))))
+            return np.asarray(self._csr.dot(valores.T).T)
+        n = max(1, LIMITE // self.pesos.size)
+        return np.concatenate([np.einsum("btk,tk->bt", valores[b:b + n][:, self.indices], self.pesos)
+                               for b in range(0, len(valores), n)])
+
+    def apply(self, campos):
+        """
+        Interpola campos (..., lat, lon) de la grilla origen a la destino. Los puntos sin datos
+        suficientes (fuera del dominio, vecinos NaN en bilinear, cobertura < MIN_COBERTURA en
+        conservative) quedan en NaN.
+        """
+        campos = np.asarray(campos)
+        previa = campos.shape[:-2]
+        valores = campos.reshape(-1, int(np.prod(self.forma_origen)))
+        validos = np.isfinite(valores)
+        if validos.all():
+            suma, peso = self._producto(valores.astype("f8")), self.cobertura[None, :]
+        else:
+            suma = self._producto(np.where(validos, valores, 0).astype("f8"))
+            peso = self._producto(validos.astype("f8"))
+        minimo = 1 - 1e-6 if self.metodo == "bilinear" else MIN_COBERTURA
+        with np.errstate(invalid="ignore", divide="ignore"):
+            salida = np.where(peso >= minimo, suma / peso, np.nan)
+        tipo = campos.dtype if campos.dtype.kind == "f" else np.dtype("f4")
+        return salida.astype(tipo).reshape(previa + self.forma_destino)
+
+    def save(self, path):
+        with atomic_path(path) as tmp:
+            with open(tmp, "wb") as f:
+                np.savez(f, indices=self.indices.astype("i4" if self.indices.max(initial=0) < 2**31 else "i8"),
+                         pesos=self.pesos.astype("f4"), forma_origen=self.forma_origen,
+                         forma_destino=self.forma_destino, metodo=self.metodo, formato=FORMATO)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            if int(z["formato"]) != FORMATO:
+                raise ValueError(f"{path}: formato de pesos {int(z['formato'])} (se espera {FORMATO})")
+            return cls(z["indices"].astype("i8"), z["pesos"].astype("f8"), z["forma_origen"],
+                       z["forma_destino"], str(z["metodo"]))
+
+def _clave(src_lat, src_lon, tgt_lat, tgt_lon, method):
+    h = hashlib.sha1(f"{method}:{FORMATO}:{grid_fingerprint(src_lat, src_lon)}:"
+                     f"{grid_fingerprint(tgt_lat, tgt_lon)}".encode())
+    return h.hexdigest()[:20]
+
+@profiled("regrid_weights")
+def _calcula(src_lat, src_lon, tgt_lat, tgt_lon, method):
+    # longitudes destino en la convención del origen (-180..180 o 0..360)
+    centro = (src_lon.min() + src_lon.max()) / 2
+    tgt_lon = (tgt_lon - centro + 180) % 360 + centro - 180
+    if method == "bilinear":
+        (ilat, wlat), (ilon, wlon) = _eje_bilinear(src_lat, tgt_lat), _eje_bilinear(src_lon, tgt_lon)
+    else:
+        (ilat, wlat), (ilon, wlon) = _eje_conservative(src_lat, tgt_lat, lat=True), _eje_conservative(src_lon, tgt_lon)
+    # pesos 2D = producto de los pesos de cada eje (grillas rectilíneas)
+    nx = len(src_lon)
+    indices = ilat[:, None, :, None] * nx + ilon[None, :, None, :]
+    pesos = wlat[:, None, :, None] * wlon[None, :, None, :]
+    n = len(tgt_lat) * len(tgt_lon)
+    return Pesos(indices.reshape(n, -1), pesos.reshape(n, -1), (len(src_lat), nx),
+                 (len(tgt_lat), len(tgt_lon)), method)
+
+def grid_weights(src_lat, src_lon, tgt_lat, tgt_lon, method="bilinear", cache=None):
+    """
+    Pesos de interpolación de una grilla lat/lon 1D a otra. Se calculan una sola vez por par
+    de grillas y método: quedan en memoria y en '{cache}/{método}_{clave}.npz' (clave a partir
+    de las huellas de ambas grillas, catalog.grid_fingerprint).
+    ----------
+    Parámetros:
+    src_lat, src_lon : array    Coordenadas 1D de la grilla origen.
+    tgt_lat, tgt_lon : array    Coordenadas 1D de la grilla destino.
+    method : str                'bilinear' o 'conservative' (promedio ponderado por área).
+    cache : str                 Carpeta de los pesos (default: cache_dir(); False: sin disco).
+    -------
+    Retorna:
+    Pesos
+    """
+    if method not in METODOS:
+        raise ValueError(f"Método '{method}' no reconocido; opciones: {METODOS}")
+    src_lat, src_lon, tgt_lat, tgt_lon = (np.asarray(x, dtype="f8") for x in (src_lat, src_lon, tgt_lat, tgt_lon))
+    if min(x.ndim for x in (src_lat, src_lon, tgt_lat, tgt_lon)) != 1 or \
+            max(x.ndim for x in (src_lat, src_lon, tgt_lat, tgt_lon)) != 1:
+        raise ValueError("Sólo grillas rectilíneas (latitude/longitude 1D)")
+    clave = _clave(src_lat, src_lon, tgt_lat, tgt_lon, method)
+    if clave in _PESOS:
+        return _PESOS[clave]
+    path = None if cache is False else os.path.join(cache or cache_dir(), f"{method}_{clave}.npz")
+    pesos = None
+    if path and os.path.exists(path):
+        try:
+            pesos = Pesos.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Pesos ilegibles en {path}, se recalculan: {e}")
+    if pesos is None:
+        pesos = _calcula(src_lat, src_lon, tgt_lat, tgt_lon, method)
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                pesos.save(path)
+            except OSError as e:
+                print(f"No se pudieron guardar los pesos en {path}: {e}")
+    _PESOS[clave] = pesos
+    return pesos
+
+def _grilla(target):
+    # (lat, lon) de un destino: dataset, ruta de un producto o tupla (lat, lon)
+    if isinstance(target, (xr.Dataset, xr.DataArray)):
+        return target["latitude"].values, target["longitude"].values
+    if isinstance(target, (str, os.PathLike)):
+        with (xr.open_zarr(target) if is_zarr(target) else xr.open_dataset(target)) as ds:
+            return ds["latitude"].values, ds["longitude"].values
+    lat, lon = target
+    return np.asarray(lat), np.asarray(lon)
+
+@profiled("regrid")
+def regrid(ds, target, method="bilinear", variables=None, cache=None):
+    """
+    Interpola un producto (o dataset) a otra grilla lat/lon: todas las variables con
+    (latitude, longitude) como últimas dimensiones, con todos sus pasos y niveles en un
+    solo producto de matriz dispersa por variable (ver grid_weights).
+    ----------
+    Parámetros:
+    ds : str | xr.Dataset   Producto o dataset de origen.
+    target                  Grilla destino: otro producto o dataset, tupla (lat, lon) o target_grid(...).
+    method : str            'bilinear' o 'conservative'.
+    variables : list        Variables a interpolar (default: todas las que estén en la grilla).
+    cache : str             Carpeta de los pesos (default: $SMN_REGRID_CACHE).
+    -------
+    Retorna:
+    xr.Dataset  Dataset en la grilla destino (mismos atributos, coordenadas y dimensiones restantes).
+    """
+    propio = not isinstance(ds, xr.Dataset)
+    if propio:
+        ds = xr.open_zarr(ds) if is_zarr(ds) else xr.open_dataset(ds)
+    try:
+        tgt_lat, tgt_lon = _grilla(target)
+        pesos = grid_weights(ds["latitude"].values, ds["longitude"].values, tgt_lat, tgt_lon, method, cache)
+        salida = xr.Dataset(attrs=dict(ds.attrs))
+        for var, da in ds.data_vars.items():
+            if (variables is not None and var not in variables) or da.dims[-2:] != ("latitude", "longitude"):
+                continue
+            # los 'stats_*' (field_stats) son de la grilla de origen: se quitan
+            salida[var] = drop_stats(xr.DataArray(pesos.apply(da.values), dims=da.dims, attrs=dict(da.attrs),
+                                                  coords={d: ds[d] for d in da.dims[:-2] if d in ds.coords}))
+        salida = salida.assign_coords(latitude=("latitude", np.asarray(tgt_lat, dtype="f8"), ds["latitude"].attrs),
+                                      longitude=("longitude", np.asarray(tgt_lon, dtype="f8"), ds["longitude"].attrs))
+        salida.attrs["history"] = f"{ds.attrs.get('history', '')}; regrid {method}".strip("; ")
+        return salida
+    finally:
+        if propio:
+            ds.close()
@@ -37,15 +37,16 @@ def rename_and_clean(input_file, output_file, var_name_out, dims_out):
     Uniformiza un NetCDF: renombra dimensiones, variables y guarda con compresión.
     ----------
     Parámetros:    
-    input_file : str        Ruta del archivo NetCDF de entrada.
+    input_file : str | xr.Dataset        Ruta del archivo NetCDF de entrada, o dataset ya en memoria.
     output_file : str        Ruta del archivo NetCDF de salida.
     var_name_out : str        Nombre de la variable principal en el archivo de salida.
     dims_out : list    Lista con los nombres de las dimensiones de salida.
     -------
     Retorna:    xr.Dataset        Dataset transformado y limpio.
     """
-    # Abrir dataset
-    ds = xr.open_dataset(input_file, decode_times=True, decode_timedelta=False)
+    # Abrir dataset (o usar el dataset en memoria)
+    if isinstance(input_file, xr.Dataset): ds = input_file
+    else: ds = xr.open_dataset(input_file, decode_times=True, decode_timedelta=False)
 
     # Detectar variable principal
     var_in = [v for v in ds.data_vars][0]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import xarray as xr
+from .make_paleta import get_cmap_norm, get_contour
+from .field_stats import stats_range
+
+# conversión de unidades para graficar: (umbral, función, unidades); se aplica si max > umbral
+# (como en cods/test_plot.py: Pa -> hPa, K -> °C)
+CONVERSIONES = {
+    'prmsl': (2000, lambda x: x / 100.0, "hPa"),
+    'mslet': (2000, lambda x: x / 100.0, "hPa"),
+    't2m':   (200, lambda x: x - 273.15, "°C"),
+    'd2m':   (200, lambda x: x - 273.15, "°C"),
+}
+# mapas por tarea: cada tarea reutiliza una figura para un bloque de pasos
+FRAMES_POR_TAREA = 24
+
+@lru_cache(maxsize=None)
+def _paleta(var, rango):
+    # cmap/norm/contornos de una variable, una vez por proceso (rango fijo en toda la corrida)
+    vmin, vmax = rango
+    if vmax <= vmin:
+        vmax = vmin + 1.0
+    cmap, norm, clevs = get_cmap_norm(var, data_range=(vmin, vmax))
+    return cmap, norm, get_contour(var)
+
+def _convierte(var, valores, umbral_max):
+    conv = CONVERSIONES.get(var)
+    if conv is not None and umbral_max > conv[0]:
+        return conv[1](valores), conv[2]
+    return valores, None
+
+def _quita(cs):
+    # quita un ContourSet y sus etiquetas (ContourSet es un Artist desde matplotlib 3.8)
+    from matplotlib.artist import Artist
+    if isinstance(cs, Artist):
+        cs.remove()
+        return
+    for c in cs.collections:
+        c.remove()
+    for t in cs.labelTexts:
+        t.remove()
+
+def _init_worker():
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+
+def _render_tarea(product, var, nivel, indices, rango, outdir, prefijo, dpi, figsize):
+    # se ejecuta en el proceso trabajador: una figura para todos los pasos de la tarea;
+    # entre cuadros sólo cambian los datos de la malla, el título y los contornos
+    import matplotlib.pyplot as plt
+    with xr.open_dataset(product) as ds:
+        da = ds[var] if nivel is None else ds[var].sel({ds[var].dims[1]: nivel})
+        lat, lon = da["latitude"].values, da["longitude"].values
+        lon = np.where(lon > 180, lon - 360, lon)
+        campos = da.isel(time=indices).values
+        tiempos = pd.to_datetime(da["time"].values[indices])
+    campos, unidades = _convierte(var, campos, rango[1])
+    rango_plot = tuple(float(x) for x in _convierte(var, np.array(rango), rango[1])[0])
+    cmap, norm, contornos = _paleta(var, rango_plot)
+
+    nombre_var = var if nivel is None else f"{var}_{nivel:g}"
+    fig, ax = plt.subplots(figsize=figsize)
+    malla = ax.pcolormesh(lon, lat, campos[0], cmap=cmap, norm=norm, shading="auto")
+    cbar = fig.colorbar(malla, ax=ax)
+    if unidades or da.attrs.get("units"):
+        cbar.set_label(f"({unidades or da.attrs.get('units')})")
+    titulo = ax.set_title("")
+    ax.set_xlabel("longitude")
+    ax.set_ylabel("latitude")
+
+    salidas, lineas, caja = [], [], None
+    for campo, t in zip(campos, tiempos):
+        malla.set_array(campo.ravel())
+        titulo.set_text(f"{nombre_var}  {t:%Y-%m-%d %HZ}")
+        for cs in lineas:
+            _quita(cs)
+        lineas = []
+        vmin, vmax = np.nanmin(campo), np.nanmax(campo)
+        for color, levels in contornos.items():
+            levels = [l for l in levels if vmin <= l <= vmax]   # sólo niveles presentes
+            if levels:
+                cs = ax.contour(lon, lat, campo, levels=levels, colors=color, linewidths=1)
+                ax.clabel(cs, fmt="%d", fontsize=7)
+                lineas.append(cs)
+        out_file = os.path.join(outdir, f"{prefijo}_{nombre_var}_{t:%Y%m%d%H}.png")
+        if caja is None:
+            # recorte 'tight' calculado una vez: el marco no cambia entre pasos y así
+            # savefig dibuja la figura una sola vez por mapa
+            caja = fig.get_tightbbox(fig.canvas.get_renderer())
+        fig.savefig(out_file, dpi=dpi, bbox_inches=caja)
+        salidas.append(out_file)
+    plt.close(fig)
+    return salidas
+
+def render_run(products, outdir, variables=None, workers=None, dpi=100, figsize=(5, 3),
+               frames_per_task=FRAMES_POR_TAREA):
+    """
+    Genera todos los mapas PNG de una corrida (variables × niveles × pasos) en un pool de
+    procesos con el backend Agg. La paleta (get_cmap_norm) y los contornos (get_contour) se
+    construyen una vez por variable con el rango de toda la corrida (tomado de los
+    estadísticos guardados con el producto, ver field_stats), y cada tarea reutiliza
+    su figura entre pasos actualizando sólo los datos, el título y los contornos.
+    ----------
+    Parámetros:
+    products : str | list   Productos de la corrida (ej: '{model}_{fecha}_sfc.nc', '..._prs.nc').
+    outdir : str            Carpeta de las figuras ('{model}_{fecha}_{var}[_{nivel}]_{YYYYMMDDHH}.png').
+    variables : list        Variables a graficar (default: todas).
+    workers : int           Procesos (default: os.cpu_count()).
+    dpi : int               Resolución (default: 100).
+    figsize : tuple         Tamaño de figura en pulgadas (default: (5, 3)).
+    frames_per_task : int   Pasos por tarea (figura reutilizada) (default: FRAMES_POR_TAREA).
+    -------
+    Retorna:
+    list        Rutas de las figuras generadas.
+    """
+    if isinstance(products, str):
+        products = [products]
+    os.makedirs(outdir, exist_ok=True)
+    tareas = []
+    for product in products:
+        prefijo = os.path.basename(product).rsplit("_", 1)[0]
+        with xr.open_dataset(product) as ds:
+            for var, da in ds.data_vars.items():
+                if (variables is not None and var not in variables) or da.dims[0] != "time":
+                    continue
+                niveles = [None] if da.ndim == 3 else list(da[da.dims[1]].values)
+                nt = da.sizes["time"]
+                for nivel in niveles:
+                    campo = da if nivel is None else da.sel({da.dims[1]: nivel})
+                    clave = var if nivel is None else f"{var}_{int(nivel) if float(nivel).is_integer() else nivel}"
+                    # rango de la tabla de estadísticos del producto; si no existe, se recorren los datos
+                    rango = stats_range(campo, clave) or (float(campo.min()), float(campo.max()))
+                    for i in range(0, nt, frames_per_task):
+                        tareas.append((product, var, nivel, list(range(i, min(i + frames_per_task, nt))),
+                                       rango, outdir, prefijo, dpi, figsize))
+    if not tareas:
+        return []
+
+    workers = min(workers or os.cpu_count() or 1, len(tareas))
+    n_mapas = sum(len(t[3]) for t in tareas)
+    print(f"{n_mapas} mapas en {len(tareas)} tareas, {workers} procesos")
+    salidas = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futuros = [pool.submit(_render_tarea, *t) for t in tareas]
+        for fut in futuros:
+            salidas.extend(fut.result())
+    print(f"{len(salidas)} mapas en {outdir}")
+    return salidas
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import time
+from glob import glob as gb
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .ETA_extrae import extrac_ETA
+from .WRF_extrae import extrac_WRF
+from .profiling import set_run, current_run
+from .manifest import load_manifest, save_manifest, record, is_valid
+from .stages import Writer
+
+# ruta de datos iniciales por modelo (ver cods/test_extrac.py)
+DATA_DIR = '/scratch/Datatemporal/SMN/data/regional'
+TIPOS = ['level_vars','tp','t2m','r2m','ssrd','prmsl','wind10m']
+
+def find_leadtime_files(r0, model, fecha, hor):
+    """
+    Lista ordenada de archivos GRIB por hora de pronóstico de una corrida.
+    ----------
+    Parámetros:
+    r0 : str       Ruta base de datos (ej: '/scratch/Datatemporal/SMN/data/regional')
+    model : str    Modelo/dominio (ej: 'PERU_WRF22', 'PERU_ETA22')
+    fecha : str    Fecha de la corrida 'YYYYMMDD'
+    hor : str      Hora de la corrida 'HH'
+    """
+    yea, mes = fecha[:4], fecha[4:6]
+    if "ETA" in model:
+        grib = f'{r0}/{model}/{yea}/{yea}{mes}/{fecha}{hor}'
+        files_pro = gb('%s/latlon_*'%grib)
+    elif "WRF" in model:
+        grib = f'{r0}/{model}/{yea}{mes}/{fecha}{hor}'
+        files_pro = gb('%s/WRFPRS_*'%grib)
+    else:
+        raise ValueError(f"Modelo '{model}' no reconocido (ETA o WRF)")
+    return [e for e in sorted(files_pro) if not any(x in e for x in ['idx', 'ctl'])]
+
+def lead_hour(gribfile):
+    """Hora de pronóstico de un archivo de la corrida ('WRFPRS_d01.09' -> 9, 'latlon_072' -> 72)."""
+    digitos = re.findall(r"(\d+)$", os.path.basename(gribfile))
+    if not digitos:
+        raise ValueError(f"No se reconoce la hora de pronóstico en '{gribfile}'")
+    return int(digitos[0])
+
+def _limita_memoria(max_mem_mb):
+    # límite de memoria (espacio de direcciones) por proceso trabajador
+    if not max_mem_mb:
+        return
+    try:
+        import resource
+        lim = int(max_mem_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (lim, lim))
+    except (ImportError, ValueError, OSError) as e:
+        print(f"No se pudo fijar el límite de memoria: {e}")
+
+def _inicia_trabajador(max_mem_mb, corrida=None):
+    # inicializador de los procesos trabajadores: límite de memoria y corrida a la que
+    # se atribuyen sus mediciones (profiling)
+    _limita_memoria(max_mem_mb)
+    set_run(corrida)
+
+def _extrae_paso(model, gribfile, outdir, tipos, single_pass, stores=None, region=None):
+    # se ejecuta en el proceso trabajador; nunca propaga excepciones.
+    # con outdir=None retorna los datasets en memoria (ver pipeline.py); con stores
+    # {'prs'|'sfc': ruta.zarr} el paso se escribe en su región de los productos Zarr
+    # y se retornan sus estadísticos (field_stats)
+    t0 = time.time()
+    try:
+        if "ETA" in model:
+            salida = extrac_ETA(outdir, gribfile, tipos, single_pass=single_pass, region=region)
+        else:
+            salida = extrac_WRF(outdir, gribfile, tipos, single_pass=single_pass, region=region)
+        if stores:
+            # sólo vuelven al proceso principal los estadísticos del paso, no los datos
+            from .zarr_store import write_step
+            salida = write_step(salida, stores)
+        return None, time.time() - t0, salida
+    except BaseException as e:  # MemoryError incluido
+        return f"{type(e).__name__}: {e}", time.time() - t0, None
+
+def _ejecuta_pool(model, files, outdir, tipos, workers, max_mem_mb, single_pass, reporta, stores=None,
+                  region=None):
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_inicia_trabajador,
+                             initargs=(max_mem_mb, current_run())) as pool:
+        futuros = [pool.submit(_extrae_paso, model, f, outdir, tipos, single_pass, stores, region)
+                   for f in files]
+        for f, fut in zip(files, futuros):
+            try:
+                resultados[f] = fut.result()
+            except BrokenProcessPool:
+                resultados[f] = None   # el trabajador murió (OOM, segfault): se reintenta aislado
+            if resultados[f] is not None:
+                reporta(f, *resultados[f])
+    return resultados
+
+def _extrae_solapado(model, files, outdir, tipos, single_pass, reporta, region=None):
+    # un solo proceso: este hilo decodifica el paso N+1 mientras el escritor comprime y
+    # escribe los NetCDF del paso N. Cada paso se cierra (y entra al manifiesto) desde el
+    # escritor, después de sus NetCDF: un error de escritura sólo hace fallar a su paso
+    extrae = extrac_ETA if "ETA" in model else extrac_WRF
+    resultados = {}
+
+    def cierra(f, tareas):
+        # hilo escritor: las escrituras del paso ya terminaron (la cola es FIFO)
+        errores = [e for e in (t.exception() for t in tareas) if e is not None]
+        if errores and resultados[f][0] is None:
+            resultados[f] = (f"{type(errores[0]).__name__}: {errores[0]}", resultados[f][1], None)
+        try:
+            reporta(f, *resultados[f])
+        except Exception as e:
+            resultados[f] = (f"{type(e).__name__}: {e}", resultados[f][1], None)
+
+    with Writer() as escritor:
+        for f in files:
+            t0 = time.time()
+            with escritor.group() as tareas:
+                try:
+                    escritos = extrae(outdir, f, tipos, single_pass=single_pass, region=region, writer=escritor)
+                    resultados[f] = (None, time.time() - t0, escritos)
+                except Exception as e:  # MemoryError incluido
+                    resultados[f] = (f"{type(e).__name__}: {e}", time.time() - t0, None)
+            escritor.submit(cierra, f, tareas)
+    return resultados
+
+def _extrae_corrida(model, files, outdir, tipos, workers, max_mem_mb, single_pass, stores=None, region=None,
+                    on_step=None, overlap=False):
+    # extrae todos los pasos en el pool; retorna {archivo: (error, segundos, salida)}.
+    # on_step(archivo, salida) se llama en el proceso principal por cada paso sin error.
+    # overlap: con un solo proceso y salida a NetCDF, sin pool (ver _extrae_solapado)
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    solapado = overlap and workers == 1 and outdir is not None and not stores and not max_mem_mb
+    print(f"{model}: {len(files)} pasos, " + ("1 proceso (decodificación y escritura solapadas)" if solapado
+                                             else f"{workers} procesos"))
+
+    n = len(files)
+    orden = {f: i for i, f in enumerate(files, 1)}
+    def reporta(f, error, seg, salida=None):
+        estado = "ok" if error is None else f"ERROR {error}"
+        print(f"[{orden[f]}/{n}] {os.path.basename(f)} {estado} ({seg:.1f} s)", flush=True)
+        if error is None and on_step is not None:
+            on_step(f, salida)
+
+    if solapado:
+        resultados = _extrae_solapado(model, files, outdir, tipos, single_pass, reporta, region)
+        fallas = [f for f, r in resultados.items() if r[0] is not None]
+        print(f"{n - len(fallas)}/{n} pasos extraídos" + (f", {len(fallas)} con error" if fallas else ""))
+        return resultados
+
+    resultados = _ejecuta_pool(model, files, outdir, tipos, workers, max_mem_mb, single_pass, reporta,
+                               stores, region)
+    # pasos cuyo trabajador murió: reintentar cada uno en un proceso propio
+    for f in [f for f, r in resultados.items() if r is None]:
+        r = _ejecuta_pool(model, [f], outdir, tipos, 1, max_mem_mb, single_pass, reporta, stores, region)[f]
+        resultados[f] = r if r is not None else ("el proceso trabajador terminó abruptamente", 0.0, None)
+        if r is None:
+            reporta(f, *resultados[f][:2])
+
+    fallas = [f for f, r in resultados.items() if r[0] is not None]
+    print(f"{n - len(fallas)}/{n} pasos extraídos" + (f", {len(fallas)} con error" if fallas else ""))
+    return resultados
+
+def run_extraction(model, fecha, hor, outdir, tipos=None, r0=DATA_DIR, workers=None,
+                   max_mem_mb=None, single_pass=True, region=None, incremental=True, content_hash=None,
+                   overlap=True):
+    """
+    Extrae en paralelo todas las horas de pronóstico de una corrida ETA/WRF.
+    Cada archivo GRIB se procesa en un proceso del pool; un paso corrupto sólo
+    falla ese paso. El avance se reporta en orden de hora de pronóstico.
+    Con incremental=True no se borra la carpeta de salida: el manifiesto de `outdir`
+    (ver manifest.py) indica qué pasos siguen vigentes (mismo GRIB, variables, región y
+    versión del paquete, NetCDF presentes) y sólo se extraen los nuevos o desactualizados.
+    ----------
+    Parámetros:
+    model : str         Modelo/dominio (ej: 'PERU_WRF22')
+    fecha : str         Fecha de la corrida 'YYYYMMDD'
+    hor : str           Hora de la corrida 'HH'
+    outdir : str        Carpeta de salida de los NetCDF por variable y paso
+    tipos : list        Variables a extraer (default: TIPOS)
+    r0 : str            Ruta base de datos (default: DATA_DIR)
+    workers : int       Número de procesos (default: os.cpu_count())
+    max_mem_mb : float  Límite de memoria por proceso en MB (default: sin límite)
+    single_pass : bool  Lectura del GRIB en una sola pasada
+    region : str|tuple  Región (regions.REGIONES) o bbox (lon_min, lat_min, lon_max, lat_max)
+    incremental : bool  Omite los pasos vigentes según el manifiesto (False: extrae todo)
+    content_hash : bool Compara los GRIB por contenido y no por tamaño/mtime (default: $SMN_MANIFEST_HASH)
+    overlap : bool      Con un solo proceso (workers=1, sin max_mem_mb) extrae en este proceso, decodificando
+                        el paso N+1 mientras un hilo escribe el paso N (ver stages.py); False: proceso aislado
+    -------
+    Retorna:
+    dict        {archivo_grib: mensaje_de_error} de los pasos que fallaron (vacío si todo ok).
+    """
+    tipos = TIPOS if tipos is None else tipos
+    set_run(f"{model}_{fecha}{hor}")
+    files = find_leadtime_files(r0, model, fecha, hor)
+    if len(files) == 0:
+        print(f"Sin archivos GRIB para {model} {fecha}{hor} en {r0}")
+        return {}
+    os.makedirs(outdir, exist_ok=True)
+    registros = load_manifest(outdir)
+    spec = {"tipos": list(tipos), "region": region}
+    if incremental:
+        vigentes = [f for f in files if is_valid(registros, os.path.abspath(f), [f], spec, content_hash)]
+        files = [f for f in files if f not in vigentes]
+        if vigentes:
+            print(f"{model}: {len(vigentes)} pasos vigentes según el manifiesto")
+        if not files:
+            return {}
+
+    def registra(f, escritos):
+        # el manifiesto se guarda tras cada paso: una corrida interrumpida conserva lo ya hecho
+        record(registros, os.path.abspath(f), [f], spec, escritos, content_hash)
+        save_manifest(outdir, registros)
+    resultados = _extrae_corrida(model, files, outdir, tipos, workers, max_mem_mb, single_pass, region=region,
+                                 on_step=registra, overlap=overlap)
+    return {f: r[0] for f, r in resultados.items() if r[0] is not None}
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Sólo biblioteca estándar a nivel de módulo: el cliente (submit) no debe importar
+# xarray, cfgrib ni matplotlib; eso lo hace una vez el servidor (serve).
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+import http.client
+import socketserver
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# tareas aceptadas y argumentos que son rutas (el cliente los pasa a absolutas)
+TAREAS = {
+    "extract": ("gribfile", "out_path"),
+    "process": ("list_files",),
+    "merge": ("list_files", "output_file"),
+}
+
+def default_address():
+    """Dirección del servidor: $SMN_SERVER o un socket Unix del usuario en el directorio temporal."""
+    return os.environ.get("SMN_SERVER") or os.path.join(tempfile.gettempdir(), f"SMN_tools-{os.getuid()}.sock")
+
+def _direccion(address):
+    # ruta de socket Unix, o 'host:puerto' / 'puerto' (HTTP en localhost)
+    address = str(address or default_address())
+    if "/" in address or address.endswith(".sock"):
+        return address
+    host, _, puerto = address.rpartition(":")
+    return (host or "127.0.0.1", int(puerto))
+
+def _ejecuta(tarea, args):
+    # se ejecuta en el proceso trabajador; nunca propaga excepciones
+    t0 = time.time()
+    try:
+        if args.get("region") is not None:
+            from .regions import get_region
+            args["region"] = get_region(args["region"])   # JSON: nombre o lista de 4 valores
+        if tarea == "extract":
+            modelo = args.pop("modelo")
+            if modelo == "ETA":
+                from .ETA_extrae import extrac_ETA as extrae
+            elif modelo == "WRF":
+                from .WRF_extrae import extrac_WRF as extrae
+            else:
+                raise ValueError(f"Modelo '{modelo}' no reconocido (ETA o WRF)")
+            extrae(**args)
+        elif tarea == "process":
+            from .procesa_netcdf import process_netcdf_files
+            process_netcdf_files(**args)
+        elif tarea == "merge":
+            from .merge_netcdf import merge_files
+            merge_files(**args)
+        elif tarea != "ping":
+            raise ValueError(f"Tarea '{tarea}' no existe; opciones: {list(TAREAS)}")
+        return None, time.time() - t0
+    except Exception as e:  # MemoryError incluido
+        return f"{type(e).__name__}: {e}", time.time() - t0
+
+# módulos que importan los trabajadores rehechos al arrancar (forkserver)
+_PRECARGA = [f"{__package__}.{m}" for m in ("ETA_extrae", "WRF_extrae", "procesa_netcdf", "merge_netcdf")]
+
+class _Trabajadores:
+    # pool de procesos ya inicializados (bibliotecas importadas y cachés de grilla por
+    # proceso); se rehace si un trabajador muere
+    def __init__(self, workers, max_mem_mb):
+        self.workers, self.max_mem_mb = workers, max_mem_mb
+        self.lock = threading.Lock()       # contadores y pool vigente
+        self.rehace = threading.Lock()     # un solo hilo rehace el pool
+        self.inicio = time.time()
+        self.tareas, self.errores, self.en_curso = 0, 0, 0
+        self.pool = self._nuevo_pool(inicial=True)
+
+    def _nuevo_pool(self, inicial=False):
+        from .run_driver import _limita_memoria
+        # el primero, desde serve() antes de atender pedidos: con 'fork' los trabajadores
+        # heredan los módulos ya importados. Al rehacerlo hay hilos del servidor vivos y
+        # fork no es seguro: forkserver (con los módulos precargados) o spawn.
+        metodos = multiprocessing.get_all_start_methods()
+        if inicial and "fork" in metodos:
+            contexto = multiprocessing.get_context("fork")
+        elif "forkserver" in metodos:
+            contexto = multiprocessing.get_context("forkserver")
+            contexto.set_forkserver_preload(_PRECARGA)
+        else:
+            contexto = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=contexto,
+                                   initializer=_limita_memoria, initargs=(self.max_mem_mb,))
+        for fut in [pool.submit(_ejecuta, "ping", {}) for _ in range(self.workers)]:
+            fut.result()
+        return pool
+
+    def ejecuta(self, tarea, args):
+        with self.lock:
+            pool = self.pool
+            self.en_curso += 1
+        try:
+            error, seg = pool.submit(_ejecuta, tarea, args).result()
+        except BrokenProcessPool:
+            error, seg = "el proceso trabajador terminó abruptamente", 0.0
+            with self.rehace:   # fuera de self.lock: /estado sigue respondiendo
+                if self.pool is pool:
+                    pool.shutdown(wait=False)
+                    nuevo = self._nuevo_pool()
+                    with self.lock:
+                        self.pool = nuevo
+        with self.lock:
+            self.en_curso -= 1
+            self.tareas += 1
+            self.errores += error is not None
+        return {"error": error, "seg": seg}
+
+    def estado(self):
+        with self.lock:
+            return {"pid": os.getpid(), "workers": self.workers, "tareas": self.tareas,
+                    "errores": self.errores, "en_curso": self.en_curso,
+                    "uptime_s": time.time() - self.inicio}
+
+class _Manejador(BaseHTTPRequestHandler):
+    def address_string(self):
+        # en un socket Unix client_address es ''
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _responde(self, codigo, datos):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if self.path == "/estado":
+            self._responde(200, self.server.trabajadores.estado())
+        else:
+            self._responde(404, {"error": f"ruta desconocida {self.path}"})
+
+    def do_POST(self):
+        try:
+            datos = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError as e:
+            return self._responde(400, {"error": f"JSON inválido: {e}"})
+        if self.path == "/detener":
+            self._responde(200, {"error": None})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        elif self.path == "/tarea":
+            tarea = datos.get("tarea")
+            if tarea not in TAREAS and tarea != "ping":
+                return self._responde(400, {"error": f"Tarea '{tarea}' no existe; opciones: {list(TAREAS)}"})
+            resultado = self.server.trabajadores.ejecuta(tarea, datos.get("args", {}))
+            self.log_message("%s %s (%.1f s)", tarea, resultado["error"] or "ok", resultado["seg"])
+            self._responde(200, resultado)
+        else:
+            self._responde(404, {"error": f"ruta desconocida {self.path}"})
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.path_socket = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path_socket)
+
+def _pide(metodo, ruta, datos=None, address=None, timeout=None):
+    direccion = _direccion(address)
+    opciones = {} if timeout is None else {"timeout": timeout}
+    if isinstance(direccion, str):
+        conn = _UnixHTTPConnection(direccion, **opciones)
+    else:
+        conn = http.client.HTTPConnection(*direccion, **opciones)
+    try:
+        cuerpo = None if datos is None else json.dumps(datos).encode()
+        conn.request(metodo, ruta, body=cuerpo, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        respuesta = json.loads(resp.read() or b"{}")
+    finally:
+        conn.close()
+    if resp.status != 200:
+        raise RuntimeError(respuesta.get("error") or f"HTTP {resp.status}")
+    return respuesta
+
+def submit(tarea, address=None, timeout=None, **args):
+    """
+    Envía una tarea al servidor (ver serve) y espera su resultado. Las rutas de los
+    argumentos se pasan a absolutas (el servidor corre en otra carpeta).
+    ----------
+    Parámetros:
+    tarea : str         'extract' (modelo='ETA'|'WRF' + argumentos de extrac_ETA/extrac_WRF),
+                        'process' (argumentos de process_netcdf_files) o 'merge' (de merge_files).
+    address : str       Socket Unix o 'host:puerto' (default: default_address()).
+    timeout : float     Segundos de espera de la respuesta (default: sin límite).
+    -------
+    Retorna:
+    dict        {'error': None | mensaje, 'seg': segundos de la tarea en el servidor}
+    """
+    for clave in TAREAS.get(tarea, ()):
+        valor = args.get(clave)
+        if isinstance(valor, (list, tuple)):
+            args[clave] = [os.path.abspath(v) for v in valor]
+        elif valor is not None:
+            args[clave] = os.path.abspath(valor)
+    return _pide("POST", "/tarea", {"tarea": tarea, "args": args}, address, timeout)
+
+def server_status(address=None):
+    """Estado del servidor: pid, workers, tareas, errores, en_curso, uptime_s."""
+    return _pide("GET", "/estado", address=address, timeout=10)
+
+def stop_server(address=None):
+    """Detiene el servidor (termina las tareas en curso)."""
+    return _pide("POST", "/detener", {}, address=address, timeout=10)
+
+def serve(address=None, workers=1, max_mem_mb=None):
+    """
+    Servidor local persistente de tareas extract/process/merge: importa una vez xarray,
+    cfgrib/ecCodes y netCDF4, y mantiene `workers` procesos trabajadores con esas
+    bibliotecas y las geometrías de grilla ya cargadas. Escucha en un socket Unix o en
+    HTTP 'host:puerto' (POST /tarea, GET /estado, POST /detener) hasta que se detiene.
+    ----------
+    Parámetros:
+    address : str       Socket Unix o 'host:puerto' (default: $SMN_SERVER o socket en el temporal).
+    workers : int       Tareas ejecutadas a la vez (default: 1).
+    max_mem_mb : float  Límite de memoria por proceso trabajador en MB.
+    """
+    # bibliotecas pesadas cargadas antes de crear los trabajadores
+    from . import ETA_extrae, WRF_extrae, procesa_netcdf, merge_netcdf  # noqa: F401
+    direccion = _direccion(address)
+    if isinstance(direccion, str):
+        if os.path.exists(direccion):
+            try:
+                server_status(direccion)
+            except OSError:
+                os.remove(direccion)   # socket de un servidor que ya no existe
+            else:
+                raise RuntimeError(f"Ya hay un servidor en {direccion}")
+        servidor = _UnixHTTPServer(direccion, _Manejador)
+    else:
+        servidor = ThreadingHTTPServer(direccion, _Manejador)
+        servidor.daemon_threads = True
+    servidor.trabajadores = _Trabajadores(workers, max_mem_mb)
+    print(f"Servidor SMN_tools en {direccion} ({workers} procesos, pid {os.getpid()})", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.trabajadores.pool.shutdown()
+        if isinstance(direccion, str) and os.path.exists(direccion):
+            os.remove(direccion)
+    print("Servidor detenido")
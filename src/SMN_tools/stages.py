@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future
+from .profiling import stage
+from .manifest import atomic_path
+
+# etapas solapadas dentro de un proceso: mientras un hilo comprime y escribe (zlib/HDF5 en
+# netCDF4) otro decodifica el campo siguiente (ecCodes). Ambas liberan el GIL y xarray usa
+# candados distintos para cada una (HDF5_LOCK, ECCODES_LOCK), así que corren a la vez.
+# Las colas son acotadas: a lo más PROFUNDIDAD resultados esperan en memoria.
+PROFUNDIDAD = int(os.environ.get("SMN_STAGE_DEPTH", 2))
+# la biblioteca netCDF-C no admite llamadas simultáneas desde varios hilos: las etapas que leen
+# y escriben NetCDF a la vez (append_netcdf usa netCDF4 sin pasar por xarray) lo toman
+NETCDF_LOCK = threading.Lock()
+_FIN = object()
+
+def _hilo(nombre, destino):
+    # hilo con el contexto del que lo crea (corrida de profiling.set_run)
+    contexto = contextvars.copy_context()
+    hilo = threading.Thread(target=contexto.run, args=(destino,), name=nombre, daemon=True)
+    hilo.start()
+    return hilo
+
+class Writer:
+    """
+    Hilo escritor con cola acotada: submit(funcion, *args) encola una escritura y retorna su
+    Future (se bloquea si hay `depth` pendientes); close() espera a que terminen todas. Cada
+    tarea tiene su propio resultado: un error no afecta a las siguientes y no se propaga en
+    submit/close, sino en el Future de esa tarea. Con group() se juntan los Future de las
+    tareas encoladas dentro del bloque (ej. las escrituras de un paso).
+    Como contexto: with Writer() as w: ... w.submit(ds.to_netcdf, path).
+    """
+    def __init__(self, depth=PROFUNDIDAD):
+        self._cola = queue.Queue(maxsize=max(1, depth))
+        self._grupo = None
+        self._hilo = _hilo("SMN_tools-writer", self._corre)
+
+    def _corre(self):
+        while True:
+            tarea = self._cola.get()
+            if tarea is _FIN:
+                return
+            futuro, funcion, args, kwargs = tarea
+            if not futuro.set_running_or_notify_cancel():
+                continue
+            try:
+                futuro.set_result(funcion(*args, **kwargs))
+            except BaseException as e:
+                futuro.set_exception(e)
+
+    def submit(self, funcion, *args, **kwargs):
+        futuro = Future()
+        if self._grupo is not None:
+            self._grupo.append(futuro)
+        self._cola.put((futuro, funcion, args, kwargs))
+        return futuro
+
+    @contextmanager
+    def group(self):
+        """Lista de los Future de las tareas encoladas dentro del bloque."""
+        anterior, self._grupo = self._grupo, []
+        try:
+            yield self._grupo
+        finally:
+            self._grupo = anterior
+
+    def close(self):
+        self._cola.put(_FIN)
+        self._hilo.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.close()
+        return False
+
+def write_netcdf(ds, path):
+    """NetCDF de un dataset ya cargado, escrito a un temporal y renombrado (un corte no lo deja a medias)."""
+    with stage("write", archivo=path), NETCDF_LOCK, atomic_path(path) as tmp:
+        ds.to_netcdf(tmp)
+
+def overlapped(items, produce, depth=PROFUNDIDAD):
+    """
+    Itera (item, produce(item)) en orden, calculando produce() en un hilo aparte hasta `depth`
+    items por delante: el consumidor (ej. compresión y escritura del paso N) se solapa con la
+    producción del siguiente (decodificación del paso N+1). Un error en produce() se propaga
+    en la iteración del item que falló.
+    """
+    cola = queue.Queue(maxsize=max(1, depth))
+    parar = threading.Event()
+
+    def productor():
+        for item in items:
+            if parar.is_set():
+                break
+            try:
+                resultado = (item, produce(item), None)
+            except BaseException as e:
+                resultado = (item, None, e)
+            cola.put(resultado)
+            if resultado[2] is not None:
+                break
+        cola.put(_FIN)
+
+    hilo = _hilo("SMN_tools-produce", productor)
+    try:
+        while True:
+            resultado = cola.get()
+            if resultado is _FIN:
+                break
+            item, valor, error = resultado
+            if error is not None:
+                raise error
+            yield item, valor
+    finally:
+        # consumidor que termina antes (error o break): se libera al productor
+        parar.set()
+        while hilo.is_alive():
+            try:
+                cola.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        hilo.join()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+import xarray as xr
+from .grib_index import index_dir
+from .catalog import grid_fingerprint
+
+# nombres de columna aceptados en la lista de estaciones
+COLUMNAS = {
+    'station': ['station', 'estacion', 'codigo', 'cod', 'id', 'nombre', 'name'],
+    'lat': ['lat', 'latitude', 'latitud'],
+    'lon': ['lon', 'longitude', 'longitud'],
+}
+
+# índices ya calculados en este proceso, por huella de grilla y estaciones
+_INDICES = {}
+
+def read_stations(stations):
+    """
+    Lee la lista de estaciones (CSV o DataFrame) con columnas de código, latitud y longitud
+    (ver COLUMNAS; ej. 'codigo,lat,lon').
+    -------
+    Retorna:
+    pd.DataFrame        Columnas 'station', 'lat', 'lon'.
+    """
+    df = stations if isinstance(stations, pd.DataFrame) else pd.read_csv(stations)
+    cols = {c.lower().strip(): c for c in df.columns}
+    out = {}
+    for col, nombres in COLUMNAS.items():
+        encontrada = next((cols[n] for n in nombres if n in cols), None)
+        if encontrada is None:
+            raise ValueError(f"La lista de estaciones no tiene columna '{col}' (opciones: {nombres})")
+        out[col] = df[encontrada].values
+    out = pd.DataFrame(out)
+    out['station'] = out['station'].astype(str)
+    return out
+
+def _nearest_1d(coord, x):
+    # índice del punto más cercano sobre una coordenada 1D monótona; -1 fuera del dominio
+    orden = 1 if coord[-1] >= coord[0] else -1
+    c = coord[::orden]
+    i = np.clip(np.searchsorted(c, x), 1, len(c) - 1)
+    i = np.where(np.abs(x - c[i - 1]) <= np.abs(c[i] - x), i - 1, i)
+    medio_paso = np.abs(np.diff(c)).max() / 2 if len(c) > 1 else 0
+    fuera = (x < c[0] - medio_paso) | (x > c[-1] + medio_paso)
+    i = i if orden == 1 else len(c) - 1 - i
+    return np.where(fuera, -1, i)
+
+def station_index(lat, lon, stations, cache=True):
+    """
+    Punto de grilla más cercano a cada estación sobre una grilla regular (lat, lon 1D),
+    calculado una vez por grilla y lista de estaciones y guardado en el caché de índices
+    (ver grib_index.index_dir).
+    ----------
+    Parámetros:
+    lat, lon : array        Latitudes y longitudes 1D del producto.
+    stations : pd.DataFrame Estaciones (read_stations).
+    cache : bool            Usa/guarda el índice en disco (default: True).
+    -------
+    Retorna:
+    tuple       (ilat, ilon) arrays de índices; -1 para estaciones fuera del dominio.
+    """
+    lat, lon = np.asarray(lat, dtype="f8"), np.asarray(lon, dtype="f8")
+    slat = stations['lat'].values.astype("f8")
+    slon = stations['lon'].values.astype("f8")
+    if lon.max() > 180:   # grilla en 0..360
+        slon = slon % 360
+
+    h = hashlib.sha1()
+    for a in (lat, lon, slat, slon):
+        h.update(a.tobytes())
+    clave = h.hexdigest()
+    if clave in _INDICES:
+        return _INDICES[clave]
+    path = os.path.join(index_dir(), f"estaciones_{clave}.npz")
+    if cache and os.path.exists(path):
+        try:
+            with np.load(path) as f:
+                _INDICES[clave] = (f['ilat'], f['ilon'])
+            return _INDICES[clave]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    ilat, ilon = _nearest_1d(lat, slat), _nearest_1d(lon, slon)
+    fuera = (ilat < 0) | (ilon < 0)
+    ilat[fuera], ilon[fuera] = -1, -1
+    _INDICES[clave] = (ilat, ilon)
+    if cache:
+        tmp = None
+        try:   # escritura atómica, como el inventario GRIB
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".npz")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, ilat=ilat, ilon=ilon)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"No se pudo guardar el índice de estaciones: {e}")
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+    return ilat, ilon
+
+def _columnas(da, valores, var):
+    # (time, [nivel], estación) -> {columna: (estación, time)}
+    if valores.ndim == 2:
+        return {var: valores.T}
+    nivel = da.dims[1]
+    return {f"{var}_{int(z) if float(z).is_integer() else z}": valores[:, k, :].T
+            for k, z in enumerate(da[nivel].values)}
+
+def extract_stations(products, stations, variables=None, out_file=None,
+                     coord_lat='latitude', coord_lon='longitude'):
+    """
+    Series de tiempo en estaciones: todas las estaciones × pasos × variables de uno o más
+    productos en una sola lectura vectorizada por variable (sin .sel punto a punto).
+    Sólo se lee la ventana de la grilla que contiene a las estaciones. Los productos deben
+    compartir la grilla (ej. sfc y prs de una misma corrida).
+    ----------
+    Parámetros:
+    products : str | xr.Dataset | list   Productos de la corrida (ej: '{model}_{fecha}_sfc.nc', '..._prs.nc').
+    stations : str | pd.DataFrame        Lista de estaciones (ver read_stations).
+    variables : list                     Variables a extraer (default: todas las de los productos).
+    out_file : str                       CSV o Parquet ('.parquet') de salida (opcional).
+    -------
+    Retorna:
+    pd.DataFrame        Una fila por estación y paso: station, lat, lon, grid_lat, grid_lon, time, variables
+                        (las de niveles como '{var}_{nivel}', ej. 'u_850').
+    """
+    if isinstance(products, (str, xr.Dataset)):
+        products = [products]
+    est = read_stations(stations)
+    tabla, tiempos, puntos, huella = {}, None, None, None
+    for prod in products:
+        ds = prod if isinstance(prod, xr.Dataset) else xr.open_dataset(prod)
+        lat, lon = ds[coord_lat].values, ds[coord_lon].values
+        if huella is None:
+            huella = grid_fingerprint(lat, lon)
+            ilat, ilon = station_index(lat, lon, est)
+            dentro = ilat >= 0
+            if not dentro.all():
+                print(f"{(~dentro).sum()} estaciones fuera del dominio: {list(est['station'][~dentro])}")
+            est, ilat, ilon = est[dentro].reset_index(drop=True), ilat[dentro], ilon[dentro]
+            puntos = (lat[ilat], np.where(lon[ilon] > 180, lon[ilon] - 360, lon[ilon]))
+            tiempos = ds["time"].values
+        elif grid_fingerprint(lat, lon) != huella:
+            # los índices, las estaciones dentro del dominio y grid_lat/grid_lon son los de la primera grilla
+            nombre = prod if isinstance(prod, str) else ds.encoding.get("source", "dataset")
+            raise ValueError(f"{nombre}: grilla distinta de la del primer producto; "
+                             f"llame a extract_stations una vez por grilla")
+        if len(est) == 0:
+            break
+        # ventana mínima que contiene a todas las estaciones
+        ventana = {coord_lat: slice(ilat.min(), ilat.max() + 1), coord_lon: slice(ilon.min(), ilon.max() + 1)}
+        for var, da in ds.data_vars.items():
+            if variables is not None and var not in variables:
+                continue
+            if da.dims[0] != "time" or da.dims[-2:] != (coord_lat, coord_lon):
+                continue
+            valores = da.isel(ventana).values[..., ilat - ilat.min(), ilon - ilon.min()]
+            tabla.update(_columnas(da, valores, var))
+
+    n, nt = len(est), 0 if tiempos is None else len(tiempos)
+    df = pd.DataFrame({
+        'station': np.repeat(est['station'].values, nt),
+        'lat': np.repeat(est['lat'].values, nt),
+        'lon': np.repeat(est['lon'].values, nt),
+        'grid_lat': np.repeat(puntos[0], nt) if n else [],
+        'grid_lon': np.repeat(puntos[1], nt) if n else [],
+        'time': np.tile(tiempos, n) if n else [],
+    })
+    for col, valores in tabla.items():
+        df[col] = valores.reshape(-1)
+
+    if out_file:
+        if out_file.endswith(".parquet"):
+            try:
+                df.to_parquet(out_file, index=False)
+            except ImportError:
+                raise ImportError("La salida Parquet requiere 'pyarrow' (pip install pyarrow)") from None
+        else:
+            df.to_csv(out_file, index=False)
+        print(f"Series de {n} estaciones y {nt} pasos guardadas en {out_file}")
+    return df
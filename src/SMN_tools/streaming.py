@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+from .field_stats import stats_path
+
+def memory_ceiling(max_mem_mb=None):
+    """Techo de memoria en MB: `max_mem_mb` o $SMN_MAX_MEM_MB (None: sin techo)."""
+    if max_mem_mb is None and os.environ.get("SMN_MAX_MEM_MB"):
+        max_mem_mb = float(os.environ["SMN_MAX_MEM_MB"])
+    return max_mem_mb
+
+def use_streaming(nbytes, streaming=False, max_mem_mb=None):
+    """
+    Indica si un producto se escribe paso a paso: con streaming=True, o si su tamaño
+    en memoria (`nbytes`, estimado antes de leer los datos) supera el techo de memoria.
+    """
+    techo = memory_ceiling(max_mem_mb)
+    if streaming:
+        return True
+    if techo is not None and nbytes / 2**20 > techo:
+        print(f"{nbytes / 2**20:.0f} MB > techo de {techo:.0f} MB: escritura paso a paso")
+        return True
+    return False
+
+def iter_steps(ds, time_dim="time"):
+    """Pasos de un dataset (lazy) en orden de tiempo, cargando uno a la vez."""
+    orden = ds[time_dim].argsort().values
+    for i in orden:
+        yield ds.isel({time_dim: [int(i)]}).load()
+
+def reset_output(output_file):
+    """Elimina un producto anterior (NetCDF o Zarr) y su tabla de estadísticos antes de reescribirlo."""
+    for path in (output_file, stats_path(output_file)):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import numpy as np
+import pandas as pd
+
+# parámetros GRIB2 (tablas NCEP, centre=7 como los WRFPRS y latlon operativos):
+# shortName -> (discipline, parameterCategory, parameterNumber, typeOfLevel, nivel, typeOfStatisticalProcessing)
+# nivel None: uno por nivel de presión; typeOfStatisticalProcessing None: instantáneo (plantilla 4.0)
+PARAMETROS = {
+    'gh':         (0, 3, 5, 'isobaricInhPa', None, None),
+    't':          (0, 0, 0, 'isobaricInhPa', None, None),
+    'r':          (0, 1, 1, 'isobaricInhPa', None, None),
+    'u':          (0, 2, 2, 'isobaricInhPa', None, None),
+    'v':          (0, 2, 3, 'isobaricInhPa', None, None),
+    'mslet':      (0, 3, 192, 'meanSea', 0, None),
+    'sp':         (0, 3, 0, 'surface', 0, None),
+    '2t':         (0, 0, 0, 'heightAboveGround', 2, None),
+    '2d':         (0, 0, 6, 'heightAboveGround', 2, None),
+    '2r':         (0, 1, 1, 'heightAboveGround', 2, None),
+    '10u':        (0, 2, 2, 'heightAboveGround', 10, None),
+    '10v':        (0, 2, 3, 'heightAboveGround', 10, None),
+    'tp':         (0, 1, 8, 'surface', 0, 1),      # acumulada desde el inicio
+    'avg_sdswrf': (0, 4, 7, 'surface', 0, 0),      # media desde el inicio (sólo ETA)
+}
+# rango típico de cada campo (valor medio, amplitud) para que la compresión sea realista
+RANGOS = {
+    'gh': (5500.0, 300.0), 't': (260.0, 15.0), 'r': (60.0, 35.0), 'u': (0.0, 15.0), 'v': (0.0, 15.0),
+    'mslet': (101300.0, 800.0), 'sp': (85000.0, 12000.0), '2t': (290.0, 10.0), '2d': (283.0, 8.0),
+    '2r': (70.0, 25.0), '10u': (0.0, 8.0), '10v': (0.0, 8.0), 'tp': (0.0, 2.0), 'avg_sdswrf': (300.0, 250.0),
+}
+# variables por modelo (mismas que leen extrac_WRF / extrac_ETA, más algunas que se ignoran)
+VARIABLES = {
+    'WRF': ['gh', 't', 'r', 'u', 'v', 'mslet', 'sp', '2t', '2d', '2r', '10u', '10v', 'tp'],
+    'ETA': ['gh', 't', 'r', 'u', 'v', 'mslet', '2t', '2r', '10u', '10v', 'tp', 'avg_sdswrf'],
+}
+NIVELES = [1000, 925, 850, 700, 500, 300, 200]
+# grilla por modelo: tipo y dominio en grados (lon_min, lat_min, lon_max, lat_max), como PERU_WRF22
+# (Mercator, de sur a norte) y PERU_ETA22 (regular_ll, de norte a sur)
+GRILLAS = {
+    'WRF': ('mercator', (-85.2, -19.85, -66.8, 2.18)),
+    'ETA': ('regular_ll', (-82.0, -19.0, -68.0, 1.0)),
+}
+RADIO = 6371229.0   # shapeOfTheEarth=6
+LAD = -9.0          # latitud de escala real de la Mercator
+
+def run_path(out_dir, modelo, model_name, fecha, hor):
+    """Carpeta de una corrida con la estructura de find_leadtime_files (WRF: YYYYMM/, ETA: YYYY/YYYYMM/)."""
+    if modelo == 'ETA':
+        return os.path.join(out_dir, model_name, fecha[:4], fecha[:6], f"{fecha}{hor}")
+    return os.path.join(out_dir, model_name, fecha[:6], f"{fecha}{hor}")
+
+def lead_name(modelo, lead):
+    """Nombre del archivo de una hora de pronóstico: 'WRFPRS_d01.06' o 'latlon_006'."""
+    return f"latlon_{lead:03d}" if modelo == 'ETA' else f"WRFPRS_d01.{lead:02d}"
+
+def _campo(nombre, nivel, lead, lat, lon, rng):
+    # campo suave (ondas que se desplazan con la hora de pronóstico) más ruido pequeño
+    media, amp = RANGOS[nombre]
+    fase = 0.1 * lead + (nivel or 0) / 500.0
+    base = np.sin(np.radians(lon) * 6 + fase)[None, :] * np.cos(np.radians(lat) * 4 - fase)[:, None]
+    valores = media + amp * (base + 0.05 * rng.standard_normal(base.shape))
+    if nombre == 'tp':
+        valores = np.maximum(valores - media, 0.0) * lead   # acumulada: 0 en el inicio, crece con el paso
+    elif nombre in ('r', '2r'):
+        valores = np.clip(valores, 0.0, 100.0)
+    return valores.astype("f8")
+
+def _claves_grilla(tipo, bbox, nx, ny):
+    # claves GRIB2 de la grilla; las longitudes van en 0..360 como en los archivos operativos
+    lon_min, lat_min, lon_max, lat_max = bbox
+    if tipo == 'regular_ll':
+        return {
+            'Ni': nx, 'Nj': ny,
+            'latitudeOfFirstGridPointInDegrees': lat_max, 'latitudeOfLastGridPointInDegrees': lat_min,
+            'longitudeOfFirstGridPointInDegrees': lon_min % 360, 'longitudeOfLastGridPointInDegrees': lon_max % 360,
+            'iDirectionIncrementInDegrees': (lon_max - lon_min) / (nx - 1),
+            'jDirectionIncrementInDegrees': (lat_max - lat_min) / (ny - 1),
+        }
+    # Mercator (plantilla 3.10): espaciado en metros a la latitud LAD
+    k = RADIO * math.cos(math.radians(LAD))
+    y = lambda lat: k * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    return {
+        'gridDefinitionTemplateNumber': 10, 'shapeOfTheEarth': 6, 'Ni': nx, 'Nj': ny,
+        'latitudeOfFirstGridPointInDegrees': lat_min, 'latitudeOfLastGridPointInDegrees': lat_max,
+        'longitudeOfFirstGridPointInDegrees': lon_min % 360, 'longitudeOfLastGridPointInDegrees': lon_max % 360,
+        'LaDInDegrees': LAD, 'orientationOfTheGridInDegrees': 0.0,
+        'DiInMetres': k * math.radians(lon_max - lon_min) / (nx - 1),
+        'DjInMetres': (y(lat_max) - y(lat_min)) / (ny - 1),
+        'iScansNegatively': 0, 'jScansPositively': 1,
+    }
+
+def write_grib(path, campos, fecha, hor, lead, nx, ny, grilla="regular_ll", bbox=GRILLAS['ETA'][1], bits=12,
+               packing="grid_complex_spatial_differencing"):
+    """
+    Escribe un GRIB2 con los `campos` [(shortName, nivel, valores (ny, nx))] de una hora de
+    pronóstico en una grilla 'regular_ll' (de norte a sur) o 'mercator' (de sur a norte),
+    a partir de la muestra 'regular_ll_sfc_grib2' de ecCodes (sin archivos externos).
+    """
+    import eccodes
+    claves = {'centre': 7, **_claves_grilla(grilla, bbox, nx, ny),
+              'dataDate': int(fecha), 'dataTime': int(hor) * 100, 'stepUnits': 1}
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for nombre, nivel, valores in campos:
+            disciplina, categoria, numero, tipo_nivel, _, estadistico = PARAMETROS[nombre]
+            h = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+            try:
+                for clave, valor in claves.items():
+                    eccodes.codes_set(h, clave, valor)
+                eccodes.codes_set(h, 'productDefinitionTemplateNumber', 0 if estadistico is None else 8)
+                eccodes.codes_set(h, 'discipline', disciplina)
+                eccodes.codes_set(h, 'parameterCategory', categoria)
+                eccodes.codes_set(h, 'parameterNumber', numero)
+                eccodes.codes_set(h, 'typeOfLevel', tipo_nivel)
+                eccodes.codes_set(h, 'level', nivel)
+                if estadistico is None:
+                    eccodes.codes_set(h, 'forecastTime', lead)
+                else:
+                    eccodes.codes_set(h, 'typeOfStatisticalProcessing', estadistico)
+                    eccodes.codes_set(h, 'stepRange', f"0-{lead}")
+                eccodes.codes_set(h, 'packingType', packing)
+                eccodes.codes_set(h, 'bitsPerValue', bits)
+                eccodes.codes_set_values(h, np.ascontiguousarray(valores).ravel())
+                eccodes.codes_write(h, f)
+            finally:
+                eccodes.codes_release(h)
+    os.replace(tmp, path)   # el archivo aparece completo (como lo espera watcher.file_ready)
+
+def make_run(out_dir, modelo="WRF", model_name=None, fecha="20250101", hor="00", nx=93, ny=113,
+             niveles=None, variables=None, n_leads=4, intervalo=3, seed=0, bits=12,
+             packing="grid_complex_spatial_differencing", grilla=None):
+    """
+    Genera una corrida sintética ETA/WRF con la estructura de carpetas, nombres y grilla
+    operativos (ver run_path, lead_name y GRILLAS), para pruebas de rendimiento sin datos reales.
+    ----------
+    Parámetros:
+    out_dir : str        Ruta base (equivale a DATA_DIR / r0).
+    modelo : str         'WRF' (WRFPRS_d01.NN) o 'ETA' (latlon_NNN).
+    model_name : str     Dominio (default: 'SYN_{modelo}{nx}x{ny}').
+    fecha, hor : str     Fecha 'YYYYMMDD' y hora 'HH' de la corrida.
+    nx, ny : int         Puntos de grilla en longitud y latitud.
+    niveles : list       Niveles de presión en hPa (default: NIVELES).
+    variables : list     shortNames de PARAMETROS (default: VARIABLES[modelo]).
+    n_leads : int        Horas de pronóstico (0, intervalo, 2·intervalo, ...).
+    seed : int           Semilla del ruido (corridas reproducibles).
+    bits : int           bitsPerValue del empaquetado.
+    grilla : str         'regular_ll' o 'mercator' (default: la del modelo en GRILLAS).
+    -------
+    Retorna:
+    list        Archivos GRIB generados, en orden de hora de pronóstico.
+    """
+    model_name = model_name or f"SYN_{modelo}{nx}x{ny}"
+    niveles = NIVELES if niveles is None else niveles
+    variables = VARIABLES[modelo] if variables is None else variables
+    faltan = [v for v in variables if v not in PARAMETROS]
+    if faltan:
+        raise ValueError(f"Variables {faltan} no existen; opciones: {list(PARAMETROS)}")
+    carpeta = run_path(out_dir, modelo, model_name, fecha, hor)
+    os.makedirs(carpeta, exist_ok=True)
+    grilla, bbox = grilla or GRILLAS[modelo][0], GRILLAS[modelo][1]
+    lon = np.linspace(bbox[0], bbox[2], nx)
+    lat = np.linspace(bbox[1], bbox[3], ny) if grilla == 'mercator' else np.linspace(bbox[3], bbox[1], ny)
+    archivos = []
+    for k in range(n_leads):
+        lead = k * intervalo
+        rng = np.random.default_rng(seed + lead)
+        campos = []
+        # primero los niveles de presión (nivel por nivel), luego superficie, como en WRFPRS
+        for nivel in niveles:
+            campos += [(v, nivel, _campo(v, nivel, lead, lat, lon, rng))
+                       for v in variables if PARAMETROS[v][4] is None]
+        campos += [(v, PARAMETROS[v][4], _campo(v, None, lead, lat, lon, rng))
+                   for v in variables if PARAMETROS[v][4] is not None]
+        path = os.path.join(carpeta, lead_name(modelo, lead))
+        write_grib(path, campos, fecha, hor, lead, nx, ny, grilla, bbox, bits=bits, packing=packing)
+        archivos.append(path)
+    inicio = pd.to_datetime(f"{fecha}{hor}", format="%Y%m%d%H")
+    print(f"Corrida sintética {model_name} {inicio:%Y-%m-%d %HZ}: {len(archivos)} pasos, "
+          f"{nx}x{ny} puntos, {len(niveles)} niveles en {carpeta}")
+    return archivos
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .run_driver import DATA_DIR, TIPOS, find_leadtime_files, _inicia_trabajador, _extrae_paso
+from .pipeline import publish_step, DIMS
+from .catalog import register_product
+from .archive import archive_products
+from .profiling import set_run, current_run
+
+# veces que se reintenta un paso cuyo proceso trabajador murió (pool roto) antes de darlo por fallido
+REINTENTOS = 2
+
+def file_ready(gribfile, vistos, stable_secs):
+    """
+    Indica si un archivo GRIB de pronóstico ya terminó de escribirse: existe su `.idx`
+    compañero, o su tamaño no cambió durante `stable_secs` segundos.
+    ----------
+    Parámetros:
+    gribfile : str        Archivo GRIB (ej: 'WRFPRS_d01.06')
+    vistos : dict         {archivo: (tamaño, instante)} de observaciones anteriores (se actualiza)
+    stable_secs : float   Segundos con tamaño constante para considerarlo completo
+    """
+    if os.path.exists(gribfile + ".idx"):
+        return True
+    try:
+        size = os.path.getsize(gribfile)
+    except OSError:
+        return False
+    ahora = time.time()
+    previo = vistos.get(gribfile)
+    if previo is None or previo[0] != size or size == 0:
+        vistos[gribfile] = (size, ahora)
+        return False
+    return ahora - previo[1] >= stable_secs
+
+def watch_run(model, fecha, hor, run_dir, tipos=None, r0=DATA_DIR, workers=4, max_mem_mb=None,
+              poll=10, stable_secs=30, n_pasos=None, idle_timeout=3600, single_pass=True, profile=None,
+              region=None, derived=None, archive=None, catalog=True):
+    """
+    Vigila la carpeta de una corrida ETA/WRF y procesa cada paso apenas el modelo lo
+    termina de escribir: lo extrae en un pool de `workers` procesos y lo agrega a los
+    productos {model}_{fecha}{hor}_{prs|sfc}.nc (publish_step, modo append).
+    Termina cuando se procesaron `n_pasos` pasos o tras `idle_timeout` segundos sin pasos nuevos.
+    Un paso cuyo proceso trabajador muere se reintenta (REINTENTOS) en un pool nuevo; un error
+    al publicarlo queda en las fallas y la vigilancia sigue con los demás pasos.
+    ----------
+    Parámetros:
+    model : str           Modelo/dominio (ej: 'PERU_WRF22')
+    fecha : str           Fecha de la corrida 'YYYYMMDD'
+    hor : str             Hora de la corrida 'HH'
+    run_dir : str         Carpeta de los productos finales
+    tipos : list          Variables a extraer (default: TIPOS)
+    r0 : str              Ruta base de datos (default: DATA_DIR)
+    workers : int         Pasos extraídos a la vez (default: 4)
+    max_mem_mb : float    Límite de memoria por proceso en MB
+    poll : float          Segundos entre revisiones de la carpeta (default: 10)
+    stable_secs : float   Segundos de tamaño constante si no hay '.idx' (default: 30)
+    n_pasos : int         Número de pasos esperados de la corrida (default: sin límite)
+    idle_timeout : float  Segundos sin pasos nuevos para terminar (default: 3600)
+    profile : str|dict    Perfil de escritura de los productos (ver nc_encoding.PERFILES)
+    region : str|tuple    Región (regions.REGIONES) o bbox (lon_min, lat_min, lon_max, lat_max)
+    derived : list|str    Variables derivadas (ver derived.DERIVADAS)
+    archive : str         Carpeta de los archivos de corridas: al terminar, los productos se agregan
+                          a '{archive}/{model}_{prs|sfc}.nc' (ver archive.py)
+    catalog : bool|str    Registra los productos al terminar en el catálogo SQLite (catalog.py; una
+                          ruta usa ese catálogo en vez de $SMN_CATALOG; False no los registra)
+    -------
+    Retorna:
+    dict        {archivo_grib: mensaje_de_error} de los pasos que fallaron.
+    """
+    tipos = TIPOS if tipos is None else tipos
+    fecha_hor = f"{fecha}{hor}"
+    vistos, en_curso, procesados, fallas, intentos = {}, {}, set(), {}, {}
+    ultimo_nuevo = time.time()
+    print(f"Vigilando {model} {fecha_hor} (cada {poll} s, {workers} procesos)")
+
+    set_run(f"{model}_{fecha_hor}")
+    nuevo_pool = lambda: ProcessPoolExecutor(max_workers=workers, initializer=_inicia_trabajador,
+                                             initargs=(max_mem_mb, current_run()))
+    pool, roto = nuevo_pool(), False
+    try:
+        while True:
+            # un proceso muerto (memoria, ecCodes) rompe el pool: se rehace cuando se vacía
+            if roto and not en_curso:
+                pool.shutdown()
+                pool, roto = nuevo_pool(), False
+
+            # pasos nuevos y completos
+            for f in find_leadtime_files(r0, model, fecha, hor):
+                if roto or f in procesados or f in en_curso.values() or not file_ready(f, vistos, stable_secs):
+                    continue
+                en_curso[pool.submit(_extrae_paso, model, f, None, tipos, single_pass, None, region)] = f
+                ultimo_nuevo = time.time()
+
+            # pasos terminados: se publican en el orden en que terminan
+            for fut in [fut for fut in en_curso if fut.done()]:
+                f = en_curso.pop(fut)
+                try:
+                    error, seg, salida = fut.result()
+                except BrokenProcessPool:
+                    error, seg, salida = "el proceso trabajador terminó abruptamente", 0.0, None
+                    roto = True
+                    # no se sabe qué paso mató al proceso: todos los del pool vuelven a la cola
+                    intentos[f] = intentos.get(f, 0) + 1
+                    if intentos[f] <= REINTENTOS:
+                        print(f"{os.path.basename(f)} se reintenta ({error})", flush=True)
+                        continue
+                if error is None:
+                    try:
+                        publish_step(salida, run_dir, model, fecha_hor, profile=profile, derived=derived)
+                        print(f"{os.path.basename(f)} publicado ({seg:.1f} s)", flush=True)
+                    except Exception as e:   # ej. disco lleno: se registra y se sigue con los demás pasos
+                        error = f"{type(e).__name__}: {e}"
+                if error is not None:
+                    fallas[f] = error
+                    print(f"{os.path.basename(f)} ERROR {error}", flush=True)
+                procesados.add(f)
+
+            if n_pasos and len(procesados) >= n_pasos and not en_curso:
+                break
+            if not en_curso and time.time() - ultimo_nuevo > idle_timeout:
+                print(f"Sin pasos nuevos en {idle_timeout} s, fin de la vigilancia")
+                break
+            time.sleep(poll)
+    finally:
+        pool.shutdown()
+    print(f"{len(procesados) - len(fallas)} pasos publicados" + (f", {len(fallas)} con error" if fallas else ""))
+    # los productos quedan en el catálogo (y en el archivo de corridas) al cerrar la corrida
+    productos = [os.path.join(run_dir, f"{model}_{fecha_hor}_{var_in}.nc") for var_in in DIMS]
+    productos = [p for p in productos if os.path.exists(p)]
+    if catalog:
+        for out_file in productos:
+            register_product(out_file, catalog)
+    if archive:
+        archive_products(productos, archive)
+    return fallas
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+from .nc_encoding import build_encoding
+
+# opciones de nc_encoding que también aplican en Zarr (la compresión es la del compresor de zarr)
+ZARR_OPTS = ["dtype", "scale_factor", "add_offset", "_FillValue"]
+
+def _zarr():
+    # zarr es opcional: sólo se necesita para escribir productos .zarr
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("El backend Zarr requiere el paquete 'zarr' (pip install zarr)") from None
+    return zarr
+
+def is_zarr(path):
+    """Indica si una ruta de salida corresponde a un almacén Zarr ('*.zarr')."""
+    return str(path).rstrip("/").endswith(".zarr")
+
+def zarr_encoding(ds, profile=None, time_dim="time"):
+    """
+    Encoding Zarr por variable a partir de un perfil de nc_encoding: empaquetado int16 y
+    chunks del perfil, con un paso de tiempo por chunk para que cada paso se escriba
+    en su propia región sin bloqueos.
+    """
+    encoding = {}
+    for var, enc in build_encoding(ds, profile).items():
+        da = ds[var]
+        z = {k: enc[k] for k in ZARR_OPTS if k in enc}
+        chunks = list(enc.get("chunksizes", da.shape))
+        if time_dim in da.dims:
+            chunks[da.dims.index(time_dim)] = 1
+        z["chunks"] = tuple(chunks)
+        encoding[var] = z
+    return encoding
+
+def _time_encoding(t0):
+    return {"units": f"hours since {pd.Timestamp(t0).isoformat(sep=' ')}", "dtype": "float64"}
+
+def to_zarr_store(ds, store, profile=None, append=False, time_dim="time"):
+    """
+    Escribe un producto completo en un almacén Zarr (equivalente Zarr de to_netcdf), con
+    metadatos consolidados. Con append=True sólo agrega los pasos posteriores al último.
+    -------
+    Retorna:
+    list        Tiempos (datetime64) escritos.
+    """
+    _zarr()
+    ds = ds.sortby(time_dim)
+    if not append or not os.path.exists(store):
+        encoding = zarr_encoding(ds, profile, time_dim)
+        encoding[time_dim] = _time_encoding(ds[time_dim].values[0])
+        ds.to_zarr(store, mode="w", encoding=encoding, consolidated=True)
+        return list(ds[time_dim].values)
+
+    with xr.open_zarr(store) as actual:
+        tiempos = actual[time_dim].values
+    nuevos = ds.sel({time_dim: ~np.isin(ds[time_dim].values, tiempos)})
+    if nuevos.sizes[time_dim] == 0:
+        return []
+    if nuevos[time_dim].values[0] <= tiempos.max():
+        raise ValueError(f"{store}: append en Zarr sólo agrega pasos posteriores al último "
+                         f"({tiempos.max()}); use init_store/write_region para pasos intermedios")
+    nuevos.to_zarr(store, append_dim=time_dim, consolidated=True)
+    return list(nuevos[time_dim].values)
+
+def init_store(template, store, times, profile=None, time_dim="time"):
+    """
+    Crea el esqueleto de un producto Zarr con el eje de tiempo completo de la corrida:
+    coordenadas, atributos y arreglos vacíos (no se escriben chunks), listos para que
+    cada paso se escriba en su región con write_region, en paralelo y sin bloqueos.
+    ----------
+    Parámetros:
+    template : xr.Dataset   Producto de un paso (define variables, grilla y atributos).
+    store : str             Ruta del almacén (ej: '{model}_{fecha}{hor}_sfc.zarr').
+    times : list            Tiempos válidos de todos los pasos de la corrida.
+    profile : str | dict    Perfil de escritura (ver nc_encoding.PERFILES).
+    """
+    _zarr()
+    times = pd.DatetimeIndex(sorted(times))
+    variables = {}
+    for var, da in template.data_vars.items():
+        shape = tuple(len(times) if d == time_dim else da.sizes[d] for d in da.dims)
+        # vista de tamaño constante: no ocupa memoria y zarr omite los chunks vacíos
+        vacio = np.broadcast_to(np.array(np.nan, dtype=da.dtype), shape)
+        variables[var] = xr.Variable(da.dims, vacio, da.attrs)
+    coords = {c: v for c, v in template.coords.items() if time_dim not in v.dims}
+    coords[time_dim] = xr.Variable(time_dim, times.values, template[time_dim].attrs)
+    esqueleto = xr.Dataset(variables, coords=coords, attrs=template.attrs)
+
+    encoding = zarr_encoding(template, profile, time_dim)
+    encoding[time_dim] = _time_encoding(times[0])
+    esqueleto.to_zarr(store, mode="w", encoding=encoding, consolidated=False, write_empty_chunks=False)
+    return store
+
+def write_region(ds, store, time_dim="time"):
+    """
+    Escribe los pasos de `ds` en su región de tiempo de un almacén creado con init_store.
+    Cada llamada toca sólo sus propios chunks, así que varios procesos pueden escribir
+    pasos distintos del mismo producto a la vez.
+    """
+    with xr.open_zarr(store, consolidated=False) as actual:
+        tiempos = actual[time_dim].values
+        faltan = [v for v in ds.data_vars if v not in actual.data_vars]
+    if faltan:
+        raise ValueError(f"{store}: variables {faltan} no existen en el almacén")
+    # sólo variables que dependen del tiempo; coordenadas y eje de tiempo ya están escritos
+    datos = ds.drop_vars([v for v in ds.variables if time_dim not in ds[v].dims or v == time_dim])
+    for i, t in enumerate(ds[time_dim].values):
+        k = np.flatnonzero(tiempos == t)
+        if k.size == 0:
+            raise ValueError(f"{store}: el tiempo {t} no pertenece al eje de la corrida")
+        datos.isel({time_dim: [i]}).to_zarr(store, region={time_dim: slice(int(k[0]), int(k[0]) + 1)},
+                                            consolidated=False)
+
+def write_step(salida, stores):
+    """
+    Escribe un paso extraído (extrac_ETA/extrac_WRF con out_path=None) en las regiones de
+    los productos Zarr de la corrida. Se ejecuta en el proceso trabajador.
+    ----------
+    Parámetros:
+    salida : dict       {variable: xr.Dataset} de un paso.
+    stores : dict       {'prs': ruta.zarr, 'sfc': ruta.zarr} creados con init_store.
+    -------
+    Retorna:
+    dict        {'prs'|'sfc': tabla de estadísticos del paso} (ver field_stats.compute_stats).
+    """
+    from .pipeline import build_products
+    from .field_stats import compute_stats
+    from .derived import DERIVADAS, add_derived
+    tablas = {}
+    for var_in, variables in build_products([salida]).items():
+        ds = xr.merge(variables, join="outer", compat="override")
+        # las variables derivadas son las que el esqueleto (init_store) ya tiene
+        with xr.open_zarr(stores[var_in], consolidated=False) as actual:
+            add_derived(ds, [v for v in actual.data_vars if v in DERIVADAS])
+        write_region(ds, stores[var_in])
+        tablas[var_in] = compute_stats(ds)
+    return tablas
+
+def finalize_store(store):
+    """Consolida los metadatos del almacén (una sola lectura al abrirlo con xr.open_zarr)."""
+    _zarr().consolidate_metadata(store)
+    return store